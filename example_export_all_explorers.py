@@ -23,47 +23,26 @@ import shutil
 from ndspy.rom import NintendoDSRom
 
 from skytemple_dtef import get_template_file
-from skytemple_dtef.explorers_dtef import ExplorersDtef
+from skytemple_dtef.batch import export_dungeon_bin
 from skytemple_files.common.util import get_ppmdu_config_for_rom
-from skytemple_files.common.xml_util import prettify
 from skytemple_files.container.dungeon_bin.handler import DungeonBinHandler
-from skytemple_files.graphics.dma.protocol import DmaProtocol
-from skytemple_files.graphics.dpc.protocol import DpcProtocol
-from skytemple_files.graphics.dpci.protocol import DpciProtocol
-from skytemple_files.graphics.dpl.protocol import DplProtocol
-from skytemple_files.graphics.dpla.protocol import DplaProtocol
 
 output_dir_base = os.path.join(os.path.dirname(__file__), 'dbg_output')
 
-rom = NintendoDSRom.fromFile(sys.argv[1])
-
-dungeon_bin_bin = rom.getFileByName('DUNGEON/dungeon.bin')
-static_data = get_ppmdu_config_for_rom(rom)
-dungeon_bin = DungeonBinHandler.deserialize(dungeon_bin_bin, static_data)
-
-idx = 0
-for i, dma in enumerate(dungeon_bin):
-    fn = dungeon_bin.get_filename(i)
-    if fn.endswith('.dma'):
-        dpl: DplProtocol = dungeon_bin.get(fn.replace('.dma', '.dpl'))
-        dpla: DplaProtocol = dungeon_bin.get(fn.replace('.dma', '.dpla'))
-        dpci: DpciProtocol = dungeon_bin.get(fn.replace('.dma', '.dpci'))
-        dpc: DpcProtocol = dungeon_bin.get(fn.replace('.dma', '.dpc'))
-        print(fn)
-        dtef = ExplorersDtef(dma, dpc, dpci, dpl, dpla)
-
-        output_dir = os.path.join(output_dir_base, str(idx))
-        os.makedirs(os.path.join(output_dir), exist_ok=True)
-
-        # Write XML
-        with open(os.path.join(output_dir, 'tileset.dtef.xml'), 'w') as f:
-            f.write(prettify(dtef.get_xml()))
-        # Write Tiles
-        var0, var1, var2, rest = dtef.get_tiles()
-        var0fn, var1fn, var2fn, restfn = dtef.get_filenames()
-        var0.save(os.path.join(output_dir, var0fn))
-        var1.save(os.path.join(output_dir, var1fn))
-        var2.save(os.path.join(output_dir, var2fn))
-        rest.save(os.path.join(output_dir, restfn))
+if __name__ == '__main__':
+    rom = NintendoDSRom.fromFile(sys.argv[1])
+    # Optional second argument: Number of worker processes to use.
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    dungeon_bin_bin = rom.getFileByName('DUNGEON/dungeon.bin')
+    static_data = get_ppmdu_config_for_rom(rom)
+    dungeon_bin = DungeonBinHandler.deserialize(dungeon_bin_bin, static_data)
+
+    for result in export_dungeon_bin(dungeon_bin, max_workers):
+        if result.error is not None:
+            print(f"{result.name}: Export failed: {result.error}")
+            continue
+        print(result.name)
+        output_dir = os.path.join(output_dir_base, str(result.index))
+        result.write_to(output_dir)
         shutil.copy(get_template_file(), os.path.join(output_dir, 'template.png'))
-        idx += 1
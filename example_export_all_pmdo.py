@@ -28,6 +28,7 @@ from ndspy.rom import NintendoDSRom
 
 from skytemple_dtef.dungeon_xml import ANIMATION, ADDITIONAL_TILES
 from skytemple_dtef.explorers_dtef import ExplorersDtef
+from skytemple_dtef.png_encoder import encode_pngs
 from skytemple_dtef.transform import apply_extended_animations, xml_filter_tags
 from skytemple_files.common.types.file_types import FileType
 from skytemple_files.common.util import get_ppmdu_config_for_rom
@@ -519,7 +520,7 @@ for i, dma in enumerate(dungeon_bin):
         dpci: DpciProtocol = dungeon_bin.get(fn.replace('.dma', '.dpci'))
         dpc: DpcProtocol = dungeon_bin.get(fn.replace('.dma', '.dpc'))
         print(fn)
-        eos_dungeons.append(ExplorersDtef(dma, dpc, dpci, dpl, dpla))
+        eos_dungeons.append(ExplorersDtef(dma, dpc, dpci, dpl, dpla, lazy=True))
 
 print("Processing mapping and outputting...")
 data: Any = {}
@@ -558,15 +559,13 @@ for dungeon_id, dungeon_spec in data.items():
         pmdo.append(xsecondary)
     xml.append(pmdo)
 
-    file_list = list(apply_extended_animations(xml, *dtef.get_tiles()))
-    print(len(file_list))
-
     # Write XML
-    xml = xml_filter_tags(xml, [ANIMATION, ADDITIONAL_TILES, Comment])
     with open(os.path.join(output_dir, 'tileset.dtef.xml'), 'w') as f:
-        f.write(prettify(xml))
+        f.write(prettify(xml_filter_tags(xml, [ANIMATION, ADDITIONAL_TILES, Comment])))
 
     # Write Tiles
-    for file_name, file in file_list:
-        file.save(os.path.join(output_dir, file_name))
+    for file_name, png_data in encode_pngs(apply_extended_animations(xml, *dtef.get_tiles())):
+        with open(os.path.join(output_dir, file_name), 'wb') as f:
+            f.write(png_data)
+    dtef.release_tiles()
     idx += 1
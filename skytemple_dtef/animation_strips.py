@@ -0,0 +1,168 @@
+"""
+Packs the frames generated by transform.iter_extended_animation_frames into one PNG per animation layer ("strip"),
+instead of one file per frame. The frames of a layer are stacked vertically in its strip. The strips are described
+by an XML file (see ANIMATION_STRIPS_FN):
+
+    <AnimationStrips>
+        <Strip file="tileset_0_frame0.png" base="tileset_0.png" x="0" y="0" width="432" height="192">
+            <Frame duration="10"/>
+            ...
+        </Strip>
+    </AnimationStrips>
+
+x and y are the position of the frames on the base tilesheet.
+"""
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+from io import BytesIO
+from collections.abc import Iterable, Iterator
+from xml.etree import ElementTree
+from xml.etree.ElementTree import Element, SubElement
+
+from PIL import Image
+
+from skytemple_dtef.package import PackageReader, PackageWriter
+from skytemple_dtef.png_encoder import PngProfile, PROFILE_DEFAULT
+from skytemple_dtef.transform import AnimationFrame
+from skytemple_files.common.i18n_util import f, _
+
+ANIMATION_STRIPS_FN = 'tileset.animations.xml'
+ANIMATION_STRIPS = 'AnimationStrips'
+STRIP = 'Strip'
+STRIP__FILE = 'file'
+STRIP__BASE = 'base'
+STRIP__X = 'x'
+STRIP__Y = 'y'
+STRIP__WIDTH = 'width'
+STRIP__HEIGHT = 'height'
+STRIP_FRAME = 'Frame'
+STRIP_FRAME__DURATION = 'duration'
+
+
+class AnimationStrip:
+    """The frames of one animation layer. Frame i is at y = i * height in the strip image."""
+    def __init__(
+            self, fn: str, base_fn: str, group: int, x: int, y: int, width: int, height: int, durations: list[int]
+    ):
+        self.fn = fn
+        self.base_fn = base_fn
+        self.group = group
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.durations = durations
+
+    def get_element(self) -> Element:
+        strip = Element(STRIP, {
+            STRIP__FILE: self.fn, STRIP__BASE: self.base_fn,
+            STRIP__X: str(self.x), STRIP__Y: str(self.y),
+            STRIP__WIDTH: str(self.width), STRIP__HEIGHT: str(self.height)
+        })
+        for duration in self.durations:
+            SubElement(strip, STRIP_FRAME, {STRIP_FRAME__DURATION: str(duration)})
+        return strip
+
+    @classmethod
+    def from_element(cls, strip: Element) -> 'AnimationStrip':
+        base_fn = strip.attrib[STRIP__BASE]
+        fn = strip.attrib[STRIP__FILE]
+        prefix = base_fn[:-4] + '_frame'
+        if not fn.startswith(prefix) or not fn.endswith('.png') or not fn[len(prefix):-4].isdigit():
+            raise ValueError(f(_("Invalid animation strip file name: {fn}")))
+        return cls(
+            fn, base_fn, int(fn[len(prefix):-4]),
+            int(strip.attrib[STRIP__X]), int(strip.attrib[STRIP__Y]),
+            int(strip.attrib[STRIP__WIDTH]), int(strip.attrib[STRIP__HEIGHT]),
+            [int(frame.attrib[STRIP_FRAME__DURATION]) for frame in strip if frame.tag == STRIP_FRAME]
+        )
+
+    def split(self, img: Image.Image) -> Iterator[AnimationFrame]:
+        """Splits the decoded strip image into its frames."""
+        if img.size != (self.width, self.height * len(self.durations)):
+            raise ValueError(f(_("The animation strip {self.fn} has the wrong size.")))
+        for fi, duration in enumerate(self.durations):
+            yield AnimationFrame(
+                f'{self.base_fn[:-4]}_frame{self.group}_{fi}.{duration}.png',
+                img.crop((0, fi * self.height, self.width, (fi + 1) * self.height)),
+                self.base_fn, self.group, fi, duration, self.x, self.y
+            )
+
+
+def build_animation_strips(
+        frames: Iterable[AnimationFrame]
+) -> tuple[list[tuple[str, Image.Image]], Element]:
+    """
+    Packs the frames (as generated by transform.iter_extended_animation_frames) into strips.
+    Returns the images to write (the base images unchanged and one strip per layer) and the XML describing the strips,
+    to be stored as ANIMATION_STRIPS_FN.
+    """
+    images: list[tuple[str, Image.Image]] = []
+    xml = Element(ANIMATION_STRIPS)
+    layer: list[AnimationFrame] = []
+    for frame in frames:
+        if len(layer) > 0 and (frame.base_fn, frame.group) != (layer[0].base_fn, layer[0].group):
+            images.append(_add_strip(xml, layer))
+            layer = []
+        if frame.group is None:
+            images.append((frame.fn, frame.image))
+        else:
+            layer.append(frame)
+    if len(layer) > 0:
+        images.append(_add_strip(xml, layer))
+    return images, xml
+
+
+def write_animation_strips(
+        writer: PackageWriter, frames: Iterable[AnimationFrame],
+        profile: PngProfile = PROFILE_DEFAULT, max_workers: int | None = None
+):
+    """Packs the frames into strips and writes them and their XML into the package."""
+    images, xml = build_animation_strips(frames)
+    writer.write_images(images, profile, max_workers)
+    writer.write_xml(xml, ANIMATION_STRIPS_FN)
+
+
+def read_animation_strips(package: PackageReader) -> Iterator[AnimationFrame]:
+    """
+    Reads the frames of all strips of the package. Each strip is decoded once. The frames get the file names they
+    would have when exported as single files.
+    """
+    with package.open(ANIMATION_STRIPS_FN) as xml_file:
+        xml = ElementTree.parse(xml_file).getroot()
+    for node in xml:
+        if node.tag != STRIP:
+            continue
+        strip = AnimationStrip.from_element(node)
+        with Image.open(BytesIO(package.read(strip.fn))) as img:
+            img.load()
+            yield from strip.split(img)
+
+
+def _add_strip(xml: Element, layer: list[AnimationFrame]) -> tuple[str, Image.Image]:
+    first = layer[0]
+    assert first.group is not None
+    width, height = first.image.size
+    strip = AnimationStrip(
+        f'{first.base_fn[:-4]}_frame{first.group}.png', first.base_fn, first.group,
+        first.x, first.y, width, height, [frame.duration or 0 for frame in layer]
+    )
+    img = Image.new('RGBA', (width, height * len(layer)), (0, 0, 0, 0))
+    for fi, frame in enumerate(layer):
+        img.paste(frame.image, (0, fi * height))
+    xml.append(strip.get_element())
+    return strip.fn, img
@@ -0,0 +1,179 @@
+"""
+Exports many Explorers of Sky dungeon tilesets as DTEF in parallel, using a process pool.
+The workers receive the serialized tileset files and send back the finished DTEF package contents
+(XML and encoded PNGs), in the order they complete.
+"""
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import os
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from io import BytesIO
+from collections.abc import Iterable, Iterator
+
+from skytemple_dtef.explorers_dtef import ExplorersDtef
+from skytemple_dtef.package import XML_FN, PackageWriter, DirectoryPackageWriter
+from skytemple_dtef.png_encoder import PngProfile, PROFILE_DEFAULT, encode_png
+from skytemple_files.common.types.file_types import FileType
+from skytemple_files.container.dungeon_bin.model import DungeonBinPack
+from skytemple_files.graphics.dma.protocol import DmaProtocol
+from skytemple_files.graphics.dpc.protocol import DpcProtocol
+from skytemple_files.graphics.dpci.protocol import DpciProtocol
+from skytemple_files.graphics.dpl.protocol import DplProtocol
+from skytemple_files.graphics.dpla.protocol import DplaProtocol
+
+
+class TilesetSource:
+    """
+    The files of a single dungeon tileset, serialized with the regular file handlers
+    (FileType.DMA, FileType.DPC, FileType.DPCI, FileType.DPL and FileType.DPLA).
+    """
+    def __init__(self, index: int, name: str, dma: bytes, dpc: bytes, dpci: bytes, dpl: bytes, dpla: bytes):
+        self.index = index
+        self.name = name
+        self.dma = dma
+        self.dpc = dpc
+        self.dpci = dpci
+        self.dpl = dpl
+        self.dpla = dpla
+
+    @classmethod
+    def from_models(
+            cls, index: int, name: str,
+            dma: DmaProtocol, dpc: DpcProtocol, dpci: DpciProtocol, dpl: DplProtocol, dpla: DplaProtocol
+    ) -> 'TilesetSource':
+        return cls(
+            index, name,
+            FileType.DMA.serialize(dma),
+            FileType.DPC.serialize(dpc),
+            FileType.DPCI.serialize(dpci),
+            FileType.DPL.serialize(dpl),
+            FileType.DPLA.serialize(dpla)
+        )
+
+    def to_models(self) -> tuple[DmaProtocol, DpcProtocol, DpciProtocol, DplProtocol, DplaProtocol]:
+        return (
+            FileType.DMA.deserialize(self.dma),
+            FileType.DPC.deserialize(self.dpc),
+            FileType.DPCI.deserialize(self.dpci),
+            FileType.DPL.deserialize(self.dpl),
+            FileType.DPLA.deserialize(self.dpla)
+        )
+
+
+class TilesetExportResult:
+    """
+    The exported DTEF package of one tileset. If the export failed, error is set and xml and files are empty.
+    files maps the file names of the PNGs in the package to their encoded contents.
+    """
+    def __init__(self, index: int, name: str, xml: str | None, files: dict[str, bytes], error: BaseException | None):
+        self.index = index
+        self.name = name
+        self.xml = xml
+        self.files = files
+        self.error = error
+
+    def write_to(self, dirname: str):
+        """Writes the DTEF package into the given directory. Raises the export error, if there was one."""
+        self.write_package(DirectoryPackageWriter(dirname))
+
+    def write_package(self, writer: PackageWriter):
+        """Writes the DTEF package using the given package writer. Raises the export error, if there was one."""
+        if self.error is not None:
+            raise self.error
+        assert self.xml is not None
+        writer.write(XML_FN, self.xml.encode('utf-8'))
+        for fn, data in self.files.items():
+            writer.write(fn, data)
+
+
+def get_tileset_sources(dungeon_bin: DungeonBinPack) -> Iterator[TilesetSource]:
+    """Yields the sources of all tilesets in the dungeon.bin, in the order of their DMA files."""
+    idx = 0
+    for i in range(0, len(dungeon_bin)):
+        fn = dungeon_bin.get_filename(i)
+        if fn.endswith('.dma'):
+            base_fn = fn[:-4]
+            yield TilesetSource.from_models(
+                idx, base_fn,
+                dungeon_bin.get(fn),
+                dungeon_bin.get(base_fn + '.dpc'),
+                dungeon_bin.get(base_fn + '.dpci'),
+                dungeon_bin.get(base_fn + '.dpl'),
+                dungeon_bin.get(base_fn + '.dpla')
+            )
+            idx += 1
+
+
+def export_tilesets(
+        sources: Iterable[TilesetSource], max_workers: int | None = None, profile: PngProfile = PROFILE_DEFAULT
+) -> Iterator[TilesetExportResult]:
+    """
+    Exports all tilesets on a process pool with max_workers processes (defaults to the number of CPUs).
+    The PNGs are encoded with the given profile.
+    The results are yielded in the order the exports finish. If the export of a tileset fails, its result
+    contains the error, the other exports are not affected.
+    sources is consumed lazily: At most two tilesets per worker are exported or waiting to be consumed at once, to
+    limit the memory use.
+    When using a start method other than "fork" (Windows, macOS), this must be called from within an
+    `if __name__ == '__main__'` block.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    futures: dict[Future[TilesetExportResult], TilesetSource] = {}
+    with ProcessPoolExecutor(max_workers) as pool:
+        try:
+            for source in sources:
+                if len(futures) >= max_workers * 2:
+                    yield from _pop_finished(futures)
+                futures[pool.submit(export_tileset, source, profile)] = source
+            while len(futures) > 0:
+                yield from _pop_finished(futures)
+        finally:
+            # Don't keep working on the remaining tilesets if the caller stopped early.
+            for future in futures:
+                future.cancel()
+
+
+def _pop_finished(futures: dict[Future[TilesetExportResult], TilesetSource]) -> Iterator[TilesetExportResult]:
+    """Waits until at least one of the exports is finished, removes the finished ones and yields their results."""
+    for future in wait(futures, return_when=FIRST_COMPLETED).done:
+        source = futures.pop(future)
+        try:
+            yield future.result()
+        except Exception as ex:
+            # The worker died or the result could not be transferred.
+            yield TilesetExportResult(source.index, source.name, None, {}, ex)
+
+
+def export_dungeon_bin(
+        dungeon_bin: DungeonBinPack, max_workers: int | None = None, profile: PngProfile = PROFILE_DEFAULT
+) -> Iterator[TilesetExportResult]:
+    """Exports all tilesets in the dungeon.bin. See export_tilesets."""
+    return export_tilesets(get_tileset_sources(dungeon_bin), max_workers, profile)
+
+
+def export_tileset(source: TilesetSource, profile: PngProfile = PROFILE_DEFAULT) -> TilesetExportResult:
+    """Exports a single tileset. Errors are not raised, but returned in the result."""
+    try:
+        dtef = ExplorersDtef(*source.to_models())
+        # The tilesets are already exported in parallel, so the PNGs are encoded on the worker's thread.
+        files = {fn: encode_png(img, profile) for fn, img in zip(dtef.get_filenames(), dtef.get_tiles())}
+        xml = BytesIO()
+        dtef.write_xml(xml)
+        return TilesetExportResult(source.index, source.name, xml.getvalue().decode('utf-8'), files, None)
+    except Exception as ex:
+        return TilesetExportResult(source.index, source.name, None, {}, ex)
@@ -0,0 +1,183 @@
+"""
+An on-disk cache for exported DTEF packages. Entries are keyed by the contents of the five source files
+(DMA, DPC, DPCI, DPL, DPLA) and the source code of this library, so unchanged tilesets don't need to be exported
+again.
+"""
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import hashlib
+import os
+import tempfile
+import zipfile
+from functools import lru_cache
+from importlib.metadata import version, PackageNotFoundError
+from collections.abc import Iterable, Iterator
+
+from skytemple_dtef.batch import TilesetSource, TilesetExportResult, export_tilesets
+from skytemple_dtef.package import XML_FN
+from skytemple_dtef.png_encoder import PngProfile, PROFILE_DEFAULT
+
+# Increase this if the format of the cache entries changes.
+CACHE_FORMAT_VERSION = 1
+CACHE_ENTRY_EXT = '.dtefcache'
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def _get_code_version() -> str:
+    """
+    Identifies the code of the exporter by a hash of the source files of this package, so that the keys also change
+    when the exporter is changed in a source checkout or an editable install. If the sources are not available
+    (eg. in frozen applications), the installed version of the library is used instead.
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha256()
+    try:
+        file_names = sorted(fn for fn in os.listdir(package_dir) if fn.endswith('.py'))
+        for fn in file_names:
+            with open(os.path.join(package_dir, fn), 'rb') as f:
+                h.update(f'{fn}:{os.fstat(f.fileno()).st_size}:'.encode())
+                h.update(f.read())
+    except OSError:
+        file_names = []
+    if len(file_names) > 0:
+        return h.hexdigest()
+    try:
+        return version('skytemple-dtef')
+    except PackageNotFoundError:
+        return 'unknown'
+
+
+class ExportCache:
+    """
+    Stores exported DTEF packages in a directory, one file per tileset. When the total size of the entries exceeds
+    max_size bytes, the least recently used entries are removed.
+    The source code of the library is part of the key, so entries are not returned anymore after the exporter
+    changed.
+    The PNG profile is also part of the key, exports made with other profiles are not returned.
+    """
+    def __init__(self, directory: str, max_size: int = DEFAULT_MAX_SIZE, profile: PngProfile = PROFILE_DEFAULT):
+        self.directory = directory
+        self.max_size = max_size
+        self.profile = profile
+        self._version = (
+            f'{CACHE_FORMAT_VERSION}:{_get_code_version()}:'
+            f'{profile.compress_level}:{profile.optimize}'
+        ).encode()
+        os.makedirs(directory, exist_ok=True)
+
+    def key_for(self, source: TilesetSource) -> str:
+        h = hashlib.sha256(self._version)
+        for data in (source.dma, source.dpc, source.dpci, source.dpl, source.dpla):
+            # Include the lengths, so that moving bytes from one file to the next changes the key.
+            h.update(len(data).to_bytes(8, 'little'))
+            h.update(data)
+        return h.hexdigest()
+
+    def get(self, source: TilesetSource) -> TilesetExportResult | None:
+        """Returns the cached export for the source, or None if it is not cached."""
+        path = self._path(self.key_for(source))
+        try:
+            with zipfile.ZipFile(path) as zf:
+                xml = zf.read(XML_FN).decode('utf-8')
+                files = {fn: zf.read(fn) for fn in zf.namelist() if fn != XML_FN}
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return None
+        try:
+            # Mark as recently used.
+            os.utime(path)
+        except OSError:
+            pass
+        return TilesetExportResult(source.index, source.name, xml, files, None)
+
+    def put(self, source: TilesetSource, result: TilesetExportResult):
+        """Stores a successful export in the cache. Failed exports are not cached."""
+        if result.error is not None or result.xml is None:
+            return
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED) as zf:
+                zf.writestr(XML_FN, result.xml)
+                for fn, data in result.files.items():
+                    zf.writestr(fn, data)
+            os.replace(tmp_path, self._path(self.key_for(source)))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.evict()
+
+    def invalidate(self, source: TilesetSource | None = None):
+        """Removes the entry for the given source, or all entries if no source is given."""
+        if source is not None:
+            paths = [self._path(self.key_for(source))]
+        else:
+            paths = [path for path, _, _ in self._entries()]
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        """Removes the least recently used entries until the cache is not larger than max_size."""
+        entries = self._entries()
+        total_size = sum(size for _, size, _ in entries)
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def export_tilesets(
+            self, sources: Iterable[TilesetSource], max_workers: int | None = None
+    ) -> Iterator[TilesetExportResult]:
+        """
+        Like batch.export_tilesets, but cached tilesets are returned from the cache (first) and only
+        the others are exported (with the cache's PNG profile). New exports are added to the cache.
+        The indices of the sources must be unique.
+        """
+        misses = {}
+        for source in sources:
+            result = self.get(source)
+            if result is None:
+                misses[source.index] = source
+            else:
+                yield result
+        if len(misses) < 1:
+            return
+        for result in export_tilesets(misses.values(), max_workers, self.profile):
+            self.put(misses[result.index], result)
+            yield result
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_ENTRY_EXT)
+
+    def _entries(self) -> list[tuple[str, int, float]]:
+        """Returns path, size and last access time (mtime) of all entries."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(CACHE_ENTRY_EXT):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
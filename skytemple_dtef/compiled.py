@@ -0,0 +1,245 @@
+"""
+A compiled binary form of a tileset (".dtefc"), that can be loaded without parsing or converting anything. It is
+meant as a cache next to a DTEF package: The package stays the editable source, the compiled file is what is loaded
+at runtime.
+
+All numbers are little-endian. The file starts with a header and a table of sections:
+
+    magic (4 bytes, "DTFC"), version (u16), number of sections (u16)
+    for each section: offset (u32), size in bytes (u32)
+
+The sections, in this order and each starting at a multiple of 4 bytes, are:
+
+    MAPPINGS            u16 per DMA entry: The rule table (3 types x 256 rules x 3 variations, see DmaView), followed
+                        by the extra mappings.
+    CHUNK_PIXELS        The pixels of each chunk (24x24 bytes, palette indices), one chunk after the other.
+    PALETTE             The RGB colors for the palette indices of the chunk pixels.
+    TILEMAPS            u16 per tile mapping of the DPC, 9 per chunk.
+    TILES               The tiles of the DPCI, 32 bytes each.
+    PALETTES            The 16 RGB colors of each palette of the DPL, 48 bytes each.
+    ANIMATION_LENGTHS   u16 per animated color of the DPLA: The number of bytes of the color in ANIMATION_COLORS.
+    ANIMATION_COLORS    The RGB values of all frames of all animated colors.
+    ANIMATION_DURATIONS u16 per animated color: The duration of each frame of the color.
+
+The first three sections are everything needed to draw the tileset, the others contain the data of the
+DMA/DPC/DPCI/DPL/DPLA models (see ExplorersDtefImporter.import_compiled).
+"""
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from typing import IO
+
+from skytemple_dtef.dma_view import NORMAL_LEN, NUMBER_TYPES, NUMBER_RULES, NUMBER_VARIATIONS
+from skytemple_files.common.i18n_util import f, _
+from skytemple_files.graphics.dma.protocol import DmaProtocol
+from skytemple_files.graphics.dpc import DPC_TILING_DIM
+from skytemple_files.graphics.dpc.protocol import DpcProtocol
+from skytemple_files.graphics.dpci import DPCI_TILE_DIM
+from skytemple_files.graphics.dpci.protocol import DpciProtocol
+from skytemple_files.graphics.dpl.protocol import DplProtocol
+from skytemple_files.graphics.dpla.protocol import DplaProtocol
+
+COMPILED_FN = 'tileset.dtefc'
+MAGIC = b'DTFC'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')
+SECTION = struct.Struct('<II')
+CHUNK_DIM = DPC_TILING_DIM * DPCI_TILE_DIM
+CHUNK_SIZE = CHUNK_DIM * CHUNK_DIM
+TILEMAPS_PER_CHUNK = DPC_TILING_DIM * DPC_TILING_DIM
+# 4 bits per pixel
+TILE_SIZE = DPCI_TILE_DIM * DPCI_TILE_DIM // 2
+PALETTE_SIZE = 16 * 3
+
+SECTION_MAPPINGS = 0
+SECTION_CHUNK_PIXELS = 1
+SECTION_PALETTE = 2
+SECTION_TILEMAPS = 3
+SECTION_TILES = 4
+SECTION_PALETTES = 5
+SECTION_ANIMATION_LENGTHS = 6
+SECTION_ANIMATION_COLORS = 7
+SECTION_ANIMATION_DURATIONS = 8
+NUMBER_SECTIONS = 9
+
+
+class CompiledDtef:
+    """
+    A loaded compiled tileset. All data is returned as memoryviews into the file's buffer, nothing is copied.
+    When opened from a file, it is memory-mapped. The views must be released before calling close.
+    """
+    def __init__(self, buffer: bytes | bytearray | memoryview | mmap.mmap):
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+        self._sections: list[memoryview] = []
+        try:
+            self._read_sections()
+        except BaseException:
+            # Release the views, so that the buffer can be closed.
+            self._release_views()
+            raise
+
+    @classmethod
+    def open(cls, fn: str) -> 'CompiledDtef':
+        """Memory-maps the compiled tileset in the file fn."""
+        with open(fn, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(buffer)
+        except BaseException:
+            buffer.close()
+            raise
+
+    def close(self):
+        self._release_views()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def _read_sections(self):
+        if len(self._view) < HEADER.size:
+            raise ValueError(_("Invalid compiled tileset: The file is too short."))
+        magic, version, number_sections = HEADER.unpack_from(self._view)
+        if magic != MAGIC:
+            raise ValueError(_("Invalid compiled tileset: Unknown file format."))
+        if version != VERSION or number_sections != NUMBER_SECTIONS:
+            raise ValueError(f(_("Unsupported compiled tileset version: {version}.")))
+        for i in range(NUMBER_SECTIONS):
+            offset, size = SECTION.unpack_from(self._view, HEADER.size + i * SECTION.size)
+            if offset + size > len(self._view):
+                raise ValueError(_("Invalid compiled tileset: The file is truncated."))
+            self._sections.append(self._view[offset:offset + size])
+
+    def _release_views(self):
+        for section in self._sections:
+            section.release()
+        self._view.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def mappings(self) -> memoryview:
+        """All chunk mappings of the DMA, see DmaProtocol.chunk_mappings."""
+        return _u16(self._sections[SECTION_MAPPINGS])
+
+    @property
+    def rule_table(self) -> memoryview:
+        """The normal mappings of the DMA, as a (type, rule, variation) shaped view of chunk indices."""
+        return self.mappings[:NORMAL_LEN].cast('B').cast('H', (NUMBER_TYPES, NUMBER_RULES, NUMBER_VARIATIONS))
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self._sections[SECTION_CHUNK_PIXELS]) // CHUNK_SIZE
+
+    @property
+    def chunk_pixels(self) -> memoryview:
+        """The pixels of all chunks, in the format of DpcProtocol.chunks_to_pil with a width of one chunk."""
+        return self._sections[SECTION_CHUNK_PIXELS]
+
+    def get_chunk(self, chunk_idx: int) -> memoryview:
+        """The 24x24 pixels (palette indices) of a single chunk."""
+        if not 0 <= chunk_idx < self.chunk_count:
+            raise ValueError(f(_("Invalid chunk index {chunk_idx}.")))
+        return self.chunk_pixels[chunk_idx * CHUNK_SIZE:(chunk_idx + 1) * CHUNK_SIZE]
+
+    @property
+    def palette(self) -> memoryview:
+        """The RGB colors of the chunk pixels."""
+        return self._sections[SECTION_PALETTE]
+
+    @property
+    def tilemaps(self) -> memoryview:
+        """The tile mappings of the DPC, as integers (see TilemapEntryProtocol.to_int)."""
+        return _u16(self._sections[SECTION_TILEMAPS])
+
+    @property
+    def tiles(self) -> memoryview:
+        """The 4bpp tiles of the DPCI."""
+        return self._sections[SECTION_TILES]
+
+    @property
+    def palettes(self) -> memoryview:
+        """The palettes of the DPL, 16 RGB colors each."""
+        return self._sections[SECTION_PALETTES]
+
+    def get_animation_colors(self) -> list[memoryview]:
+        """The RGB values of all frames for each animated color, see DplaProtocol.colors."""
+        colors = []
+        start = 0
+        section = self._sections[SECTION_ANIMATION_COLORS]
+        for length in _u16(self._sections[SECTION_ANIMATION_LENGTHS]):
+            colors.append(section[start:start + length])
+            start += length
+        return colors
+
+    @property
+    def animation_durations(self) -> memoryview:
+        """The duration of the frames of each animated color, see DplaProtocol.durations_per_frame_for_colors."""
+        return _u16(self._sections[SECTION_ANIMATION_DURATIONS])
+
+
+def write_compiled(
+        file: IO[bytes], dma: DmaProtocol, dpc: DpcProtocol, dpci: DpciProtocol, dpl: DplProtocol, dpla: DplaProtocol
+):
+    """Writes the tileset in the models as a compiled tileset into the file."""
+    chunks = dpc.chunks_to_pil(dpci, dpl.palettes, 1)
+    sections = [
+        _u16_bytes(dma.chunk_mappings),
+        chunks.tobytes(),
+        bytes(chunks.getpalette() or []),
+        _u16_bytes([tilemap.to_int() for chunk in dpc.chunks for tilemap in chunk]),
+        b''.join(dpci.tiles),
+        b''.join(bytes(palette) for palette in dpl.palettes),
+        _u16_bytes([len(colors) for colors in dpla.colors]),
+        b''.join(bytes(colors) for colors in dpla.colors),
+        _u16_bytes(dpla.durations_per_frame_for_colors),
+    ]
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = bytearray(HEADER.pack(MAGIC, VERSION, len(sections)))
+    for section in sections:
+        offset += -offset % 4
+        table += SECTION.pack(offset, len(section))
+        offset += len(section)
+    file.write(table)
+    written = len(table)
+    for section in sections:
+        file.write(bytes(-written % 4))
+        written += -written % 4
+        file.write(section)
+        written += len(section)
+
+
+def _u16(section: memoryview) -> memoryview:
+    if sys.byteorder == 'little':
+        return section.cast('H')
+    values = array('H', section.tobytes())
+    values.byteswap()
+    return memoryview(values)
+
+
+def _u16_bytes(values: Sequence[int]) -> bytes:
+    data = array('H', values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
@@ -0,0 +1,108 @@
+"""
+Bulk access to the chunk mappings of a DMA file. Instead of reading and writing single entries via
+DmaProtocol.get / DmaProtocol.set, the mappings are copied into flat arrays once, which can then be read and
+written in whole columns (all 256 rules of one type and variation) using strided slices.
+"""
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+from array import array
+from collections.abc import Sequence, Iterable
+from operator import itemgetter
+
+from skytemple_dtef.rules import BASE_RULE_FOR_RULE
+from skytemple_files.graphics.dma.protocol import DmaProtocol
+
+NUMBER_TYPES = 3
+NUMBER_RULES = 256
+NUMBER_VARIATIONS = 3
+NUMBER_EXTRA_TYPES = 3
+# Number of mappings for each extra type in the DMA files of Explorers of Sky.
+NUMBER_EXTRA_INDICES = 16
+# Number of entries for the (type x rule x variation) mappings. All entries after that are the extra mappings.
+NORMAL_LEN = NUMBER_TYPES * NUMBER_RULES * NUMBER_VARIATIONS
+TYPE_STRIDE = NUMBER_RULES * NUMBER_VARIATIONS
+
+
+class DmaView:
+    """
+    A copy of the chunk mappings of a DMA file.
+    The normal region is stored in `normal`, indexed as [type][rule][variation] (see `as_3d`), the extra mappings
+    are stored in `extra`, indexed as [index][extra type].
+    Changes are only written back to a DMA model when calling `apply`.
+    """
+    def __init__(self, chunk_mappings: Sequence[int]):
+        self.normal = array('H', chunk_mappings[:NORMAL_LEN])
+        self.extra = array('H', chunk_mappings[NORMAL_LEN:])
+
+    @classmethod
+    def from_dma(cls, dma: DmaProtocol) -> 'DmaView':
+        return cls(dma.chunk_mappings)
+
+    @classmethod
+    def empty_like(cls, dma: DmaProtocol) -> 'DmaView':
+        """Returns a view with the same size as the mappings of the given DMA, with all entries set to 0."""
+        return cls([0] * len(dma.chunk_mappings))
+
+    def as_3d(self) -> memoryview:
+        """Returns the normal region as a (type, rule, variation) shaped memoryview (no copy)."""
+        return memoryview(self.normal).cast('B').cast('H', (NUMBER_TYPES, NUMBER_RULES, NUMBER_VARIATIONS))
+
+    def get(self, typ: int, rule: int) -> array:
+        """Returns the three variations for the given type and rule."""
+        idx = typ * TYPE_STRIDE + rule * NUMBER_VARIATIONS
+        return self.normal[idx:idx + NUMBER_VARIATIONS]
+
+    def get_column(self, typ: int, variation: int) -> array:
+        """Returns the chunks of the given variation for all 256 rules of the given type, indexed by rule."""
+        start = typ * TYPE_STRIDE + variation
+        return self.normal[start:start + TYPE_STRIDE:NUMBER_VARIATIONS]
+
+    def get_base_column(self, typ: int, variation: int) -> array:
+        """
+        Like get_column, but each rule is assigned the chunk of the base rule (see rules.BASE_RULE_FOR_RULE)
+        it is collapsed into.
+        """
+        return array('H', itemgetter(*BASE_RULE_FOR_RULE)(self.get_column(typ, variation)))
+
+    def get_mismatching_rules(self, typ: int, variation: int) -> set[int]:
+        """
+        Returns all rules of the given type, that have a different chunk assigned for the given variation than
+        the base rule they are collapsed into.
+        """
+        column = self.get_column(typ, variation)
+        base_column = self.get_base_column(typ, variation)
+        if column == base_column:
+            return set()
+        return {rule for rule, (chunk, base_chunk) in enumerate(zip(column, base_column)) if chunk != base_chunk}
+
+    def set(self, typ: int, rule: int, variation: int, value: int):
+        self.normal[typ * TYPE_STRIDE + rule * NUMBER_VARIATIONS + variation] = value
+
+    def set_column(self, typ: int, variation: int, values: Iterable[int]):
+        """Sets the chunks of the given variation for all 256 rules of the given type (indexed by rule)."""
+        start = typ * TYPE_STRIDE + variation
+        self.normal[start:start + TYPE_STRIDE:NUMBER_VARIATIONS] = array('H', values)
+
+    def set_extra(self, extra_type: int, index: int, value: int):
+        self.extra[extra_type + NUMBER_EXTRA_TYPES * index] = value
+
+    def to_list(self) -> list[int]:
+        return self.normal.tolist() + self.extra.tolist()
+
+    def apply(self, dma: DmaProtocol):
+        """Writes all mappings back into the DMA model in one assignment."""
+        dma.chunk_mappings = self.to_list()
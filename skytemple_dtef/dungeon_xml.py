@@ -14,9 +14,13 @@
 #
 #  You should have received a copy of the GNU General Public License
 #  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
-from typing import List, Union, Tuple, Literal
-from xml.etree.ElementTree import Element, Comment
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from typing import List, Union, Tuple, Literal, IO, overload
+from xml.etree import ElementTree
+from xml.etree.ElementTree import Element, Comment, SubElement
 
+from skytemple_dtef.xml_writer import PrettyXmlWriter
 from skytemple_files.graphics.dma.protocol import DmaType, DmaExtraType, DmaNeighbor
 from skytemple_files.graphics.dpla import DPLA_COLORS_PER_PALETTE
 from skytemple_files.graphics.dpla.protocol import DplaProtocol, chunk
@@ -51,7 +55,57 @@ SPECIAL_MAPPING = "SpecialMapping"
 SPECIAL_MAPPING__IDENTIFIER = "identifier"
 
 
+def iterparse_dungeon_xml(source: IO[bytes], free: bool = True) -> Iterator[tuple[str | None, Element]]:
+    """
+    Parses a dungeon tileset XML incrementally and yields its parts as (tag of the parent, element) as soon as they
+    are complete: First the root element (with its attributes but without children, the parent is None), then the
+    children of the root and the children of AdditionalTiles. The AdditionalTiles element itself is yielded after its
+    children.
+    If free is True, elements are removed from the tree after they were yielded, so that only the elements currently
+    being processed are kept in memory.
+    """
+    # The currently open elements.
+    stack: list[Element] = []
+    for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if len(stack) < 1:
+                yield None, elem
+            stack.append(elem)
+            continue
+        stack.pop()
+        if len(stack) == 1 or (len(stack) == 2 and stack[1].tag == ADDITIONAL_TILES):
+            yield stack[-1].tag, elem
+            if free:
+                # The element is the last child of its parent.
+                del stack[-1][-1]
+
+
+# The attributes of the neighbors of a Mapping and the flag for them.
+NEIGHBOR_ATTRIBS = (
+    (MAPPING__nw, DmaNeighbor.NORTH_WEST), (MAPPING__n, DmaNeighbor.NORTH), (MAPPING__ne, DmaNeighbor.NORTH_EAST),
+    (MAPPING__e, DmaNeighbor.EAST), (MAPPING__se, DmaNeighbor.SOUTH_EAST), (MAPPING__s, DmaNeighbor.SOUTH),
+    (MAPPING__sw, DmaNeighbor.SOUTH_WEST), (MAPPING__w, DmaNeighbor.WEST)
+)
+# neighbors -> the values of the neighbor attributes of a Mapping
+NEIGHBOR_ATTRIB_VALUES = [
+    {attrib: "1" if neighbors & flag == flag else "0" for attrib, flag in NEIGHBOR_ATTRIBS}
+    for neighbors in range(256)
+]
+ENTRY_TYPE_NAMES: tuple[Literal["normal"], Literal["extra"]] = ("normal", "extra")
+
+
+def parse_neighbors(mapping: Element) -> int:
+    """Returns the neighbors of a Mapping element, which must have all neighbor attributes."""
+    neighbors = 0
+    for attrib, flag in NEIGHBOR_ATTRIBS:
+        if bool(int(mapping.attrib[attrib])):
+            neighbors |= flag
+    return neighbors
+
+
 class RestTileMappingEntry:
+    __slots__ = ('dmatype_name', 'dmatype_idx', 'neighbors', 'variation_or_index')
+
     def __init__(self, dmatype_name: Literal["normal"] | Literal["extra"], dmatype_idx: int, neighbors: int, variation_or_index: int):
         self.dmatype_name = dmatype_name
         self.dmatype_idx = dmatype_idx
@@ -71,14 +125,7 @@ class RestTileMappingEntry:
             {
                 MAPPING__TYPE: self._get_mapping_type(),
                 MAPPING__VARIATION: str(self.variation_or_index),
-                MAPPING__nw: "1" if self.neighbors & DmaNeighbor.NORTH_WEST == DmaNeighbor.NORTH_WEST else "0",
-                MAPPING__n: "1" if self.neighbors & DmaNeighbor.NORTH == DmaNeighbor.NORTH else "0",
-                MAPPING__ne: "1" if self.neighbors & DmaNeighbor.NORTH_EAST == DmaNeighbor.NORTH_EAST else "0",
-                MAPPING__e: "1" if self.neighbors & DmaNeighbor.EAST == DmaNeighbor.EAST else "0",
-                MAPPING__se: "1" if self.neighbors & DmaNeighbor.SOUTH_EAST == DmaNeighbor.SOUTH_EAST else "0",
-                MAPPING__s: "1" if self.neighbors & DmaNeighbor.SOUTH == DmaNeighbor.SOUTH else "0",
-                MAPPING__sw: "1" if self.neighbors & DmaNeighbor.SOUTH_WEST == DmaNeighbor.SOUTH_WEST else "0",
-                MAPPING__w: "1" if self.neighbors & DmaNeighbor.WEST == DmaNeighbor.WEST else "0"
+                **NEIGHBOR_ATTRIB_VALUES[self.neighbors]
             }
         )
 
@@ -101,6 +148,8 @@ class RestTileMappingEntry:
 
 
 class RestTileMapping:
+    __slots__ = ('x', 'y', 'mappings', 'file_name')
+
     def __init__(self, x: int, y: int, mappings: list[RestTileMappingEntry], file_name: str):
         self.x = x
         self.y = y
@@ -108,53 +157,177 @@ class RestTileMapping:
         self.file_name = file_name
 
 
+class RestTileMappingTable(Sequence[RestTileMapping]):
+    """
+    The additional tile mappings of a tileset, packed into parallel arrays instead of one RestTileMapping and
+    RestTileMappingEntry object for each tile and mapping. Iterating over or indexing the table returns the tiles as
+    RestTileMapping objects, which are only created on demand, one tile at a time. Like the list of RestTileMapping
+    objects it replaces, the table supports indexing, slicing (returning a list), append and extend. The returned
+    objects are copies: Changing them does not change the table.
+    """
+    def __init__(self):
+        self.file_names: list[str] = []
+        # Per tile: Index of the file in file_names and position of the tile in the file
+        self.tile_file = array('B')
+        self.tile_x = array('H')
+        self.tile_y = array('H')
+        # Per tile: First and last of its mappings (-1 if there are none)
+        self.tile_first_mapping = array('l')
+        self.tile_last_mapping = array('l')
+        # Per mapping: The next mapping of the same tile (-1 for the last one)
+        self.mapping_next = array('l')
+        # Per mapping: Index of the tile, index of the name in ENTRY_TYPE_NAMES and the fields of RestTileMappingEntry
+        self.mapping_tile = array('H')
+        self.mapping_dmatype_name = array('B')
+        self.mapping_dmatype_idx = array('B')
+        self.mapping_neighbors = array('B')
+        self.mapping_variation_or_index = array('B')
+
+    def add_tile(self, file_name: str, x: int, y: int) -> int:
+        """Adds a tile without mappings and returns its index."""
+        if file_name not in self.file_names:
+            self.file_names.append(file_name)
+        self.tile_file.append(self.file_names.index(file_name))
+        self.tile_x.append(x)
+        self.tile_y.append(y)
+        self.tile_first_mapping.append(-1)
+        self.tile_last_mapping.append(-1)
+        return len(self.tile_file) - 1
+
+    def add_mapping(
+            self, tile: int, dmatype_name: Literal["normal"] | Literal["extra"], dmatype_idx: int, neighbors: int,
+            variation_or_index: int
+    ):
+        """Adds a mapping to the tile with the given index. See RestTileMappingEntry for the parameters."""
+        mapping = len(self.mapping_tile)
+        if self.tile_last_mapping[tile] == -1:
+            self.tile_first_mapping[tile] = mapping
+        else:
+            self.mapping_next[self.tile_last_mapping[tile]] = mapping
+        self.tile_last_mapping[tile] = mapping
+        self.mapping_next.append(-1)
+        self.mapping_tile.append(tile)
+        self.mapping_dmatype_name.append(ENTRY_TYPE_NAMES.index(dmatype_name))
+        self.mapping_dmatype_idx.append(dmatype_idx)
+        self.mapping_neighbors.append(neighbors)
+        self.mapping_variation_or_index.append(variation_or_index)
+
+    def append(self, tile: RestTileMapping):
+        """Adds a tile with all of its mappings."""
+        tile_idx = self.add_tile(tile.file_name, tile.x, tile.y)
+        for entry in tile.mappings:
+            self.add_mapping(tile_idx, entry.dmatype_name, entry.dmatype_idx, entry.neighbors, entry.variation_or_index)
+
+    def extend(self, tiles: Iterable[RestTileMapping]):
+        for tile in tiles:
+            self.append(tile)
+
+    def __len__(self):
+        return len(self.tile_file)
+
+    @overload
+    def __getitem__(self, index: int) -> RestTileMapping: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[RestTileMapping]: ...
+
+    def __getitem__(self, index: int | slice) -> RestTileMapping | list[RestTileMapping]:
+        if isinstance(index, slice):
+            return [self._get_tile(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("RestTileMappingTable index out of range")
+        return self._get_tile(index)
+
+    def __iter__(self) -> Iterator[RestTileMapping]:
+        for i in range(len(self)):
+            yield self._get_tile(i)
+
+    def _get_tile(self, i: int) -> RestTileMapping:
+        # Follow the mappings of the tile, in the order they were added.
+        mappings = []
+        mapping = self.tile_first_mapping[i]
+        while mapping != -1:
+            mappings.append(RestTileMappingEntry(
+                ENTRY_TYPE_NAMES[self.mapping_dmatype_name[mapping]], self.mapping_dmatype_idx[mapping],
+                self.mapping_neighbors[mapping], self.mapping_variation_or_index[mapping]
+            ))
+            mapping = self.mapping_next[mapping]
+        return RestTileMapping(self.tile_x[i], self.tile_y[i], mappings, self.file_names[self.tile_file[i]])
+
+
 class DungeonXml:
     @classmethod
-    def generate(cls, dpla: DplaProtocol, dungeon_tile_dimensions: int, rest_tile_mappings: list[RestTileMapping]) -> Element:
+    def generate(cls, dpla: DplaProtocol, dungeon_tile_dimensions: int, rest_tile_mappings: Iterable[RestTileMapping]) -> Element:
         dungeon_tileset = Element(DUNGEON_TILESET, {DIMENSIONS: str(dungeon_tile_dimensions)})
-        dungeon_tileset.append(Comment(" Dungeon Tile Exchange Format (DTEF) - SkyTemple PMD Explorers of Sky Export.\n"
-                                       "       This XML file contains additional metadata for the tileset.\n"
-                                       "       The main tiles can be found in tileset_0.png, variations if it "
-                                       "(if they exist) in tileset_1.png and tileset_2.png.\n       "
-                                       "This XML file may define additional tile mappings, see below.\n       "
-                                       "For more information, see the documentation at "
-                                       "https://github.com/SkyTemple/skytemple-dtef/blob/main/docs/SkyTemple.rst "))
-        dungeon_tileset.append(Comment(" Palette Animations.\n       "
-                                       "The palettes 10 and 11 can be animated. How long a color will be held "
-                                       "is controlled by the 'duration' attribute for the colors in the first frame.\n       "
-                                       "Each 'Frame' is a list of the 16 colors for this frame as HTML-style color "
-                                       "codes. "))
-        dungeon_tileset.append(cls._insert_palette_anim(dpla, 0))
-        dungeon_tileset.append(cls._insert_palette_anim(dpla, 1))
-        dungeon_tileset.append(Comment(" Additional Tile Mappings.\n       "
-                                       "The tileset_X.png files define the main 47 rules for dungeon tiles. In theory "
-                                       "there can be way more however.\n       "
-                                       "This is due to the way the rules work, there can actually be 256 "
-                                       "different rules. Those 256 combinations are usually collapsed into the 47 rules."
-                                       "\n       If however a tile rule that is not on the tileset PNGs was assigned "
-                                       "a different tile, it is defined here.\n       \n       "
-                                       "Each entry here defines a tile, which file it is from and at which coordinate"
-                                       " it can be found in that file.\n       "
-                                       "For the additional rule mappings, the following syntax is used:"
-                                       '\n              <Mapping type="wall" variation="0" nw="0" n="1" ne="1" e="0" se="1" s="0" sw="1" w="1"/>'
-                                       '\n       "type" can be "wall"/"floor"/"secondary" and variation a number from '
-                                       '0-2. The rest define the rule as adjacencies (cardinal directions).'
-                                       '\n       \n       '
-                                       'In addition to these 256 rules, special additional mappings can be added.\n'
-                                       '       Explorers of Sky has some special rules like these, which are listed '
-                                       'here as well.\n       '
-                                       'The following syntax is used for those:'
-                                       '\n              <SpecialMapping identifier="EOS_EXTRA_WALL_OR_VOID_1"/>'
-                                       '\n       (The purpose of these is unknown.) '))
-        rest = Element(ADDITIONAL_TILES)
-        for r in rest_tile_mappings:
-            tile = Element(TILE, {TILE__FILE: r.file_name, TILE__X: str(r.x), TILE__Y: str(r.y)})
-            for mapping in r.mappings:
-                tile.append(mapping.get_element())
-            rest.append(tile)
-        dungeon_tileset.append(rest)
+        dungeon_tileset.extend(cls._generate_header(dpla))
+        rest = SubElement(dungeon_tileset, ADDITIONAL_TILES)
+        rest.extend(cls._generate_tile(r) for r in rest_tile_mappings)
         return dungeon_tileset
 
+    @classmethod
+    def write(
+            cls, file: IO[bytes], dpla: DplaProtocol, dungeon_tile_dimensions: int,
+            rest_tile_mappings: Iterable[RestTileMapping]
+    ):
+        """
+        Writes the same XML as generate (formatted like prettify) into the file. The additional tiles are written
+        one by one, without building the whole document in memory.
+        """
+        with PrettyXmlWriter(file) as writer:
+            writer.start(DUNGEON_TILESET, {DIMENSIONS: str(dungeon_tile_dimensions)})
+            for node in cls._generate_header(dpla):
+                writer.element(node)
+            writer.start(ADDITIONAL_TILES)
+            for r in rest_tile_mappings:
+                writer.element(cls._generate_tile(r))
+
+    @classmethod
+    def _generate_header(cls, dpla: DplaProtocol):
+        """Everything before the additional tiles."""
+        yield Comment(" Dungeon Tile Exchange Format (DTEF) - SkyTemple PMD Explorers of Sky Export.\n"
+                      "       This XML file contains additional metadata for the tileset.\n"
+                      "       The main tiles can be found in tileset_0.png, variations if it "
+                      "(if they exist) in tileset_1.png and tileset_2.png.\n       "
+                      "This XML file may define additional tile mappings, see below.\n       "
+                      "For more information, see the documentation at "
+                      "https://github.com/SkyTemple/skytemple-dtef/blob/main/docs/SkyTemple.rst ")
+        yield Comment(" Palette Animations.\n       "
+                      "The palettes 10 and 11 can be animated. How long a color will be held "
+                      "is controlled by the 'duration' attribute for the colors in the first frame.\n       "
+                      "Each 'Frame' is a list of the 16 colors for this frame as HTML-style color "
+                      "codes. ")
+        yield cls._insert_palette_anim(dpla, 0)
+        yield cls._insert_palette_anim(dpla, 1)
+        yield Comment(" Additional Tile Mappings.\n       "
+                      "The tileset_X.png files define the main 47 rules for dungeon tiles. In theory "
+                      "there can be way more however.\n       "
+                      "This is due to the way the rules work, there can actually be 256 "
+                      "different rules. Those 256 combinations are usually collapsed into the 47 rules."
+                      "\n       If however a tile rule that is not on the tileset PNGs was assigned "
+                      "a different tile, it is defined here.\n       \n       "
+                      "Each entry here defines a tile, which file it is from and at which coordinate"
+                      " it can be found in that file.\n       "
+                      "For the additional rule mappings, the following syntax is used:"
+                      '\n              <Mapping type="wall" variation="0" nw="0" n="1" ne="1" e="0" se="1" s="0" sw="1" w="1"/>'
+                      '\n       "type" can be "wall"/"floor"/"secondary" and variation a number from '
+                      '0-2. The rest define the rule as adjacencies (cardinal directions).'
+                      '\n       \n       '
+                      'In addition to these 256 rules, special additional mappings can be added.\n'
+                      '       Explorers of Sky has some special rules like these, which are listed '
+                      'here as well.\n       '
+                      'The following syntax is used for those:'
+                      '\n              <SpecialMapping identifier="EOS_EXTRA_WALL_OR_VOID_1"/>'
+                      '\n       (The purpose of these is unknown.) ')
+
+    @staticmethod
+    def _generate_tile(r: RestTileMapping) -> Element:
+        tile = Element(TILE, {TILE__FILE: r.file_name, TILE__X: str(r.x), TILE__Y: str(r.y)})
+        for mapping in r.mappings:
+            tile.append(mapping.get_element())
+        return tile
+
     @classmethod
     def _insert_palette_anim(cls, dpla: DplaProtocol, idx):
         animation = Element(ANIMATION, {
@@ -16,13 +16,18 @@
 #  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
 
 from math import floor, ceil
-from typing import List, Dict
+from typing import List, Dict, IO, Literal
+from collections.abc import Sequence
 from xml.etree import ElementTree
 
 from PIL import Image
 
-from skytemple_dtef.dungeon_xml import DungeonXml, RestTileMapping, RestTileMappingEntry
-from skytemple_dtef.rules import get_rule_variations, REMAP_RULES
+from skytemple_dtef.compiled import write_compiled
+from skytemple_dtef.dma_view import DmaView, NUMBER_VARIATIONS, NUMBER_EXTRA_TYPES, TYPE_STRIDE
+from skytemple_dtef.dungeon_xml import DungeonXml, RestTileMappingTable
+from skytemple_dtef.package import PackageWriter, XML_FN
+from skytemple_dtef.png_encoder import PngProfile, PROFILE_DEFAULT
+from skytemple_dtef.rules import RULE_VARIATIONS
 from skytemple_files.graphics.dma.protocol import DmaProtocol, DmaType
 from skytemple_files.graphics.dpc import DPC_TILING_DIM
 from skytemple_files.graphics.dpc.protocol import DpcProtocol
@@ -39,134 +44,211 @@ VAR0_FN = 'tileset_0.png'
 VAR1_FN = 'tileset_1.png'
 VAR2_FN = 'tileset_2.png'
 MORE_FN = 'tileset_more.png'
+FILENAMES = (VAR0_FN, VAR1_FN, VAR2_FN, MORE_FN)
 
 
 class ExplorersDtef:
-    def __init__(self, dma: DmaProtocol, dpc: DpcProtocol, dpci: DpciProtocol, dpl: DplProtocol, dpla: DplaProtocol):
+    def __init__(
+            self, dma: DmaProtocol, dpc: DpcProtocol, dpci: DpciProtocol, dpl: DplProtocol, dpla: DplaProtocol,
+            lazy: bool = False
+    ):
+        """
+        Analyzes the mappings of the DMA. If lazy is False, the tilesheet images are also rendered right away,
+        otherwise they are only rendered once they are first requested (via get_tiles or the var0, var1, var2 and
+        rest attributes). The XML and chunk index can always be queried without rendering the images.
+        """
         self.dma = dma
         self.dpc = dpc
         self.dpci = dpci
         self.dpl = dpl
         self.dpla = dpla
 
-        chunks = self.dpc.chunks_to_pil(self.dpci, self.dpl.palettes, 1)
-        self.var0 = Image.new('P', (TILESHEET_WIDTH * 3 * TW, TILESHEET_HEIGHT * TW))
-        self.var1 = Image.new('P', (TILESHEET_WIDTH * 3 * TW, TILESHEET_HEIGHT * TW))
-        self.var2 = Image.new('P', (TILESHEET_WIDTH * 3 * TW, TILESHEET_HEIGHT * TW))
-        pal = chunks.getpalette()
-        self.var0.putpalette(pal)  # type: ignore
-        self.var1.putpalette(pal)  # type: ignore
-        self.var2.putpalette(pal)  # type: ignore
-
-        def paste(fimg, chunk_index, x, y):
-            fimg.paste(
-                chunks.crop((0, chunk_index * TW, TW, chunk_index * TW + TW)),
-                (x * TW, y * TW)
-            )
-
-        # Process tiles
-        self._variation_map: list[list[int]] = [[], [], []]
-        self._coord_map = {}
-        # Pre-fill variation maps
-        for ti, the_type in enumerate((DmaType.WALL, DmaType.WATER, DmaType.FLOOR)):
-            for i, base_rule in enumerate(get_rule_variations(REMAP_RULES).keys()):
-                if base_rule is None:
-                    continue
-                x = i % TILESHEET_WIDTH + (TILESHEET_WIDTH * ti)
-                y = floor(i / TILESHEET_WIDTH)
-                variations = self.dma.get(the_type, base_rule)
-                already_printed = set()
-                for img, iv in zip((self.var0, self.var1, self.var2), range(len(variations))):
-                    variation = variations[iv]
-                    if variation in already_printed:
-                        continue
-                    already_printed.add(variation)
-                    self._coord_map[variation] = (x, y)
-                    self._variation_map[iv].append(variation)
+        view = DmaView.from_dma(self.dma)
+        # Tiles to draw on the tilesheets: (index of the file in FILENAMES, chunk, x, y)
+        self._tiles_to_draw: list[tuple[int, int, int, int]] = []
+        self._tiles: list[Image.Image] | None = None
+
+        # Inverted index of the chunks.
+        # chunk -> (index of the file in FILENAMES, x, y) of the tile that is used for it in the DTEF.
+        self._chunk_placements: dict[int, tuple[int, int, int]] = {}
+        # chunk -> all (type, rule, variation) that use it.
+        self._chunk_usages: dict[int, list[tuple[int, int, int]]] = {}
+        # chunk -> all (extra type, index) that use it.
+        self._chunk_extra_usages: dict[int, list[tuple[int, int]]] = {}
+        for i, chunk_idx in enumerate(view.normal):
+            the_type, rest = divmod(i, TYPE_STRIDE)
+            rule, iv = divmod(rest, NUMBER_VARIATIONS)
+            self._chunk_usages.setdefault(chunk_idx, []).append((the_type, rule, iv))
+        for i, chunk_idx in enumerate(view.extra):
+            self._chunk_extra_usages.setdefault(chunk_idx, []).append((i % NUMBER_EXTRA_TYPES, i // NUMBER_EXTRA_TYPES))
 
         # Non standard tiles
-        self.rest_mappings: list[RestTileMapping] = []
+        self.rest_mappings = RestTileMappingTable()
         self._tiles_to_draw_on_more: list[int] = []
-        self._rest_mappings_idxes: dict[int, int] = {}  # dpc -> rest_mappings index
+        self._rest_mappings_idxes: dict[int, int] = {}  # dpc -> tile index in rest_mappings
 
         # Process all normal rule tiles (47-set and check 256-set extended)
+        derived_rule_mismatches: list[tuple[int, int, int, int]] = []  # type, rule, variation, chunk
         for ti, the_type in enumerate((DmaType.WALL, DmaType.WATER, DmaType.FLOOR)):
-            for i, (base_rule, derived_rules) in enumerate(get_rule_variations(REMAP_RULES).items()):
+            columns = [view.get_column(the_type, iv) for iv in range(NUMBER_VARIATIONS)]
+            mismatches = [view.get_mismatching_rules(the_type, iv) for iv in range(NUMBER_VARIATIONS)]
+            has_mismatches = any(mismatches)
+            for i, (base_rule, derived_rules) in enumerate(RULE_VARIATIONS.items()):
                 if base_rule is None:
                     continue
                 x = i % TILESHEET_WIDTH + (TILESHEET_WIDTH * ti)
                 y = floor(i / TILESHEET_WIDTH)
-                variations = self.dma.get(the_type, base_rule)
-                already_printed = set()
-                for img, iv in zip((self.var0, self.var1, self.var2), range(len(variations))):
-                    variation = variations[iv]
-                    if variation in already_printed:
+                variations = view.get(the_type, base_rule)
+                for iv, variation in enumerate(variations):
+                    if iv > 0 and variation == variations[iv - 1]:
+                        # Empty tiles in the variation tilesheets use the previous variation on import.
                         continue
-                    already_printed.add(variation)
-                    paste(img, variation, x, y)
+                    self._tiles_to_draw.append((iv, variation, x, y))
+                    if variation not in self._chunk_placements or self._chunk_placements[variation][0] > iv:
+                        self._chunk_placements[variation] = (iv, x, y)
+                if not has_mismatches:
+                    continue
                 for other_rule in derived_rules:
-                    if other_rule == base_rule:
-                        continue
-                    r_variations = self.dma.get(the_type, other_rule)
-                    for index, (r_var, var) in enumerate(zip(r_variations, variations)):
-                        if r_var != var:
-                            # Process non-standard mappings
-                            self._add_extra_mapping(other_rule, r_var, index)
+                    for iv in range(NUMBER_VARIATIONS):
+                        if other_rule in mismatches[iv]:
+                            derived_rule_mismatches.append((the_type, other_rule, iv, columns[iv][other_rule]))
+
+        # Process non-standard mappings, now that we know where all chunks on the tilesheets are
+        for the_type, rule, iv, chunk_idx in derived_rule_mismatches:
+            self._add_extra_mapping(chunk_idx, "normal", the_type, rule, iv)
 
         # Process all extra tiles
-        for i, m in enumerate(self.dma.chunk_mappings[0x300 * 3:]):
-            self._add_extra_mapping(0x300 * 3 + i, m, None)
-
-        more_width = TILESHEET_WIDTH * 3 * TW
-        more_height = max(TW, ceil(len(self._tiles_to_draw_on_more) / more_width) * TW)
-        self.rest = Image.new('P', (more_width, more_height))
-        for i, tile_more in enumerate(self._tiles_to_draw_on_more):
-            x = i % (TILESHEET_WIDTH * 3)
-            y = floor(i / (TILESHEET_WIDTH * 3))
-            paste(self.rest, tile_more, x, y)
-        self.rest.putpalette(pal)  # type: ignore
+        for i, chunk_idx in enumerate(view.extra):
+            self._add_extra_mapping(chunk_idx, "extra", i % NUMBER_EXTRA_TYPES, 0, i // NUMBER_EXTRA_TYPES)
+
+        if not lazy:
+            self.get_tiles()
 
     def get_xml(self) -> ElementTree.Element:
         return DungeonXml.generate(self.dpla, TW, self.rest_mappings)
 
+    def write_xml(self, file: IO[bytes]):
+        """Writes the XML (formatted like prettify(get_xml())) into the file, without building it in memory."""
+        DungeonXml.write(file, self.dpla, TW, self.rest_mappings)
+
+    def write_compiled(self, file: IO[bytes]):
+        """
+        Writes the tileset as a compiled tileset (see the compiled module, usually stored as COMPILED_FN next to
+        the package), which can be loaded without decoding the package.
+        """
+        write_compiled(file, self.dma, self.dpc, self.dpci, self.dpl, self.dpla)
+
     def get_tiles(self) -> list[Image.Image]:
-        return [self.var0, self.var1, self.var2, self.rest]
+        """Returns the tilesheet images (in the order of get_filenames), rendering them if needed."""
+        if self._tiles is None:
+            self._tiles = self._render_tiles()
+        return self._tiles
+
+    def write_package(
+            self, writer: PackageWriter, profile: PngProfile = PROFILE_DEFAULT, max_workers: int | None = None
+    ):
+        """
+        Writes the XML and the tilesheets into a DTEF package. The tilesheets are encoded on up to
+        max_workers threads.
+        """
+        with writer.open(XML_FN) as xml_file:
+            self.write_xml(xml_file)
+        writer.write_images(zip(self.get_filenames(), self.get_tiles()), profile, max_workers)
+
+    def release_tiles(self):
+        """
+        Frees the rendered tilesheet images. They are rendered again, if they are requested afterwards.
+        """
+        self._tiles = None
+
+    @property
+    def var0(self) -> Image.Image:
+        return self.get_tiles()[0]
+
+    @property
+    def var1(self) -> Image.Image:
+        return self.get_tiles()[1]
+
+    @property
+    def var2(self) -> Image.Image:
+        return self.get_tiles()[2]
+
+    @property
+    def rest(self) -> Image.Image:
+        return self.get_tiles()[3]
 
     @staticmethod
     def get_filenames():
-        return [VAR0_FN, VAR1_FN, VAR2_FN, MORE_FN]
-
-    def _add_extra_mapping(self, i, m, variation):
-        if m in self._variation_map[0]:
-            fn = VAR0_FN
-            x, y = self._coord_map[m]
-        elif m in self._variation_map[1]:
-            fn = VAR1_FN
-            x, y = self._coord_map[m]
-        elif m in self._variation_map[2]:
-            fn = VAR2_FN
-            x, y = self._coord_map[m]
-        else:
-            fn = MORE_FN
-            oi = len(self._tiles_to_draw_on_more)
-            x = oi % (TILESHEET_WIDTH * 3)
-            y = floor(oi / (TILESHEET_WIDTH * 3))
-        if m not in self._rest_mappings_idxes:
-            if fn == MORE_FN:
-                self._tiles_to_draw_on_more.append(m)
-            self.rest_mappings.append(RestTileMapping(x, y, [], fn))
-            self._rest_mappings_idxes[m] = len(self.rest_mappings) - 1
-        mappings = self.rest_mappings[self._rest_mappings_idxes[m]].mappings
-        if i < 0x300 * 3:
-            # Normal
-            dma_type = DmaType.WALL
-            if i >= 0x200:
-                dma_type = DmaType.FLOOR
-            elif i >= 0x100:
-                dma_type = DmaType.WATER
-            mappings.append(RestTileMappingEntry("normal", dma_type, i, variation))
-        else:
-            # Special
-            typ = i % 3
-            i_real = int(i / 3) - 0x300
-            mappings.append(RestTileMappingEntry("extra", typ, 0, i_real))
+        return list(FILENAMES)
+
+    def get_chunk_placement(self, chunk_idx: int) -> tuple[str, int, int] | None:
+        """
+        Returns the file name and the tile coordinates of the tile in the DTEF tilesheets that contains the given
+        chunk. Returns None, if the chunk is not used by the DMA.
+        """
+        if chunk_idx not in self._chunk_placements:
+            return None
+        file_idx, x, y = self._chunk_placements[chunk_idx]
+        return FILENAMES[file_idx], x, y
+
+    def get_chunk_usages(self, chunk_idx: int) -> Sequence[tuple[int, int, int]]:
+        """Returns all (DmaType, rule, variation) mappings of the DMA that use the given chunk."""
+        return self._chunk_usages.get(chunk_idx, ())
+
+    def get_chunk_extra_usages(self, chunk_idx: int) -> Sequence[tuple[int, int]]:
+        """Returns all (DmaExtraType, index) extra mappings of the DMA that use the given chunk."""
+        return self._chunk_extra_usages.get(chunk_idx, ())
+
+    def _render_tiles(self) -> list[Image.Image]:
+        # The chunks are rendered into an image that is one chunk wide, so the pixels of each chunk are one
+        # contiguous block in its data.
+        chunks = self.dpc.chunks_to_pil(self.dpci, self.dpl.palettes, 1)
+        pal = chunks.getpalette()
+        atlas = memoryview(chunks.tobytes())
+        chunk_size = TW * TW
+        empty = bytes(chunk_size)
+        # Chunks that the DMA maps to but that are not in the DPC are drawn empty.
+        number_chunks = len(atlas) // chunk_size
+        width = TILESHEET_WIDTH * 3
+        more_height = max(1, ceil(len(self._tiles_to_draw_on_more) / width))
+        heights = (TILESHEET_HEIGHT, TILESHEET_HEIGHT, TILESHEET_HEIGHT, more_height)
+
+        # The chunk of each tile of the tilesheets, column by column.
+        slots: list[list[int | None]] = [[None] * (width * height) for height in heights]
+        for file_idx, chunk_index, x, y in self._tiles_to_draw:
+            slots[file_idx][x * heights[file_idx] + y] = chunk_index
+
+        tiles = []
+        for file_slots, height in zip(slots, heights):
+            # Gather the chunks into a strip of all columns below each other, then place the columns.
+            strip = Image.frombytes('P', (TW, len(file_slots) * TW), b''.join(
+                empty if chunk_index is None or chunk_index >= number_chunks
+                else atlas[chunk_index * chunk_size:(chunk_index + 1) * chunk_size]
+                for chunk_index in file_slots
+            ))
+            img = Image.new('P', (width * TW, height * TW))
+            for x in range(width):
+                img.paste(strip.crop((0, x * height * TW, TW, (x + 1) * height * TW)), (x * TW, 0))
+            img.putpalette(pal)  # type: ignore
+            tiles.append(img)
+        return tiles
+
+    def _add_extra_mapping(
+            self, chunk_idx: int, dmatype_name: Literal["normal"] | Literal["extra"], dmatype_idx: int, neighbors: int,
+            variation_or_index: int
+    ):
+        if chunk_idx not in self._rest_mappings_idxes:
+            if chunk_idx not in self._chunk_placements:
+                # Not on the tilesheets, draw it on the tilesheet for additional tiles
+                oi = len(self._tiles_to_draw_on_more)
+                more_idx = FILENAMES.index(MORE_FN)
+                x = oi % (TILESHEET_WIDTH * 3)
+                y = floor(oi / (TILESHEET_WIDTH * 3))
+                self._tiles_to_draw_on_more.append(chunk_idx)
+                self._tiles_to_draw.append((more_idx, chunk_idx, x, y))
+                self._chunk_placements[chunk_idx] = (more_idx, x, y)
+            file_idx, x, y = self._chunk_placements[chunk_idx]
+            self._rest_mappings_idxes[chunk_idx] = self.rest_mappings.add_tile(FILENAMES[file_idx], x, y)
+        self.rest_mappings.add_mapping(
+            self._rest_mappings_idxes[chunk_idx], dmatype_name, dmatype_idx, neighbors, variation_or_index
+        )
@@ -14,30 +14,41 @@
 #
 #  You should have received a copy of the GNU General Public License
 #  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import hashlib
 import os
 import re
 
-from math import floor
+from contextlib import closing
+from io import BytesIO
+from math import floor, ceil
+from collections.abc import Sequence, Generator
 from typing import List, Dict, Optional, Set, Tuple
-from xml.etree import ElementTree
 from xml.etree.ElementTree import Element
 
 from PIL import Image
+from range_typed_integers import u16
 
-from skytemple_dtef.dungeon_xml import DUNGEON_TILESET, DIMENSIONS, \
+from skytemple_dtef.compiled import CompiledDtef, TILEMAPS_PER_CHUNK, TILE_SIZE, PALETTE_SIZE
+from skytemple_dtef.dma_view import DmaView
+from skytemple_dtef.dungeon_xml import iterparse_dungeon_xml, parse_neighbors, DUNGEON_TILESET, DIMENSIONS, \
     ANIMATION, ANIMATION__PALETTE, ANIMATION__DURATION, ADDITIONAL_TILES, COLOR, FRAME, TILE, TILE__X, TILE__Y, \
     TILE__FILE, MAPPING, SPECIAL_MAPPING, MAPPING__TYPE, MAPPING__TYPE__FLOOR, MAPPING__TYPE__WALL, \
     MAPPING__TYPE__SECONDARY, MAPPING__nw, MAPPING__n, MAPPING__ne, MAPPING__e, MAPPING__se, MAPPING__s, MAPPING__sw, \
     MAPPING__w, MAPPING__VARIATION, SPECIAL_MAPPING__IDENTIFIER
-from skytemple_dtef.explorers_dtef import TILESHEET_WIDTH, TILESHEET_HEIGHT
-from skytemple_dtef.rules import get_rule_variations, REMAP_RULES
+from skytemple_dtef.explorers_dtef import TILESHEET_WIDTH, TILESHEET_HEIGHT, VAR0_FN, VAR1_FN, VAR2_FN
+from skytemple_dtef.package import PackageReader, DirectoryPackageReader, XML_FN
+from skytemple_dtef.rules import REMAP_RULES, SLOT_FOR_BASE_RULE, SLOT_FOR_RULE
 from skytemple_files.common.i18n_util import _, f
+from skytemple_files.common.impl_cfg import get_implementation_type, ImplementationType
+from skytemple_files.common.protocol import TilemapEntryProtocol
+from skytemple_files.common.tiled_image import search_for_tile_with_sum
 from skytemple_files.common.xml_util import validate_xml_attribs, validate_xml_tag
 from skytemple_files.graphics.dma.protocol import DmaProtocol, DmaType, DmaExtraType, DmaNeighbor
 from skytemple_files.graphics.dpc import DPC_TILING_DIM
 from skytemple_files.graphics.dpc.protocol import DpcProtocol
 from skytemple_files.graphics.dpci import DPCI_TILE_DIM
 from skytemple_files.graphics.dpci.protocol import DpciProtocol
+from skytemple_files.graphics.dpl import DPL_PAL_LEN, DPL_MAX_PAL
 from skytemple_files.graphics.dpl.protocol import DplProtocol
 from skytemple_files.graphics.dpla.protocol import DplaProtocol
 
@@ -46,62 +57,271 @@ CHUNK_DIM = DPC_TILING_DIM * DPCI_TILE_DIM
 PATTERN_FLOOR1 = re.compile(r"EOS_EXTRA_FLOOR1_(\d+)")
 PATTERN_FLOOR2 = re.compile(r"EOS_EXTRA_FLOOR2_(\d+)")
 PATTERN_WALL_OR_VOID = re.compile(r"EOS_EXTRA_WALL_OR_VOID_(\d+)")
-EMPTY_IMAGE = [0 for _ in range(CHUNK_DIM ** 2)]
+EMPTY_CHUNK = bytes(CHUNK_DIM ** 2)
 FULL = DmaNeighbor.NORTH_WEST | DmaNeighbor.NORTH | DmaNeighbor.NORTH_EAST | DmaNeighbor.WEST | DmaNeighbor.EAST | DmaNeighbor.SOUTH_WEST | DmaNeighbor.SOUTH | DmaNeighbor.SOUTH_EAST
+# Limits of the DPC and DPCI files.
+MAX_CHUNKS = 400
+MAX_TILES = 1024
+# For each palette: color of the image -> color in the palette; colors of other palettes become color 0.
+_PALETTE_COLOR_LUTS = [
+    bytes(c - pal * DPL_PAL_LEN if c // DPL_PAL_LEN == pal else 0 for c in range(256)) for pal in range(16)
+]
+# A converted chunk: The palette and the tile of each tile of the chunk. The tiles are in the format of
+# search_for_tile_with_sum: The sum of the colors and the pixels (4 bits per pixel).
+ConvertedChunk = tuple[tuple[int, tuple[int, bytes]], ...]
+
+
+def _get_tilemap_entry_model() -> type[TilemapEntryProtocol]:
+    """Returns the class of the tilemap entries of the DPC model of the configured implementation (see FileType.DPC)."""
+    if get_implementation_type() == ImplementationType.NATIVE:
+        from skytemple_rust import TilemapEntry as TilemapEntryNative  # pylint: disable=no-name-in-module
+        return TilemapEntryNative  # type: ignore
+    from skytemple_files.common.tiled_image import TilemapEntry
+    return TilemapEntry
+
+
+class DtefImportResult:
+    """
+    The data of an imported DTEF package, as returned by ExplorersDtefImporter.import_package. It only contains
+    tuples, bytes and integers, so it can be sent between processes and shared between threads. The tile mappings of
+    the chunks are stored as integers (see TilemapEntryProtocol.to_int), since the tilemap entries of the native
+    models can not be pickled. Nothing is written to the models until apply is called.
+    """
+    def __init__(
+            self, chunk_mappings: Sequence[int], chunks: Sequence[Sequence[int]],
+            tiles: Sequence[bytes], palettes: Sequence[Sequence[int]],
+            dpla_colors: Sequence[Sequence[int]], dpla_durations_per_frame_for_colors: Sequence[int]
+    ):
+        self.chunk_mappings = tuple(chunk_mappings)
+        self.chunks = tuple(tuple(chunk) for chunk in chunks)
+        self.tiles = tuple(bytes(tile) for tile in tiles)
+        self.palettes = tuple(tuple(palette) for palette in palettes)
+        self.dpla_colors = tuple(tuple(colors) for colors in dpla_colors)
+        self.dpla_durations_per_frame_for_colors = tuple(dpla_durations_per_frame_for_colors)
+
+    def apply(self, dma: DmaProtocol, dpc: DpcProtocol, dpci: DpciProtocol, dpl: DplProtocol, dpla: DplaProtocol):
+        """
+        Writes the result into the models. All data was already validated by the import and is converted into the
+        format of the models before the first model is changed, so this can not fail half-way through. The models
+        get their own copies of the lists, the result can be applied any number of times.
+        """
+        entry_cls = _get_tilemap_entry_model()
+        chunk_mappings = list(self.chunk_mappings)
+        chunks = [[entry_cls.from_int(u16(value)) for value in chunk] for chunk in self.chunks]
+        tiles = list(self.tiles)
+        palettes = [list(palette) for palette in self.palettes]
+        colors = [list(colors) for colors in self.dpla_colors]
+        durations_per_frame_for_colors = list(self.dpla_durations_per_frame_for_colors)
+
+        dma.chunk_mappings = chunk_mappings
+        dpc.chunks = chunks
+        dpci.tiles = tiles
+        dpl.palettes = palettes
+        dpla.colors = colors
+        dpla.durations_per_frame_for_colors = durations_per_frame_for_colors
 
 
 class ExplorersDtefImporter:
-    def __init__(self, dma: DmaProtocol, dpc: DpcProtocol, dpci: DpciProtocol, dpl: DplProtocol, dpla: DplaProtocol):
+    def __init__(
+            self, dma: DmaProtocol, dpc: DpcProtocol, dpci: DpciProtocol, dpl: DplProtocol, dpla: DplaProtocol,
+            incremental: bool = False
+    ):
+        """
+        The models are only written to by do_import and do_import_package. import_package does not modify them
+        and can be called from multiple threads at once.
+
+        If incremental is True, the importer remembers the contents of the imported files between imports and
+        only decodes the images and parses the XML again if they changed. The pixels of the chunks are also only
+        converted into tiles again for chunks that changed.
+        """
         self.dma = dma
         self.dpc = dpc
         self.dpci = dpci
         self.dpl = dpl
         self.dpla = dpla
+        self.incremental = incremental
+
+        # Caches for incremental imports. Each entry is replaced as a whole, so they can be shared between threads.
+        # Tileset file name -> content hash, decoded image, columns of chunks
+        self._decoded_cache: dict[str, tuple[bytes, Image.Image, list[memoryview | None]]] = {}
+        # Content hash and parts of the XML, as returned by iterparse_dungeon_xml
+        self._xml_cache: tuple[bytes, list[tuple[str | None, Element]]] | None = None
+        # Pixels of the chunks of the last import -> converted chunk (see _convert_chunk)
+        self._chunk_cache: dict[bytes, ConvertedChunk] = {}
+
+    def do_import(self, dirname: str, fn_xml: str, fn_var0: str, fn_var1: str, fn_var2: str):
+        """
+        Imports the DTEF package in the directory dirname into the models. Unlike with do_import_package, the file
+        names are paths to the files (usually inside of dirname), not names in the package.
+        """
+        fn_xml, fn_var0, fn_var1, fn_var2 = (
+            os.path.relpath(fn, dirname) for fn in (fn_xml, fn_var0, fn_var1, fn_var2)
+        )
+        self.do_import_package(DirectoryPackageReader(dirname), fn_xml, fn_var0, fn_var1, fn_var2)
+
+    def do_import_package(
+            self, package: PackageReader,
+            fn_xml: str = XML_FN, fn_var0: str = VAR0_FN, fn_var1: str = VAR1_FN, fn_var2: str = VAR2_FN
+    ):
+        """
+        Imports a DTEF package from a directory, a zip archive or memory (see the package module) into the models.
+        If the import fails, the models are not changed.
+        """
+        self.import_package(package, fn_xml, fn_var0, fn_var1, fn_var2).apply(
+            self.dma, self.dpc, self.dpci, self.dpl, self.dpla
+        )
+
+    def import_package(
+            self, package: PackageReader,
+            fn_xml: str = XML_FN, fn_var0: str = VAR0_FN, fn_var1: str = VAR1_FN, fn_var2: str = VAR2_FN
+    ) -> DtefImportResult:
+        """
+        Imports a DTEF package without changing the models and returns the result, which can then be written into
+        models with DtefImportResult.apply. Multiple packages can be imported at the same time with the same
+        importer.
+        """
+        return _PackageImport(self, package).run(fn_xml, fn_var0, fn_var1, fn_var2)
+
+    def import_compiled(self, compiled: CompiledDtef) -> DtefImportResult:
+        """
+        Reads a compiled tileset (see the compiled module). The data is already in the format of the models, so
+        nothing needs to be decoded or converted. Like import_package, the models are not changed.
+        """
+        mappings = compiled.mappings
+        if len(mappings) != len(self.dma.chunk_mappings):
+            raise ValueError(_("The compiled tileset does not match the DMA file."))
+        tilemaps = compiled.tilemaps
+        tiles = compiled.tiles
+        palettes = compiled.palettes
+        return DtefImportResult(
+            mappings,
+            [tilemaps[i:i + TILEMAPS_PER_CHUNK] for i in range(0, len(tilemaps), TILEMAPS_PER_CHUNK)],
+            [bytes(tiles[i:i + TILE_SIZE]) for i in range(0, len(tiles), TILE_SIZE)],
+            [palettes[i:i + PALETTE_SIZE] for i in range(0, len(palettes), PALETTE_SIZE)],
+            compiled.get_animation_colors(), compiled.animation_durations
+        )
+
+    def _convert_chunks(
+            self, chunks: list[bytes], palette: bytes
+    ) -> tuple[Sequence[Sequence[int]], Sequence[bytes], Sequence[Sequence[int]]]:
+        """
+        Converts the pixels of the chunks into the tile mappings of the DPC (as integers), the DPCI tiles and the
+        DPL palettes, with the same result as DpcProtocol.pil_to_chunks.
+        When importing incrementally, only chunks that were not in the last import are converted, the tiles are
+        then collected from all chunks.
+        """
+        if len(palette) > DPL_PAL_LEN * 16 * 3 or len(palette) % DPL_PAL_LEN != 0:
+            raise ValueError(_("Can not import images as dungeon tilesets: The palette must contain max 256 RGB "
+                               "colors and the number of colors must be divisible by 16."))
+        if len(chunks) > MAX_CHUNKS:
+            raise ValueError(_("A dungeon background or tilemap can not have more than 400 chunks."))
+        cache = self._chunk_cache
+        converted = [cache.get(chunk) or _convert_chunk(chunk) for chunk in chunks]
+        if self.incremental:
+            self._chunk_cache = dict(zip(chunks, converted))
+
+        # Tiles that are used multiple times, also flipped, are only stored once.
+        tiles_with_sum: list[tuple[int, bytes]] = []
+        tilemaps = []
+        for chunk in converted:
+            tilemap = []
+            for pal_idx, tile_with_sum in chunk:
+                if pal_idx > DPL_MAX_PAL - 1:
+                    raise ValueError(f(_("The image to import can only use the first 12 palettes. "
+                                         "Tried to use palette {pal_idx}")))
+                tile_idx, flip_x, flip_y = search_for_tile_with_sum(
+                    tiles_with_sum, tile_with_sum, DPCI_TILE_DIM  # type: ignore
+                )
+                if tile_idx is None:
+                    tile_idx = len(tiles_with_sum)
+                    tiles_with_sum.append(tile_with_sum)
+                # See TilemapEntryProtocol.to_int
+                tilemap.append(tile_idx + (flip_x << 10) + (flip_y << 11) + (pal_idx << 12))
+            tilemaps.append(tilemap)
+        if len(tiles_with_sum) > MAX_TILES:
+            # noinspection PyUnusedLocal
+            len_final_tiles = len(tiles_with_sum)
+            raise ValueError(f(_("An image selected to import is too complex. It has too many unique tiles "
+                                 "({len_final_tiles}, max allowed are 1024).\nTry to have less unique tiles. Unique "
+                                 "tiles are 8x8 sections of the images that can't be found anywhere else in the "
+                                 "image (including flipped or with a different sub-palette).")))
+        # Like pil_to_chunks, the DPC is filled up with empty chunks.
+        tilemaps += [[0] * DPC_TILING_DIM ** 2] * (MAX_CHUNKS - len(tilemaps))
+        palettes = [palette[i:i + DPL_PAL_LEN * 3] for i in range(0, len(palette), DPL_PAL_LEN * 3)][:DPL_MAX_PAL]
+        return tilemaps, [tile for __, tile in tiles_with_sum], [list(pal) for pal in palettes]
+
 
-        self._dirname: str | None = None
+def _convert_chunk(chunk: bytes) -> ConvertedChunk:
+    """
+    Converts the pixels of a chunk (CHUNK_DIM x CHUNK_DIM, one byte per pixel) into its tiles, like
+    DpcProtocol.pil_to_chunks. The palette of each tile is the one of its first pixel, pixels with colors of other
+    palettes get color 0.
+    """
+    tiles = []
+    for ty in range(DPC_TILING_DIM):
+        for tx in range(DPC_TILING_DIM):
+            offset = ty * DPCI_TILE_DIM * CHUNK_DIM + tx * DPCI_TILE_DIM
+            pixels = b''.join(
+                chunk[offset + y * CHUNK_DIM:offset + y * CHUNK_DIM + DPCI_TILE_DIM] for y in range(DPCI_TILE_DIM)
+            )
+            pal_idx = pixels[0] // DPL_PAL_LEN
+            colors = pixels.translate(_PALETTE_COLOR_LUTS[pal_idx])
+            tile = bytes(low | high << 4 for low, high in zip(colors[0::2], colors[1::2]))
+            tiles.append((pal_idx, (sum(colors), tile)))
+    return tuple(tiles)
+
+
+class _PackageImport:
+    """The state of a single import of ExplorersDtefImporter.import_package."""
+    def __init__(self, importer: ExplorersDtefImporter, package: PackageReader):
+        self._importer = importer
+        self._package = package
         self._tileset_file_map: dict[str, Image.Image] = {}
+        # The pixels of the columns of chunks of the tileset images, each one chunk wide, so that every chunk is a
+        # contiguous block. Only created when a chunk of the column is first needed.
+        self._tileset_columns: dict[str, list[memoryview | None]] = {}
         self._tileset_chunk_map: dict[str, dict[tuple[int, int], int]] = {}
-        self._xml: Element | None = None
 
-        # The individual
-        self._chunks: list[Image.Image] = [Image.new('P', (CHUNK_DIM, CHUNK_DIM))]
+        # The pixel data of the individual chunks
+        self._chunks: list[bytes] = [EMPTY_CHUNK]
+        # raw chunk pixel data -> index in self._chunks
+        self._chunk_index: dict[bytes | memoryview, int] = {EMPTY_CHUNK: 0}
         self._palette: bytes | None = None
         self._dpla__colors: list[list[int]] = []
         self._dpla__durations_per_frame_for_colors: list[int] = []
-        self._dma__original_chunk_mappings = dma.chunk_mappings
-        self.dma.chunk_mappings = [0 for _ in range(0, len(dma.chunk_mappings))]
+        # The new DMA mappings
+        self._dma_view = DmaView.empty_like(importer.dma)
 
-    def do_import(self, dirname: str, fn_xml: str, fn_var0: str, fn_var1: str, fn_var2: str):
-        try:
-            self.__init__(self.dma, self.dpc, self.dpci, self.dpl, self.dpla)  # type: ignore
-
-            self._dirname = dirname
-            self._assert_file_exists(fn_xml)
-            self._open_tileset(fn_var0)
-            self._open_tileset(fn_var1)
-            self._open_tileset(fn_var2)
-            self._xml = ElementTree.parse(fn_xml).getroot()
-            validate_xml_tag(self._xml, DUNGEON_TILESET)
-            validate_xml_attribs(self._xml, [DIMENSIONS])
-            if int(self._xml.attrib[DIMENSIONS]) != CHUNK_DIM:
+    def run(self, fn_xml: str, fn_var0: str, fn_var1: str, fn_var2: str) -> DtefImportResult:
+        self._assert_file_exists(fn_xml)
+        self._open_tileset(fn_var0)
+        self._open_tileset(fn_var1)
+        self._open_tileset(fn_var2)
+        # Closes the XML file, if the import fails before the whole XML was read.
+        with closing(self._iter_xml(fn_xml)) as xml:
+            __, root = next(xml)
+            validate_xml_tag(root, DUNGEON_TILESET)
+            validate_xml_attribs(root, [DIMENSIONS])
+            if int(root.attrib[DIMENSIONS]) != CHUNK_DIM:
                 # noinspection PyUnusedLocal
-                dim = self._xml.attrib[DIMENSIONS]
+                dim = root.attrib[DIMENSIONS]
                 raise ValueError(f(_("Invalid tileset. Tileset has chunk dimensions of {dim}px, "
                                      "but only {CHUNK_DIM}px are supported.")))
 
-            var_map = get_rule_variations(REMAP_RULES)
             ts: list[str] = [os.path.basename(fn_var0), os.path.basename(fn_var1), os.path.basename(fn_var2)]
             for i, fn in enumerate(ts):
-                self._import_tileset(fn, var_map, DmaType.WALL, 0, 0, TILESHEET_WIDTH, TILESHEET_HEIGHT, i, ts[i-1] if i > 0 else None)
-                self._import_tileset(fn, var_map, DmaType.WATER, TILESHEET_WIDTH, 0, TILESHEET_WIDTH, TILESHEET_HEIGHT, i, ts[i-1] if i > 0 else None)
-                self._import_tileset(fn, var_map, DmaType.FLOOR, TILESHEET_WIDTH * 2, 0, TILESHEET_WIDTH, TILESHEET_HEIGHT, i, ts[i-1] if i > 0 else None)
+                self._import_tileset(fn, DmaType.WALL, 0, 0, TILESHEET_WIDTH, TILESHEET_HEIGHT, i, ts[i-1] if i > 0 else None)
+                self._import_tileset(fn, DmaType.WATER, TILESHEET_WIDTH, 0, TILESHEET_WIDTH, TILESHEET_HEIGHT, i, ts[i-1] if i > 0 else None)
+                self._import_tileset(fn, DmaType.FLOOR, TILESHEET_WIDTH * 2, 0, TILESHEET_WIDTH, TILESHEET_HEIGHT, i, ts[i-1] if i > 0 else None)
 
             ani0: list[list[int]] = [[] for __ in range(0, 16)]
             ani1: list[list[int]] = [[] for __ in range(0, 16)]
             dur0 = [6 for __ in range(0, 16)]
             dur1 = [6 for __ in range(0, 16)]
-            for child in self._xml:
-                if child.tag == ANIMATION:
+            for parent_tag, child in xml:
+                if parent_tag == ADDITIONAL_TILES:
+                    self._import_additional_tile(child)
+                elif child.tag == ANIMATION:
                     validate_xml_attribs(child, [ANIMATION__PALETTE])
                     if child.attrib[ANIMATION__PALETTE] == "10":
                         if len(child) > 0:
@@ -111,25 +331,32 @@ class ExplorersDtefImporter:
                             ani1, dur1 = self._prepare_import_animation(child)
                     else:
                         raise ValueError(_("Invalid animation: Animation is only supported for palettes 10 and 11."))
-                if child.tag == ADDITIONAL_TILES:
-                    self._import_additional_tiles(child, dirname)
-            self._import_animation(ani0, ani1, dur0, dur1)
+        self._import_animation(ani0, ani1, dur0, dur1)
 
-            self._finalize()
-        except BaseException:
-            # Reset DMA
-            self.dma.chunk_mappings = self._dma__original_chunk_mappings
-            raise
+        return self._finalize()
 
-    @staticmethod
-    def _assert_file_exists(fn):
-        if not os.path.exists(fn):
+    def _assert_file_exists(self, fn):
+        if not self._package.exists(fn):
             raise ValueError(f(_("A required DTEF file is missing: {fn}. Please verify the DTEF package.")))
 
     def _open_tileset(self, fn):
         self._assert_file_exists(fn)
         basename = os.path.basename(fn)
-        pil = self._tileset_file_map[basename] = Image.open(fn)
+        data = self._package.read(fn)
+        incremental = self._importer.incremental
+        digest = hashlib.sha256(data).digest() if incremental else b''
+        cached = self._importer._decoded_cache.get(basename)
+        if cached is not None and cached[0] == digest:
+            __, pil, columns = cached
+        else:
+            pil = Image.open(BytesIO(data))
+            # Decode right away, cached images may be read by several imports at once.
+            pil.load()
+            columns = [None] * ceil(pil.width / CHUNK_DIM)
+            if incremental:
+                self._importer._decoded_cache[basename] = (digest, pil, columns)
+        self._tileset_file_map[basename] = pil
+        self._tileset_columns[basename] = columns
         self._tileset_chunk_map[basename] = {}
         if pil.mode != 'P':
             raise ValueError(f(_('Can not import image "{basename}" as dungeon tileset: '
@@ -144,7 +371,23 @@ class ExplorersDtefImporter:
                                  'The palettes of the images do not match. First image read that didn\'t match: '
                                  '"{basename}"')))
 
-    def _import_tileset(self, fn: str, rule_map: dict[int | None, set[int]], typ: int, bx, by, w, h, var_id, prev_fn: str | None):
+    def _iter_xml(self, fn: str) -> Generator[tuple[str | None, Element], None, None]:
+        """
+        Parses the XML incrementally, see iterparse_dungeon_xml. The tiles of large AdditionalTiles sections are
+        freed as soon as they were imported. When importing incrementally, the parsed XML is kept instead.
+        """
+        if not self._importer.incremental:
+            with self._package.open(fn) as xml_file:
+                yield from iterparse_dungeon_xml(xml_file)
+            return
+        data = self._package.read(fn)
+        digest = hashlib.sha256(data).digest()
+        cached = self._importer._xml_cache
+        if cached is None or cached[0] != digest:
+            cached = self._importer._xml_cache = (digest, list(iterparse_dungeon_xml(BytesIO(data), free=False)))
+        yield from cached[1]
+
+    def _import_tileset(self, fn: str, typ: int, bx, by, w, h, var_id, prev_fn: str | None):
         assert fn in self._tileset_file_map, f(_("Logic error: Tileset file {fn} was not loaded."))
         assert fn in self._tileset_chunk_map, f(_("Logic error: Tileset file {fn} was not loaded."))
         tileset = self._tileset_file_map[fn]
@@ -154,119 +397,102 @@ class ExplorersDtefImporter:
 
         # We need to import the full wall tile first
         if typ == DmaType.WALL and var_id == 0:
-            assert FULL in rule_map, _("A rule is missing in the import set")
-            i = list(rule_map.keys()).index(FULL)
+            i = SLOT_FOR_BASE_RULE[FULL]
             x = bx + (i % w)
             y = by + floor(i / w)
-            cropped = tileset.crop(
-                (x * CHUNK_DIM, y * CHUNK_DIM, (x + 1) * CHUNK_DIM, (y + 1) * CHUNK_DIM)
-            )
-            chunk_index = self._insert_chunk_or_reuse(cropped)
+            chunk_index = self._insert_chunk_or_reuse(self._get_chunk(fn, x, y))
             self._tileset_chunk_map[fn][(x, y)] = chunk_index
             # We don't need to assign the DMA index, we will do this below.
 
-        for i, rules in enumerate(rule_map.values()):
+        slot_chunks = []
+        for i in range(len(REMAP_RULES)):
             x = bx + (i % w)
             y = by + floor(i / w)
-            cropped = tileset.crop(
-                (x * CHUNK_DIM, y * CHUNK_DIM, (x + 1) * CHUNK_DIM, (y + 1) * CHUNK_DIM)
-            )
-            if var_id > 0 and list(cropped.getdata()) == EMPTY_IMAGE:
+            chunk = self._get_chunk(fn, x, y)
+            if var_id > 0 and chunk == EMPTY_CHUNK:
                 # Empty tile in variation, use previous variation.
                 assert prev_fn is not None
                 chunk_index = self._tileset_chunk_map[prev_fn][(x, y)]
             else:
-                chunk_index = self._insert_chunk_or_reuse(cropped)
+                chunk_index = self._insert_chunk_or_reuse(chunk)
             self._tileset_chunk_map[fn][(x, y)] = chunk_index
-            for rule in rules:
-                self.dma.set(typ, rule, var_id, chunk_index)
+            slot_chunks.append(chunk_index)
+        # Assign the chunks of the slots to all rules at once
+        self._dma_view.set_column(typ, var_id, (slot_chunks[slot] for slot in SLOT_FOR_RULE))
 
-    def _insert_chunk_or_reuse(self, new_chunk):
-        for i, chunk in enumerate(self._chunks):
-            if list(chunk.getdata()) == list(new_chunk.getdata()):
-                return i
+    def _get_chunk(self, fn: str, x: int, y: int) -> memoryview:
+        """Returns the pixels of the chunk at the chunk coordinates (x, y) of the tileset image, without copying."""
+        tileset = self._tileset_file_map[fn]
+        columns = self._tileset_columns[fn]
+        if x < 0 or y < 0 or x >= len(columns) or y * CHUNK_DIM >= tileset.height:
+            raise ValueError(f(_("Invalid tile position {x}, {y}: The tile is outside of the image '{fn}'.")))
+        column = columns[x]
+        if column is None:
+            # Chunks at the right or bottom border that are not complete are filled up with color 0.
+            column = columns[x] = memoryview(tileset.crop(
+                (x * CHUNK_DIM, 0, (x + 1) * CHUNK_DIM, ceil(tileset.height / CHUNK_DIM) * CHUNK_DIM)
+            ).tobytes())
+        return column[y * CHUNK_DIM ** 2:(y + 1) * CHUNK_DIM ** 2]
+
+    def _insert_chunk_or_reuse(self, new_chunk: memoryview) -> int:
+        # Read-only memoryviews compare and hash like bytes, the chunk is only copied if it is new.
+        if new_chunk in self._chunk_index:
+            return self._chunk_index[new_chunk]
 
-        self._chunks.append(new_chunk)
+        key = bytes(new_chunk)
+        self._chunks.append(key)
+        self._chunk_index[key] = len(self._chunks) - 1
         return len(self._chunks) - 1
 
-    def _import_additional_tiles(self, xml: Element, dirname):
-        for tile in xml:
-            validate_xml_tag(tile, TILE)
-            validate_xml_attribs(tile, [TILE__X, TILE__Y, TILE__FILE])
-            chunk = self._read_additional_chunk_idx(tile.attrib[TILE__FILE],
-                                                    int(tile.attrib[TILE__X]),
-                                                    int(tile.attrib[TILE__Y]),
-                                                    dirname)
-            for mapping in tile:
-                if mapping.tag == MAPPING:
-                    validate_xml_attribs(mapping, [
-                        MAPPING__TYPE, MAPPING__nw, MAPPING__n, MAPPING__ne, MAPPING__e,
-                        MAPPING__se, MAPPING__s, MAPPING__sw, MAPPING__w, MAPPING__VARIATION
-                    ])
-                    n = 0
-                    if bool(int(mapping.attrib[MAPPING__nw])):
-                        n |= DmaNeighbor.NORTH_WEST
-                    if bool(int(mapping.attrib[MAPPING__n])):
-                        n |= DmaNeighbor.NORTH
-                    if bool(int(mapping.attrib[MAPPING__ne])):
-                        n |= DmaNeighbor.NORTH_EAST
-                    if bool(int(mapping.attrib[MAPPING__e])):
-                        n |= DmaNeighbor.EAST
-                    if bool(int(mapping.attrib[MAPPING__se])):
-                        n |= DmaNeighbor.SOUTH_EAST
-                    if bool(int(mapping.attrib[MAPPING__s])):
-                        n |= DmaNeighbor.SOUTH
-                    if bool(int(mapping.attrib[MAPPING__sw])):
-                        n |= DmaNeighbor.SOUTH_WEST
-                    if bool(int(mapping.attrib[MAPPING__w])):
-                        n |= DmaNeighbor.WEST
-
-                    if mapping.attrib[MAPPING__TYPE] == MAPPING__TYPE__FLOOR:
-                        typ = DmaType.FLOOR
-                    elif mapping.attrib[MAPPING__TYPE] == MAPPING__TYPE__WALL:
-                        typ = DmaType.WALL
-                    elif mapping.attrib[MAPPING__TYPE] == MAPPING__TYPE__SECONDARY:
-                        typ = DmaType.WATER
-                    else:
-                        # noinspection PyUnusedLocal
-                        mapping_type = mapping.attrib[MAPPING__TYPE]
-                        raise ValueError(f(_("Error when importing mapping. Unknown type: "
-                                             "'{mapping_type}'.")))
-                    var_idx = int(mapping.attrib[MAPPING__VARIATION])
-                    if var_idx < 0 or var_idx > 2:
-                        raise ValueError(f(_("Invalid variation index {var_idx}.")))
-
-                    self.dma.set(typ, n, var_idx, chunk)
-
-                elif mapping.tag == SPECIAL_MAPPING:
-                    validate_xml_attribs(mapping, [SPECIAL_MAPPING__IDENTIFIER])
-                    m = PATTERN_FLOOR1.match(mapping.attrib[SPECIAL_MAPPING__IDENTIFIER])
-                    if m:
-                        self.dma.set_extra(DmaExtraType.FLOOR1, int(m.group(1)), chunk)
-                    m = PATTERN_FLOOR2.match(mapping.attrib[SPECIAL_MAPPING__IDENTIFIER])
-                    if m:
-                        self.dma.set_extra(DmaExtraType.FLOOR2, int(m.group(1)), chunk)
-                    m = PATTERN_WALL_OR_VOID.match(mapping.attrib[SPECIAL_MAPPING__IDENTIFIER])
-                    if m:
-                        self.dma.set_extra(DmaExtraType.WALL_OR_VOID, int(m.group(1)), chunk)
-
-    def _read_additional_chunk_idx(self, fn, x, y, dirname):
-        # XXX: We should not need to re-read the file if (x, y) is not found. (x, y) should exist!
-        if fn not in self._tileset_file_map or (x, y) not in self._tileset_chunk_map[fn]:
-            self._open_tileset(os.path.join(dirname, fn))
-            tileset = self._tileset_file_map[fn]
-            for iy in range(0, tileset.height + CHUNK_DIM, CHUNK_DIM):
-                for ix in range(0, tileset.width + CHUNK_DIM, CHUNK_DIM):
-                    chunk_index = self._insert_chunk_or_reuse(tileset.crop((ix, iy, ix + CHUNK_DIM, iy + CHUNK_DIM)))
-                    self._tileset_chunk_map[fn][(floor(ix / CHUNK_DIM), floor(iy / CHUNK_DIM))] = chunk_index
-        return self._tileset_chunk_map[fn][(x, y)]
+    def _import_additional_tile(self, tile: Element):
+        validate_xml_tag(tile, TILE)
+        validate_xml_attribs(tile, [TILE__X, TILE__Y, TILE__FILE])
+        chunk = self._read_additional_chunk_idx(tile.attrib[TILE__FILE],
+                                                int(tile.attrib[TILE__X]),
+                                                int(tile.attrib[TILE__Y]))
+        for mapping in tile:
+            if mapping.tag == MAPPING:
+                validate_xml_attribs(mapping, [
+                    MAPPING__TYPE, MAPPING__nw, MAPPING__n, MAPPING__ne, MAPPING__e,
+                    MAPPING__se, MAPPING__s, MAPPING__sw, MAPPING__w, MAPPING__VARIATION
+                ])
+                n = parse_neighbors(mapping)
 
-    def _merge_chunks(self):
-        new_img = Image.new('P', (CHUNK_DIM * len(self._chunks), CHUNK_DIM))
-        new_img.putpalette(self._chunks[1].getpalette())  # type: ignore
-        for i, chunk in enumerate(self._chunks):
-            new_img.paste(chunk, (i * CHUNK_DIM, 0))
-        return new_img
+                if mapping.attrib[MAPPING__TYPE] == MAPPING__TYPE__FLOOR:
+                    typ = DmaType.FLOOR
+                elif mapping.attrib[MAPPING__TYPE] == MAPPING__TYPE__WALL:
+                    typ = DmaType.WALL
+                elif mapping.attrib[MAPPING__TYPE] == MAPPING__TYPE__SECONDARY:
+                    typ = DmaType.WATER
+                else:
+                    # noinspection PyUnusedLocal
+                    mapping_type = mapping.attrib[MAPPING__TYPE]
+                    raise ValueError(f(_("Error when importing mapping. Unknown type: "
+                                         "'{mapping_type}'.")))
+                var_idx = int(mapping.attrib[MAPPING__VARIATION])
+                if var_idx < 0 or var_idx > 2:
+                    raise ValueError(f(_("Invalid variation index {var_idx}.")))
+
+                self._dma_view.set(typ, n, var_idx, chunk)
+
+            elif mapping.tag == SPECIAL_MAPPING:
+                validate_xml_attribs(mapping, [SPECIAL_MAPPING__IDENTIFIER])
+                m = PATTERN_FLOOR1.match(mapping.attrib[SPECIAL_MAPPING__IDENTIFIER])
+                if m:
+                    self._dma_view.set_extra(DmaExtraType.FLOOR1, int(m.group(1)), chunk)
+                m = PATTERN_FLOOR2.match(mapping.attrib[SPECIAL_MAPPING__IDENTIFIER])
+                if m:
+                    self._dma_view.set_extra(DmaExtraType.FLOOR2, int(m.group(1)), chunk)
+                m = PATTERN_WALL_OR_VOID.match(mapping.attrib[SPECIAL_MAPPING__IDENTIFIER])
+                if m:
+                    self._dma_view.set_extra(DmaExtraType.WALL_OR_VOID, int(m.group(1)), chunk)
+
+    def _read_additional_chunk_idx(self, fn, x, y):
+        if fn not in self._tileset_file_map:
+            self._open_tileset(fn)
+        if (x, y) not in self._tileset_chunk_map[fn]:
+            self._tileset_chunk_map[fn][(x, y)] = self._insert_chunk_or_reuse(self._get_chunk(fn, x, y))
+        return self._tileset_chunk_map[fn][(x, y)]
 
     def _prepare_import_animation(self, child):
         colors: list[list[int]] = [[] for __ in range(0, 16)]
@@ -292,12 +518,13 @@ class ExplorersDtefImporter:
         self._dpla__colors = ani0 + ani1
         self._dpla__durations_per_frame_for_colors = dur0 + dur1
 
-    def _finalize(self):
-        tiles, palettes = self.dpc.pil_to_chunks(self._merge_chunks())
-        self.dpl.palettes = palettes
-        self.dpci.tiles = tiles
-        self.dpla.colors = self._dpla__colors
-        self.dpla.durations_per_frame_for_colors = self._dpla__durations_per_frame_for_colors
+    def _finalize(self) -> DtefImportResult:
+        assert self._palette is not None
+        chunks, tiles, palettes = self._importer._convert_chunks(self._chunks, self._palette)
+        return DtefImportResult(
+            self._dma_view.to_list(), chunks, tiles, palettes,
+            self._dpla__colors, self._dpla__durations_per_frame_for_colors
+        )
 
     @staticmethod
     def _convert_hex_str_color_to_tuple(h: str) -> tuple[int, ...]:
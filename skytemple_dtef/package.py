@@ -0,0 +1,196 @@
+"""
+Reading and writing the files of DTEF packages. A package can be a directory, a zip archive (as a path or any
+file-like object) or an in-memory mapping of file names to their contents.
+"""
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import zipfile
+from abc import ABC, abstractmethod
+from io import BytesIO
+from typing import BinaryIO, IO
+from collections.abc import Mapping, Iterable
+from xml.etree.ElementTree import Element
+
+from PIL import Image
+
+from skytemple_dtef.png_encoder import PngProfile, PROFILE_DEFAULT, encode_png, encode_pngs
+from skytemple_dtef.xml_writer import write_pretty_xml
+
+XML_FN = 'tileset.dtef.xml'
+
+
+class PackageReader(ABC):
+    """Read access to the files of a DTEF package. File names are relative to the package root."""
+    @abstractmethod
+    def exists(self, fn: str) -> bool: ...
+
+    @abstractmethod
+    def open(self, fn: str) -> IO[bytes]:
+        """Opens a file of the package for reading in binary mode."""
+        ...
+
+    def read(self, fn: str) -> bytes:
+        with self.open(fn) as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class DirectoryPackageReader(PackageReader):
+    def __init__(self, dirname: str):
+        self.dirname = dirname
+
+    def exists(self, fn: str) -> bool:
+        return os.path.exists(os.path.join(self.dirname, fn))
+
+    def open(self, fn: str) -> IO[bytes]:
+        return open(os.path.join(self.dirname, fn), 'rb')
+
+
+class ZipPackageReader(PackageReader):
+    """
+    Reads a package from a zip archive. The package files may either be at the root of the archive or in
+    the directory of the archive that contains the XML file.
+    """
+    def __init__(self, file: str | BinaryIO):
+        self._zip = zipfile.ZipFile(file)
+        self._prefix = ''
+        names = self._zip.namelist()
+        if XML_FN not in names:
+            for name in names:
+                if name.endswith('/' + XML_FN):
+                    self._prefix = name[:-len(XML_FN)]
+                    break
+        self._names = set(names)
+
+    def exists(self, fn: str) -> bool:
+        return self._prefix + fn in self._names
+
+    def open(self, fn: str) -> IO[bytes]:
+        return self._zip.open(self._prefix + fn)
+
+    def close(self):
+        self._zip.close()
+
+
+class MappingPackageReader(PackageReader):
+    """Reads a package from a mapping of file names to file contents."""
+    def __init__(self, files: Mapping[str, bytes]):
+        self.files = files
+
+    def exists(self, fn: str) -> bool:
+        return fn in self.files
+
+    def open(self, fn: str) -> IO[bytes]:
+        return BytesIO(self.files[fn])
+
+    def read(self, fn: str) -> bytes:
+        return self.files[fn]
+
+
+class PackageWriter(ABC):
+    """Write access to a DTEF package. File names are relative to the package root."""
+    @abstractmethod
+    def open(self, fn: str) -> IO[bytes]:
+        """Opens a file of the package for writing in binary mode."""
+        ...
+
+    def write(self, fn: str, data: bytes):
+        with self.open(fn) as f:
+            f.write(data)
+
+    def write_xml(self, xml: Element, fn: str = XML_FN):
+        with self.open(fn) as f:
+            write_pretty_xml(f, xml)
+
+    def write_image(self, fn: str, img: Image.Image, profile: PngProfile = PROFILE_DEFAULT):
+        self.write(fn, encode_png(img, profile))
+
+    def write_images(
+            self, images: Iterable[tuple[str, Image.Image]], profile: PngProfile = PROFILE_DEFAULT,
+            max_workers: int | None = None
+    ):
+        """Writes the images as PNGs, encoding them on a thread pool. See png_encoder.encode_pngs."""
+        for fn, data in encode_pngs(images, profile, max_workers):
+            self.write(fn, data)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class DirectoryPackageWriter(PackageWriter):
+    def __init__(self, dirname: str):
+        self.dirname = dirname
+        os.makedirs(dirname, exist_ok=True)
+
+    def open(self, fn: str) -> IO[bytes]:
+        return open(os.path.join(self.dirname, fn), 'wb')
+
+
+class ZipPackageWriter(PackageWriter):
+    """
+    Writes a package into a zip archive (a path or a writable file-like object, which doesn't need to be seekable).
+    The files are streamed into the archive. PNGs are stored as they are, since they are already compressed.
+    """
+    def __init__(self, file: str | BinaryIO):
+        self._zip = zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED)
+
+    def open(self, fn: str) -> IO[bytes]:
+        info = zipfile.ZipInfo(fn)
+        info.compress_type = zipfile.ZIP_STORED if fn.endswith('.png') else zipfile.ZIP_DEFLATED
+        return self._zip.open(info, 'w')
+
+    def close(self):
+        self._zip.close()
+
+
+class MappingPackageWriter(PackageWriter):
+    """Writes a package into the dict `files`, mapping file names to file contents."""
+    def __init__(self):
+        self.files: dict[str, bytes] = {}
+
+    def open(self, fn: str) -> IO[bytes]:
+        return _MappingFile(self.files, fn)
+
+    def write(self, fn: str, data: bytes):
+        self.files[fn] = data
+
+
+class _MappingFile(BytesIO):
+    def __init__(self, files: dict[str, bytes], fn: str):
+        super().__init__()
+        self._files = files
+        self._fn = fn
+
+    def close(self):
+        if not self.closed:
+            self._files[self._fn] = self.getvalue()
+        super().close()
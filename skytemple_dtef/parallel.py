@@ -0,0 +1,55 @@
+"""
+Helpers for running independent work items on a thread pool.
+"""
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections.abc import Iterable, Iterator, Callable
+from typing import TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def map_ordered(func: Callable[[T], R], items: Iterable[T], max_workers: int | None = None) -> Iterator[R]:
+    """
+    Calls func for all items on a thread pool with max_workers threads (defaults to the number of CPUs) and
+    yields the results in the order of the items. items is consumed lazily: At most two items per worker are
+    processed or waiting to be consumed at once, to limit the memory use.
+    If max_workers is 1, the items are processed on the calling thread.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers == 1:
+        for item in items:
+            yield func(item)
+        return
+    pending: deque[Future[R]] = deque()
+    with ThreadPoolExecutor(max_workers) as pool:
+        try:
+            for item in items:
+                if len(pending) >= max_workers * 2:
+                    yield pending.popleft().result()
+                pending.append(pool.submit(func, item))
+            while len(pending) > 0:
+                yield pending.popleft().result()
+        finally:
+            # Don't process the remaining items if the caller stopped early or an item failed.
+            for future in pending:
+                future.cancel()
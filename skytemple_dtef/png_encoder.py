@@ -0,0 +1,65 @@
+"""
+Encoding of the exported images as PNG. Encoding many images (for example the tilesheets and all animation frames
+of a tileset) can be done on a thread pool, since Pillow releases the GIL while compressing.
+"""
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+from io import BytesIO
+from collections.abc import Iterable, Iterator
+
+from PIL import Image
+
+from skytemple_dtef.parallel import map_ordered
+
+
+class PngProfile:
+    """Settings for the zlib compression of the PNGs. The image data itself is never changed."""
+    def __init__(self, name: str, compress_level: int, optimize: bool = False):
+        self.name = name
+        self.compress_level = compress_level
+        self.optimize = optimize
+
+    def __repr__(self):
+        return f'PngProfile({self.name!r}, {self.compress_level}, {self.optimize})'
+
+
+# Fastest encoding, for example while iterating on a tileset.
+PROFILE_FAST = PngProfile('fast', 1)
+# Pillow's default settings.
+PROFILE_DEFAULT = PngProfile('default', 6)
+# Smallest files, for releases. Much slower than the other profiles.
+PROFILE_RELEASE = PngProfile('release', 9, True)
+PROFILES = {p.name: p for p in (PROFILE_FAST, PROFILE_DEFAULT, PROFILE_RELEASE)}
+
+
+def encode_png(img: Image.Image, profile: PngProfile = PROFILE_DEFAULT) -> bytes:
+    buffer = BytesIO()
+    img.save(buffer, 'PNG', compress_level=profile.compress_level, optimize=profile.optimize)
+    return buffer.getvalue()
+
+
+def encode_pngs(
+        images: Iterable[tuple[str, Image.Image]], profile: PngProfile = PROFILE_DEFAULT,
+        max_workers: int | None = None
+) -> Iterator[tuple[str, bytes]]:
+    """
+    Encodes the images on a thread pool and yields the file names and encoded PNGs, in the order of the input.
+    images is consumed lazily: At most two images per worker are encoded or waiting to be consumed at once,
+    so generators like transform.apply_extended_animations don't have to be fully kept in memory.
+    max_workers defaults to the number of CPUs.
+    """
+    return map_ordered(lambda image: (image[0], encode_png(image[1], profile)), images, max_workers)
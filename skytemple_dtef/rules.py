@@ -2,6 +2,7 @@
 This module contains the 47 base rules and a function to get the 209 derivations of it (for each of the base
 rules). In total this makes 256 rules, each rule codes which of the 8 neighboring tiles have the same state as the
 one affected by the rule.
+The lookup tables between the 256 rules, the 47 base rules and the tilesheet slots are built once on import.
 """
 #  Copyright 2020-2023 Capypara and the SkyTemple Contributors
 #
@@ -19,8 +20,10 @@ one affected by the rule.
 #
 #  You should have received a copy of the GNU General Public License
 #  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Dict, Set, Optional
-from collections.abc import Iterable
+from collections.abc import Iterable, Mapping
 
 from skytemple_files.graphics.dma.protocol import DmaNeighbor
 from skytemple_files.common.i18n_util import _, f
@@ -87,35 +90,65 @@ REMAP_RULES = [
 ]
 
 
+def reduce_rule(rule: int) -> int:
+    """
+    Returns the rule of the reduced 47 rule-set that the given 256-set rule is collapsed into. A diagonal neighbor
+    is only relevant if both adjacent cardinal neighbors are also set, so it is removed otherwise.
+    """
+    if rule & DmaNeighbor.NORTH_WEST == DmaNeighbor.NORTH_WEST:
+        if not rule & DmaNeighbor.NORTH == DmaNeighbor.NORTH or not rule & DmaNeighbor.WEST == DmaNeighbor.WEST:
+            rule &= ~DmaNeighbor.NORTH_WEST
+
+    if rule & DmaNeighbor.NORTH_EAST == DmaNeighbor.NORTH_EAST:
+        if not rule & DmaNeighbor.NORTH == DmaNeighbor.NORTH or not rule & DmaNeighbor.EAST == DmaNeighbor.EAST:
+            rule &= ~DmaNeighbor.NORTH_EAST
+
+    if rule & DmaNeighbor.SOUTH_WEST == DmaNeighbor.SOUTH_WEST:
+        if not rule & DmaNeighbor.SOUTH == DmaNeighbor.SOUTH or not rule & DmaNeighbor.WEST == DmaNeighbor.WEST:
+            rule &= ~DmaNeighbor.SOUTH_WEST
+
+    if rule & DmaNeighbor.SOUTH_EAST == DmaNeighbor.SOUTH_EAST:
+        if not rule & DmaNeighbor.SOUTH == DmaNeighbor.SOUTH or not rule & DmaNeighbor.EAST == DmaNeighbor.EAST:
+            rule &= ~DmaNeighbor.SOUTH_EAST
+
+    return rule
+
+
+# Lookup tables, built once on import:
+# For each of the 256 rules, the base rule (one of REMAP_RULES) it is collapsed into.
+BASE_RULE_FOR_RULE: tuple[int, ...] = tuple(reduce_rule(rule) for rule in range(0, 256))
+# For each base rule, the index of it's slot in REMAP_RULES / on the tilesheet.
+SLOT_FOR_BASE_RULE: dict[int, int] = {rule: i for i, rule in enumerate(REMAP_RULES) if rule is not None}
+# For each of the 256 rules, the index of the slot on the tilesheet that contains its tile.
+SLOT_FOR_RULE: tuple[int, ...] = tuple(SLOT_FOR_BASE_RULE[base_rule] for base_rule in BASE_RULE_FOR_RULE)
+
+
 def get_rule_variations(input_rules: Iterable[int | None]) -> dict[int | None, set[int]]:
     """
     Returns all 256-set rules which encode the same tile in a reduced rule-set of 47 rules
     (including the rule passed in). If the rule passed in is None, an empty list is returned.
     Rules are ORed numbers created form DmaNeighbors. See REMAP_RULES for the 47 rule-set.
     The returned value is a dict, where each key is one of the input rules, and the values ALL matching 256-rules.
+    The result is computed once per input rule-set, each call returns a new copy of it. For REMAP_RULES,
+    RULE_VARIATIONS can be used without copying.
     """
-    rules: dict[int | None, set[int]] = {x: set() for x in input_rules}
-    for rule in range(0, 256):
-        orig_rule = rule
-        if rule & DmaNeighbor.NORTH_WEST == DmaNeighbor.NORTH_WEST:
-            if not rule & DmaNeighbor.NORTH == DmaNeighbor.NORTH or not rule & DmaNeighbor.WEST == DmaNeighbor.WEST:
-                rule &= ~DmaNeighbor.NORTH_WEST
+    return {rule: set(rule_vars) for rule, rule_vars in _get_rule_variations(tuple(input_rules)).items()}
 
-        if rule & DmaNeighbor.NORTH_EAST == DmaNeighbor.NORTH_EAST:
-            if not rule & DmaNeighbor.NORTH == DmaNeighbor.NORTH or not rule & DmaNeighbor.EAST == DmaNeighbor.EAST:
-                rule &= ~DmaNeighbor.NORTH_EAST
-
-        if rule & DmaNeighbor.SOUTH_WEST == DmaNeighbor.SOUTH_WEST:
-            if not rule & DmaNeighbor.SOUTH == DmaNeighbor.SOUTH or not rule & DmaNeighbor.WEST == DmaNeighbor.WEST:
-                rule &= ~DmaNeighbor.SOUTH_WEST
-
-        if rule & DmaNeighbor.SOUTH_EAST == DmaNeighbor.SOUTH_EAST:
-            if not rule & DmaNeighbor.SOUTH == DmaNeighbor.SOUTH or not rule & DmaNeighbor.EAST == DmaNeighbor.EAST:
-                rule &= ~DmaNeighbor.SOUTH_EAST
 
+@lru_cache(maxsize=None)
+def _get_rule_variations(input_rules: tuple[int | None, ...]) -> Mapping[int | None, tuple[int, ...]]:
+    # The rules are kept in the order they are found, so that the sets built from them always iterate in the same
+    # order.
+    rules: dict[int | None, list[int]] = {x: [] for x in input_rules}
+    for orig_rule, rule in enumerate(BASE_RULE_FOR_RULE):
         if rule in rules:
-            rules[rule].add(orig_rule)
+            rules[rule].append(orig_rule)
         else:
             raise ValueError(f(_("No match found for rule {orig_rule}. Input set correct?")))
+    return MappingProxyType({rule: tuple(rule_vars) for rule, rule_vars in rules.items()})
+
 
-    return rules
+# For each rule of REMAP_RULES, all 256-set rules that are collapsed into it (see get_rule_variations). Read-only.
+RULE_VARIATIONS: Mapping[int | None, frozenset[int]] = MappingProxyType({
+    rule: frozenset(rule_vars) for rule, rule_vars in _get_rule_variations(tuple(REMAP_RULES)).items()
+})
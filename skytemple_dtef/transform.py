@@ -14,16 +14,34 @@
 #
 #  You should have received a copy of the GNU General Public License
 #  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
-from math import floor
+from functools import partial
+from math import floor, ceil
 
 from typing import Tuple, List, Optional, Dict
-from collections.abc import Iterable
-from xml.etree.ElementTree import Element
+from collections.abc import Iterable, Iterator, Callable
+from xml.etree.ElementTree import Element, SubElement
 
 from PIL import Image
 
 from skytemple_dtef.dungeon_xml import ANIMATION, ANIMATION__PALETTE, ANIMATION__DURATION
-from skytemple_dtef.explorers_dtef import VAR0_FN, VAR1_FN, VAR2_FN, MORE_FN
+from skytemple_dtef.explorers_dtef import VAR0_FN, VAR1_FN, VAR2_FN, MORE_FN, TW
+from skytemple_dtef.package import PackageWriter
+from skytemple_dtef.parallel import map_ordered
+from skytemple_dtef.png_encoder import PngProfile, PROFILE_DEFAULT
+
+PALETTE_LUT_FN = 'tileset_palette_lut.png'
+PALETTE_LUT_XML_FN = 'tileset.palette_lut.xml'
+PALETTE_LUT = 'PaletteLut'
+PALETTE_LUT__FILE = 'file'
+PALETTE_LUT_LAYER = 'Layer'
+PALETTE_LUT_LAYER__ROW = 'row'
+PALETTE_LUT_LAYER__FRAMES = 'frames'
+PALETTE_LUT_LAYER__DURATION = 'duration'
+PALETTE_LUT_COLOR = 'Color'
+PALETTE_LUT_COLOR__INDEX = 'index'
+
+# Alpha values for the palette indices: The first color of every 16 color palette is transparent.
+_ALPHA_LUT = [0 if i % 16 == 0 else 255 for i in range(256)]
 
 
 class ColorAnimInfo:
@@ -33,17 +51,74 @@ class ColorAnimInfo:
         self.frame_color_tuples = frame_colors_hex
 
 
+class AnimationFrame:
+    """
+    An image generated by iter_extended_animation_frames. For the base images, group, frame and duration are None.
+    x and y are the position of the image on the full tilesheet in pixels (only not 0 for cropped layers).
+    """
+    def __init__(
+            self, fn: str, image: Image.Image, base_fn: str,
+            group: int | None = None, frame: int | None = None, duration: int | None = None, x: int = 0, y: int = 0
+    ):
+        self.fn = fn
+        self.image = image
+        self.base_fn = base_fn
+        self.group = group
+        self.frame = frame
+        self.duration = duration
+        self.x = x
+        self.y = y
+
+
 def apply_extended_animations(
-        xml: Element, var0: Image.Image, var1: Image.Image, var2: Image.Image, rest: Image.Image
+        xml: Element, var0: Image.Image, var1: Image.Image, var2: Image.Image, rest: Image.Image,
+        reduce_durations: bool = False, tolerance: int | None = None, max_frames: int | None = None,
+        max_workers: int | None = 1
 ) -> Iterable[tuple[str, Image.Image]]:
     """
     Generates images for each frame of palette animation, yields filenames and images for the frames.
-    Since the animations can have different speeds, the total number of frames will be the LCM of the durations
-    of both animated palettes. If reduce_durations is True, odd durations are reduced by one to be even to potentially
-    get a lower LCM and thus a lower amount of frames.
+    The colors are grouped into layers by their duration and number of frames, each layer gets its own frames.
+    The duration of each frame is part of its filename.
+    If reduce_durations is True, odd durations are reduced by one to be even, so that more colors share a layer and
+    less layers (and thus frames) are generated.
+    If tolerance or max_frames is given, the frames of each layer are reduced: If the colors of a layer repeat within
+    the animation, only the frames until the first repetition are generated, and consecutive frames in which no
+    color differs by more than tolerance (per channel, default 0) are merged into one longer frame. If max_frames is
+    given and a layer still has more frames, its most similar consecutive frames are merged until it has max_frames.
+    The frames can be rendered on multiple threads, see iter_extended_animation_frames for max_workers.
     All input images MUST have mode 'P'.
     """
-    color_groups = _build_color_groups(xml)
+    for frame in iter_extended_animation_frames(
+            xml, var0, var1, var2, rest, reduce_durations=reduce_durations, tolerance=tolerance, max_frames=max_frames,
+            max_workers=max_workers
+    ):
+        yield frame.fn, frame.image
+
+
+def iter_extended_animation_frames(
+        xml: Element, var0: Image.Image, var1: Image.Image, var2: Image.Image, rest: Image.Image, crop: bool = False,
+        reduce_durations: bool = False, tolerance: int | None = None, max_frames: int | None = None,
+        max_workers: int | None = 1
+) -> Iterator[AnimationFrame]:
+    """
+    Like apply_extended_animations, but yields the frames with their metadata.
+    If crop is True, the frames of each animation layer are cropped to the tiles that contain animated pixels and
+    their position on the tilesheet is stored in the x and y attributes. The base images are never cropped.
+    The images are rendered on a thread pool with max_workers threads (None for the number of CPUs), by default
+    on the calling thread. The frames are always yielded in the same order and at most two frames per thread are
+    rendered ahead.
+    """
+    jobs = _iter_frame_jobs(xml, var0, var1, var2, rest, crop, reduce_durations, tolerance, max_frames)
+    return map_ordered(lambda job: job(), jobs, max_workers)
+
+
+def _iter_frame_jobs(
+        xml: Element, var0: Image.Image, var1: Image.Image, var2: Image.Image, rest: Image.Image, crop: bool,
+        reduce_durations: bool, tolerance: int | None, max_frames: int | None
+) -> Iterator[Callable[[], AnimationFrame]]:
+    """Yields functions that render the frames of iter_extended_animation_frames, in order."""
+    color_groups = _build_color_groups(xml, reduce_durations)
+    frame_plans = [_plan_frames(color_group, tolerance, max_frames) for color_group in color_groups]
     for base_fn, base_img in ((VAR0_FN, var0), (VAR1_FN, var1), (VAR2_FN, var2), (MORE_FN, rest)):
         # Apply first frame color to base image
         base_img = base_img.copy()
@@ -53,17 +128,24 @@ def apply_extended_animations(
             for color in color_group:
                 palettes[color.index * 3:(color.index + 1) * 3] = color.frame_color_tuples[0]
         base_img.putpalette(palettes)
-        yield base_fn, apply_alpha_transparency(base_img)
+        yield partial(_render_base_frame, base_fn, base_img)
         cgi = 0
-        for color_group in color_groups:
-            layer_map = _get_pixels_with_indices(base_img, [c.index for c in color_group])
-            if not any(layer_map):
+        for color_group, frame_plan in zip(color_groups, frame_plans):
+            mask = _get_pixels_with_indices(base_img, [c.index for c in color_group])
+            bbox = mask.getbbox()
+            if bbox is None:
+                # No pixel uses any of the colors.
                 continue
+            layer_img = base_img
+            x = y = 0
+            if crop:
+                x, y, x_end, y_end = _align_to_tiles(bbox, base_img.size)
+                layer_img = base_img.crop((x, y, x_end, y_end))
+                mask = mask.crop((x, y, x_end, y_end))
             anything_was_replaced = False
-            for fi in range(0, len(color_group[0].frame_color_tuples)):
-                out_fn = f'{base_fn[:-4]}_frame{cgi}_{fi}.{color_group[0].duration}.png'
-                image = base_img.copy()
-                palettes = image.getpalette()
+            for oi, (fi, duration) in enumerate(frame_plan):
+                out_fn = f'{base_fn[:-4]}_frame{cgi}_{oi}.{duration}.png'
+                palettes = layer_img.getpalette()
                 assert palettes is not None
                 something_was_replaced = False
                 for color in color_group:
@@ -75,16 +157,88 @@ def apply_extended_animations(
                     palettes[color.index * 3:(color.index + 1) * 3] = color.frame_color_tuples[fi]
                 if not something_was_replaced:
                     continue
-                image.putpalette(palettes)
-                mask = Image.new('L', base_img.size, color=255)
-                mask.putdata([255 if m else 0 for m in layer_map])
-                image = image.convert('RGBA')
-                image.putalpha(mask)
-                yield out_fn, image
+                yield partial(
+                    _render_layer_frame, layer_img, palettes, mask, out_fn, base_fn, cgi, oi, duration, x, y
+                )
             if anything_was_replaced:
                 cgi += 1
 
 
+def _render_base_frame(base_fn: str, base_img: Image.Image) -> AnimationFrame:
+    return AnimationFrame(base_fn, apply_alpha_transparency(base_img), base_fn)
+
+
+def _render_layer_frame(
+        layer_img: Image.Image, palettes: list[int], mask: Image.Image,
+        fn: str, base_fn: str, group: int, frame: int, duration: int, x: int, y: int
+) -> AnimationFrame:
+    image = layer_img.copy()
+    image.putpalette(palettes)
+    image = image.convert('RGBA')
+    image.putalpha(mask)
+    return AnimationFrame(fn, image, base_fn, group, frame, duration, x, y)
+
+
+def build_palette_lut(
+        xml: Element, palette: list[int], reduce_durations: bool = False
+) -> tuple[Image.Image, Element]:
+    """
+    Builds a lookup texture for animating the tilesheets by palette lookup (eg. in a shader), instead of
+    generating the frames with apply_extended_animations. palette is the palette of the tilesheets
+    (all tilesheets of a DTEF share the same palette), missing colors at the end are black.
+    Returns the texture and the timing table describing it:
+    The texture is an RGBA image with one column per palette index. Row 0 contains the colors of the first frame
+    (the first color of every 16 color palette is transparent). Each animation layer (see apply_extended_animations)
+    has one row per frame. The timing table lists the layers with their first row, number of frames, duration of
+    a frame and the palette indices they animate. The color of a pixel with index i at time t is in
+    row + (t // duration) % frames of the layer containing i, or row 0 if i is not animated.
+    """
+    color_groups = _build_color_groups(xml, reduce_durations)
+    # The palettes of the tilesheets only contain the colors of the used palettes, fill up the rest with black.
+    palette = list(palette[:256 * 3]) + [0] * (256 * 3 - len(palette))
+    base_row = [(palette[i * 3], palette[i * 3 + 1], palette[i * 3 + 2], _ALPHA_LUT[i]) for i in range(256)]
+    for color_group in color_groups:
+        for color in color_group:
+            base_row[color.index] = (*color.frame_color_tuples[0], _ALPHA_LUT[color.index])
+    rows = [base_row]
+    table = Element(PALETTE_LUT, {PALETTE_LUT__FILE: PALETTE_LUT_FN})
+    for color_group in color_groups:
+        number_frames = len(color_group[0].frame_color_tuples)
+        layer = SubElement(table, PALETTE_LUT_LAYER, {
+            PALETTE_LUT_LAYER__ROW: str(len(rows)),
+            PALETTE_LUT_LAYER__FRAMES: str(number_frames),
+            PALETTE_LUT_LAYER__DURATION: str(color_group[0].duration)
+        })
+        for color in color_group:
+            SubElement(layer, PALETTE_LUT_COLOR, {PALETTE_LUT_COLOR__INDEX: str(color.index)})
+        for fi in range(number_frames):
+            row = list(base_row)
+            for color in color_group:
+                row[color.index] = (*color.frame_color_tuples[fi], _ALPHA_LUT[color.index])
+            rows.append(row)
+    lut = Image.frombytes('RGBA', (256, len(rows)), bytes(c for row in rows for color in row for c in color))
+    return lut, table
+
+
+def write_palette_lut(
+        writer: PackageWriter, xml: Element,
+        var0: Image.Image, var1: Image.Image, var2: Image.Image, rest: Image.Image,
+        reduce_durations: bool = False, profile: PngProfile = PROFILE_DEFAULT, max_workers: int | None = None
+):
+    """
+    Writes the indexed tilesheets, the palette lookup texture and its timing table (see build_palette_lut)
+    into the package. All input images MUST have mode 'P'.
+    """
+    palette = var0.getpalette()
+    assert palette is not None
+    lut, table = build_palette_lut(xml, palette, reduce_durations)
+    writer.write_images(
+        ((VAR0_FN, var0), (VAR1_FN, var1), (VAR2_FN, var2), (MORE_FN, rest), (PALETTE_LUT_FN, lut)),
+        profile, max_workers
+    )
+    writer.write_xml(table, PALETTE_LUT_XML_FN)
+
+
 def xml_filter_tags(xml: Element, tag_list) -> Element:
     new_nodes = []
     for node in xml:
@@ -102,7 +256,7 @@ def convert_hex_str_color_to_tuple(h: str) -> tuple[int, int, int] | None:
     return tuple(int(h[i:i+2], 16) for i in (0, 2, 4))  # type: ignore
 
 
-def _build_color_groups(xml: Element) -> list[list[ColorAnimInfo]]:
+def _build_color_groups(xml: Element, reduce_durations: bool = False) -> list[list[ColorAnimInfo]]:
     colors_grouped: dict[tuple[int, int], list[ColorAnimInfo]] = {}
     for node in xml:
         if node.tag == ANIMATION:
@@ -113,6 +267,8 @@ def _build_color_groups(xml: Element) -> list[list[ColorAnimInfo]]:
                     colors_frame = []
                     for ci, color in enumerate(frame):
                         duration = int(color.attrib[ANIMATION__DURATION])
+                        if reduce_durations and duration > 1 and duration % 2 == 1:
+                            duration -= 1
                         c = ColorAnimInfo(ci_base + ci, duration, [])
                         colors_frame.append(c)
                         if (duration, len(node)) not in colors_grouped:
@@ -123,18 +279,72 @@ def _build_color_groups(xml: Element) -> list[list[ColorAnimInfo]]:
     return list(colors_grouped.values())
 
 
-def _get_pixels_with_indices(img, indices):
-    pixels = img.load()
-    m = []
-    for j in range(img.size[1]):
-        for i in range(img.size[0]):
-            m.append(pixels[i, j] in indices)
-    return m
+def _plan_frames(
+        color_group: list[ColorAnimInfo], tolerance: int | None, max_frames: int | None
+) -> list[tuple[int, int]]:
+    """
+    Returns which frames of the color group to generate, as a list of the index of the frame in the animation and
+    the duration to show it for.
+    """
+    duration = color_group[0].duration
+    number_frames = len(color_group[0].frame_color_tuples)
+    if tolerance is None and max_frames is None:
+        return [(fi, duration) for fi in range(number_frames)]
+    if tolerance is None:
+        tolerance = 0
+    frames = [[c.frame_color_tuples[fi] for c in color_group] for fi in range(number_frames)]
+    # The animation loops, so if it consists of a repeating sequence, only that sequence is needed.
+    period = len(frames)
+    for candidate in range(1, len(frames)):
+        if len(frames) % candidate == 0 and all(
+                _frame_distance(frames[fi], frames[fi % candidate]) <= tolerance for fi in range(candidate, len(frames))
+        ):
+            period = candidate
+            break
+    plan: list[tuple[int, int]] = []
+    for fi in range(period):
+        if len(plan) > 0 and _frame_distance(frames[plan[-1][0]], frames[fi]) <= tolerance:
+            plan[-1] = (plan[-1][0], plan[-1][1] + duration)
+        else:
+            plan.append((fi, duration))
+    if max_frames is not None:
+        while len(plan) > max(max_frames, 1):
+            # Merge the two consecutive frames that are the most similar.
+            pi = min(range(len(plan) - 1), key=lambda i: _frame_distance(frames[plan[i][0]], frames[plan[i + 1][0]]))
+            plan[pi:pi + 2] = [(plan[pi][0], plan[pi][1] + plan[pi + 1][1])]
+    return plan
+
+
+def _frame_distance(a: list[tuple[int, int, int]], b: list[tuple[int, int, int]]) -> int:
+    """The largest difference of a color channel between two frames of a color group."""
+    return max(abs(ca - cb) for color_a, color_b in zip(a, b) for ca, cb in zip(color_a, color_b))
+
+
+def _get_pixels_with_indices(img: Image.Image, indices: Iterable[int]) -> Image.Image:
+    """
+    Returns an 'L' mask for the 'P' image, that is 255 for all pixels with one of the given palette indices
+    and 0 for all others.
+    """
+    lut = [0] * 256
+    for index in indices:
+        lut[index] = 255
+    return img.point(lut, 'L')
+
+
+def _align_to_tiles(bbox: tuple[int, int, int, int], size: tuple[int, int]) -> tuple[int, int, int, int]:
+    """Extends the bounding box to the borders of the tiles it touches."""
+    x, y, x_end, y_end = bbox
+    return (
+        floor(x / TW) * TW,
+        floor(y / TW) * TW,
+        min(ceil(x_end / TW) * TW, size[0]),
+        min(ceil(y_end / TW) * TW, size[1]),
+    )
 
 
 def apply_alpha_transparency(img: Image.Image) -> Image.Image:
-    mask = Image.new('L', img.size, color=255)
-    mask.putdata([0 if x % 16 == 0 else 255 for x in img.getdata()])
+    """Converts the 'P' image to RGBA, making the first color of each 16 color palette transparent."""
+    mask = img.point(_ALPHA_LUT, 'L')
     img = img.convert('RGBA')
     img.putalpha(mask)
 
@@ -0,0 +1,236 @@
+"""
+Fast validation of DTEF packages before importing them. Only the headers and palettes of the images are read (the
+pixel data is never decoded) and the XML is parsed incrementally (see dungeon_xml.iterparse_dungeon_xml), so even
+large packages can be checked in a few milliseconds. All problems found are reported at once.
+
+A package that passes validate_package can still fail to import if the compressed image data itself is corrupt.
+"""
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import re
+from math import ceil
+from xml.etree import ElementTree
+from xml.etree.ElementTree import Element
+
+from PIL import Image, UnidentifiedImageError
+
+from skytemple_dtef.dma_view import NUMBER_VARIATIONS, NUMBER_EXTRA_INDICES
+from skytemple_dtef.dungeon_xml import DUNGEON_TILESET, DIMENSIONS, ANIMATION, ANIMATION__PALETTE, \
+    ANIMATION__DURATION, ADDITIONAL_TILES, COLOR, FRAME, TILE, TILE__X, TILE__Y, TILE__FILE, MAPPING, \
+    SPECIAL_MAPPING, MAPPING__TYPE, MAPPING__TYPE__FLOOR, MAPPING__TYPE__WALL, MAPPING__TYPE__SECONDARY, \
+    MAPPING__nw, MAPPING__n, MAPPING__ne, MAPPING__e, MAPPING__se, MAPPING__s, MAPPING__sw, MAPPING__w, \
+    MAPPING__VARIATION, SPECIAL_MAPPING__IDENTIFIER, NEIGHBOR_ATTRIBS, iterparse_dungeon_xml
+from skytemple_dtef.explorers_dtef import TILESHEET_WIDTH, TILESHEET_HEIGHT, VAR0_FN, VAR1_FN, VAR2_FN
+from skytemple_dtef.explorers_dtef_importer import CHUNK_DIM, PATTERN_FLOOR1, PATTERN_FLOOR2, PATTERN_WALL_OR_VOID
+from skytemple_dtef.package import PackageReader, XML_FN
+from skytemple_files.common.i18n_util import f, _
+
+PATTERN_COLOR = re.compile(r"[0-9a-fA-F]{6}")
+MAPPING_ATTRIBS = [
+    MAPPING__TYPE, MAPPING__nw, MAPPING__n, MAPPING__ne, MAPPING__e,
+    MAPPING__se, MAPPING__s, MAPPING__sw, MAPPING__w, MAPPING__VARIATION
+]
+MAPPING_TYPES = (MAPPING__TYPE__FLOOR, MAPPING__TYPE__WALL, MAPPING__TYPE__SECONDARY)
+
+
+def validate_package(
+        package: PackageReader,
+        fn_xml: str = XML_FN, fn_var0: str = VAR0_FN, fn_var1: str = VAR1_FN, fn_var2: str = VAR2_FN
+) -> list[str]:
+    """
+    Checks the package for everything that would make ExplorersDtefImporter.import_package fail and returns a
+    description of each problem found. The package is valid, if the list is empty.
+    """
+    return _PackageValidation(package).run(fn_xml, fn_var0, fn_var1, fn_var2)
+
+
+class _PackageValidation:
+    def __init__(self, package: PackageReader):
+        self._package = package
+        self.problems: list[str] = []
+        # File name -> size of the image in chunks, or None if the image is invalid.
+        self._tilesets: dict[str, tuple[int, int] | None] = {}
+        self._palette: bytes | None = None
+
+    def run(self, fn_xml: str, fn_var0: str, fn_var1: str, fn_var2: str) -> list[str]:
+        for fn in (fn_var0, fn_var1, fn_var2):
+            size = self._open_tileset(fn, os.path.basename(fn))
+            if size is not None and (size[0] < TILESHEET_WIDTH * 3 or size[1] < TILESHEET_HEIGHT):
+                # noinspection PyUnusedLocal
+                min_size = f'{TILESHEET_WIDTH * 3 * CHUNK_DIM}x{TILESHEET_HEIGHT * CHUNK_DIM}'
+                self._problem(f(_("Image '{fn}' is too small, must be at least {min_size}px.")))
+        if self._file_exists(fn_xml):
+            self._validate_xml(fn_xml)
+        return self.problems
+
+    def _problem(self, msg: str):
+        # The same problem (eg. a wrong color format) can occur many times, it's only reported once.
+        if msg not in self.problems:
+            self.problems.append(msg)
+
+    def _file_exists(self, fn: str) -> bool:
+        if not self._package.exists(fn):
+            self._problem(f(_("A required DTEF file is missing: {fn}. Please verify the DTEF package.")))
+            return False
+        return True
+
+    def _open_tileset(self, fn: str, basename: str) -> tuple[int, int] | None:
+        """Checks the image and returns its size in chunks, or None if it is invalid."""
+        if basename in self._tilesets:
+            return self._tilesets[basename]
+        self._tilesets[basename] = None
+        if not self._file_exists(fn):
+            return None
+        try:
+            # Only reads the header and the chunks before the image data.
+            with self._package.open(fn) as file, Image.open(file) as pil:
+                mode = pil.mode
+                size = pil.size
+                palette = bytes(pil.palette.palette) if pil.palette is not None and pil.palette.mode == 'RGB' else None
+        except (OSError, UnidentifiedImageError, SyntaxError, ValueError):
+            self._problem(f(_('Can not import image "{basename}" as dungeon tileset: Not a valid image.')))
+            return None
+        if mode != 'P':
+            self._problem(f(_('Can not import image "{basename}" as dungeon tileset: '
+                              'Must be indexed image (=using a palette)')))
+            return None
+        if palette is None:
+            self._problem(f(_('Can not import image "{basename}" as dungeon tileset: '
+                              'Palette must contain  256 RGB colors.')))
+            return None
+        if self._palette is None:
+            self._palette = palette
+        elif palette != self._palette:
+            self._problem(f(_('Can not import images as dungeon tilesets: '
+                              'The palettes of the images do not match. Image that didn\'t match: '
+                              '"{basename}"')))
+            return None
+        # Chunks at the right or bottom border that are not complete are filled up when importing.
+        self._tilesets[basename] = (ceil(size[0] / CHUNK_DIM), ceil(size[1] / CHUNK_DIM))
+        return self._tilesets[basename]
+
+    def _validate_xml(self, fn: str):
+        try:
+            with self._package.open(fn) as file:
+                for parent_tag, elem in iterparse_dungeon_xml(file):
+                    if parent_tag is None:
+                        self._validate_root(elem)
+                    elif parent_tag == ADDITIONAL_TILES:
+                        self._validate_tile(elem)
+                    elif elem.tag == ANIMATION:
+                        self._validate_animation(elem)
+        except ElementTree.ParseError as ex:
+            # noinspection PyUnusedLocal
+            error = str(ex)
+            self._problem(f(_("Invalid XML in {fn}: {error}")))
+
+    def _validate_root(self, elem: Element):
+        if not self._check_tag(elem, DUNGEON_TILESET) or not self._check_attribs(elem, [DIMENSIONS]):
+            return
+        # noinspection PyUnusedLocal
+        dim = elem.attrib[DIMENSIONS]
+        if self._parse_int(elem, DIMENSIONS) != CHUNK_DIM:
+            self._problem(f(_("Invalid tileset. Tileset has chunk dimensions of {dim}px, "
+                              "but only {CHUNK_DIM}px are supported.")))
+
+    def _validate_animation(self, elem: Element):
+        if not self._check_attribs(elem, [ANIMATION__PALETTE]):
+            return
+        if elem.attrib[ANIMATION__PALETTE] not in ("10", "11"):
+            self._problem(_("Invalid animation: Animation is only supported for palettes 10 and 11."))
+            return
+        if len(elem) < 1:
+            return
+        durations = 0
+        if ANIMATION__DURATION in elem.attrib:
+            self._parse_int(elem, ANIMATION__DURATION)
+            durations = 16
+        for frame in elem:
+            if not self._check_tag(frame, FRAME):
+                continue
+            if len(frame) != 16:
+                self._problem(_("Error in the XML: One of the animation frames doesn't have 16 colors. Each frame "
+                                "must have a value for each color."))
+            for color in frame:
+                if not self._check_tag(color, COLOR):
+                    continue
+                if color.text is None or not PATTERN_COLOR.fullmatch(color.text):
+                    # noinspection PyUnusedLocal
+                    text = color.text
+                    self._problem(f(_("Error in the XML: Invalid color '{text}'. Colors must be given as six "
+                                      "hexadecimal digits.")))
+                if ANIMATION__DURATION in color.attrib:
+                    self._parse_int(color, ANIMATION__DURATION)
+                    durations += 1
+        if durations != 16:
+            self._problem(_("Error in the XML: Durations for a palette or it's colors are not correctly defined."))
+
+    def _validate_tile(self, tile: Element):
+        if not self._check_tag(tile, TILE) or not self._check_attribs(tile, [TILE__X, TILE__Y, TILE__FILE]):
+            return
+        fn = tile.attrib[TILE__FILE]
+        x = self._parse_int(tile, TILE__X)
+        y = self._parse_int(tile, TILE__Y)
+        size = self._open_tileset(fn, fn)
+        if size is not None and x is not None and y is not None and not (0 <= x < size[0] and 0 <= y < size[1]):
+            self._problem(f(_("Invalid tile position {x}, {y}: The tile is outside of the image '{fn}'.")))
+        for mapping in tile:
+            if mapping.tag == MAPPING:
+                if not self._check_attribs(mapping, MAPPING_ATTRIBS):
+                    continue
+                for attrib, __ in NEIGHBOR_ATTRIBS:
+                    self._parse_int(mapping, attrib)
+                if mapping.attrib[MAPPING__TYPE] not in MAPPING_TYPES:
+                    # noinspection PyUnusedLocal
+                    mapping_type = mapping.attrib[MAPPING__TYPE]
+                    self._problem(f(_("Error when importing mapping. Unknown type: '{mapping_type}'.")))
+                var_idx = self._parse_int(mapping, MAPPING__VARIATION)
+                if var_idx is not None and not 0 <= var_idx < NUMBER_VARIATIONS:
+                    self._problem(f(_("Invalid variation index {var_idx}.")))
+            elif mapping.tag == SPECIAL_MAPPING:
+                if not self._check_attribs(mapping, [SPECIAL_MAPPING__IDENTIFIER]):
+                    continue
+                identifier = mapping.attrib[SPECIAL_MAPPING__IDENTIFIER]
+                for pattern in (PATTERN_FLOOR1, PATTERN_FLOOR2, PATTERN_WALL_OR_VOID):
+                    m = pattern.match(identifier)
+                    if m and int(m.group(1)) >= NUMBER_EXTRA_INDICES:
+                        self._problem(f(_("Invalid special mapping index in {identifier}.")))
+
+    def _check_tag(self, elem: Element, tag: str) -> bool:
+        if elem.tag != tag:
+            self._problem(f(_("Invalid XML. Expected tag {tag}, got tag {elem.tag}.")))
+            return False
+        return True
+
+    def _check_attribs(self, elem: Element, attribs: list[str]) -> bool:
+        valid = True
+        for attrib in attribs:
+            if attrib not in elem.attrib:
+                self._problem(f(_("Invalid XML. Expected attribute {attrib} for XML tag {elem.tag}.")))
+                valid = False
+        return valid
+
+    def _parse_int(self, elem: Element, attrib: str) -> int | None:
+        try:
+            return int(elem.attrib[attrib])
+        except ValueError:
+            # noinspection PyUnusedLocal
+            value = elem.attrib[attrib]
+            self._problem(f(_("Invalid XML. The attribute {attrib} of XML tag {elem.tag} must be a number, "
+                              "got '{value}'.")))
+            return None
@@ -0,0 +1,224 @@
+"""
+Watches a DTEF package directory and re-imports it whenever its files change, eg. for previewing changes made in an
+image editor live. Uses inotify on Linux and falls back to polling the modification times on other systems.
+"""
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from collections.abc import Callable
+
+from skytemple_dtef.explorers_dtef_importer import ExplorersDtefImporter
+from skytemple_dtef.package import DirectoryPackageReader
+
+# Only changes to files with these extensions trigger an import, temporary files of image editors are ignored.
+WATCHED_EXTENSIONS = ('.png', '.xml')
+
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CLOSE_WRITE = 0x8
+_IN_DELETE = 0x200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct('iIII')
+# How often the watcher thread checks if it should stop, in seconds.
+_STOP_CHECK_INTERVAL = 0.5
+
+
+class WatchEvent:
+    """
+    Result of an import done by the PackageWatcher. changed contains the names of the files that changed since the
+    last import (empty for the initial import). If the import failed, error is set and the models are unchanged,
+    they still contain the last successful import.
+    """
+    def __init__(self, changed: set[str], duration: float, error: Exception | None):
+        self.changed = changed
+        self.duration = duration
+        self.error = error
+
+
+class PackageWatcher:
+    """
+    Re-imports the package in dirname with the importer whenever files in it change. Changes are collected until
+    there were no new changes for debounce seconds, then the package is imported once. After each import,
+    callback is called with a WatchEvent.
+    The imports and the callbacks run on a background thread, started with start(). The importer should be
+    incremental (see ExplorersDtefImporter), so that only the changed files are processed again.
+    """
+    def __init__(
+            self, dirname: str, importer: ExplorersDtefImporter, callback: Callable[[WatchEvent], None],
+            debounce: float = 0.2, poll_interval: float = 0.5, use_inotify: bool = True
+    ):
+        self.dirname = dirname
+        self.importer = importer
+        self.callback = callback
+        self.debounce = debounce
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._backend: _InotifyBackend | _PollingBackend | None = None
+        if use_inotify:
+            self._backend = _InotifyBackend.create(dirname)
+        if self._backend is None:
+            self._backend = _PollingBackend(dirname, poll_interval)
+
+    @property
+    def backend_name(self) -> str:
+        """'inotify' or 'polling'."""
+        return 'inotify' if isinstance(self._backend, _InotifyBackend) else 'polling'
+
+    def start(self, initial_import: bool = True):
+        """Starts watching. If initial_import is True, the package is imported once right away."""
+        if self._thread is not None:
+            raise RuntimeError("The watcher was already started.")
+        self._thread = threading.Thread(target=self._run, args=(initial_import,), name='dtef-watch', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops watching and waits for a running import to finish."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        assert self._backend is not None
+        self._backend.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _run(self, initial_import: bool):
+        assert self._backend is not None
+        if initial_import:
+            self._import(set())
+        while not self._stop.is_set():
+            changed = self._backend.wait(_STOP_CHECK_INTERVAL)
+            if len(changed) < 1:
+                continue
+            # Wait for the end of the burst of changes (eg. an editor writing several files).
+            while not self._stop.is_set():
+                more = self._backend.wait(self.debounce)
+                if len(more) < 1:
+                    break
+                changed |= more
+            if not self._stop.is_set():
+                self._import(changed)
+
+    def _import(self, changed: set[str]):
+        start = time.perf_counter()
+        error = None
+        try:
+            self.importer.do_import_package(DirectoryPackageReader(self.dirname))
+        except Exception as ex:
+            # Files might be incomplete while they are being saved, the next change will trigger a new import.
+            error = ex
+        self.callback(WatchEvent(changed, time.perf_counter() - start, error))
+
+
+class _InotifyBackend:
+    def __init__(self, fd: int):
+        self._fd = fd
+
+    @classmethod
+    def create(cls, dirname: str) -> '_InotifyBackend | None':
+        """Returns None, if inotify is not available."""
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_MOVED_FROM | _IN_DELETE
+        if libc.inotify_add_watch(fd, os.fsencode(dirname), mask) < 0:
+            os.close(fd)
+            return None
+        return cls(fd)
+
+    def wait(self, timeout: float) -> set[str]:
+        """Waits up to timeout seconds for changes and returns the names of the changed files."""
+        if self._fd < 0:
+            time.sleep(timeout)
+            return set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        changed: set[str] = set()
+        if len(readable) < 1:
+            return changed
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        pos = 0
+        while pos + _INOTIFY_EVENT.size <= len(data):
+            _, _, _, name_len = _INOTIFY_EVENT.unpack_from(data, pos)
+            pos += _INOTIFY_EVENT.size
+            name = os.fsdecode(data[pos:pos + name_len].rstrip(b'\0'))
+            pos += name_len
+            if name.endswith(WATCHED_EXTENSIONS):
+                changed.add(name)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class _PollingBackend:
+    def __init__(self, dirname: str, interval: float):
+        self._dirname = dirname
+        self._interval = interval
+        self._state = self._scan()
+
+    def wait(self, timeout: float) -> set[str]:
+        """Waits up to timeout seconds for changes and returns the names of the changed files."""
+        deadline = time.monotonic() + timeout
+        while True:
+            state = self._scan()
+            changed = {name for name in state.keys() | self._state.keys() if state.get(name) != self._state.get(name)}
+            self._state = state
+            remaining = deadline - time.monotonic()
+            if len(changed) > 0 or remaining <= 0:
+                return changed
+            time.sleep(min(self._interval, remaining))
+
+    def close(self):
+        pass
+
+    def _scan(self) -> dict[str, tuple[int, int]]:
+        state = {}
+        try:
+            with os.scandir(self._dirname) as it:
+                for entry in it:
+                    if entry.name.endswith(WATCHED_EXTENSIONS):
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        state[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            pass
+        return state
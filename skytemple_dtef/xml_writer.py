@@ -0,0 +1,131 @@
+"""
+Incremental writing of XML files. The output is formatted exactly like skytemple_files.common.xml_util.prettify,
+but the document does not need to be built in memory as a whole and is not re-parsed via minidom. Large sections
+can be written element by element, directly into a file.
+"""
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+from collections.abc import Mapping
+from typing import IO
+from xml.etree.ElementTree import Element, Comment
+
+INDENT = '  '
+
+
+class PrettyXmlWriter:
+    """
+    Writes an XML document into a binary file, encoded as UTF-8. Elements are opened with start and closed
+    with end, complete (small) elements can be written with element. Everything is written right away, only the
+    currently open elements are remembered.
+    """
+    def __init__(self, file: IO[bytes]):
+        self._file = file
+        self._open: list[str] = []
+        # Whether the start tag of the innermost open element still needs to be closed with '>'. If the
+        # element doesn't get any children, it's written as an empty element instead.
+        self._pending = False
+        self._write('<?xml version="1.0" ?>\n')
+
+    def start(self, tag: str, attrib: Mapping[str, str] | None = None):
+        self._begin_child()
+        self._write(f'{self._indent()}<{tag}{_attributes(attrib)}')
+        self._open.append(tag)
+        self._pending = True
+
+    def end(self):
+        tag = self._open.pop()
+        if self._pending:
+            self._write('/>\n')
+            self._pending = False
+        else:
+            self._write(f'{self._indent()}</{tag}>\n')
+
+    def comment(self, text: str):
+        self._begin_child()
+        self._write(f'{self._indent()}<!--{text}-->\n')
+
+    def element(self, elem: Element):
+        """Writes a complete element with all of its children."""
+        self._begin_child()
+        self._write_element(elem)
+
+    def close(self):
+        """Closes all elements that are still open."""
+        while len(self._open) > 0:
+            self.end()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+    def _write_element(self, elem: Element):
+        indent = self._indent()
+        if elem.tag is Comment:
+            self._write(f'{indent}<!--{elem.text}-->\n')
+            return
+        nodes: list[Element | str] = []
+        if elem.text:
+            nodes.append(elem.text)
+        for child in elem:
+            nodes.append(child)
+            if child.tail:
+                nodes.append(child.tail)
+        start = f'{indent}<{elem.tag}{_attributes(elem.attrib)}'
+        if len(nodes) < 1:
+            self._write(f'{start}/>\n')
+        elif len(nodes) == 1 and isinstance(nodes[0], str):
+            self._write(f'{start}>{_escape(nodes[0])}</{elem.tag}>\n')
+        else:
+            self._write(f'{start}>\n')
+            self._open.append(str(elem.tag))
+            for node in nodes:
+                if isinstance(node, str):
+                    self._write(_escape(f'{self._indent()}{node}\n'))
+                else:
+                    self._write_element(node)
+            self._open.pop()
+            self._write(f'{indent}</{elem.tag}>\n')
+
+    def _begin_child(self):
+        if self._pending:
+            self._write('>\n')
+            self._pending = False
+
+    def _indent(self) -> str:
+        return INDENT * len(self._open)
+
+    def _write(self, data: str):
+        self._file.write(data.encode('utf-8'))
+
+
+def write_pretty_xml(file: IO[bytes], xml: Element):
+    """Writes the element and its children as an XML document, formatted like prettify."""
+    with PrettyXmlWriter(file) as writer:
+        writer.element(xml)
+
+
+def _attributes(attrib: Mapping[str, str] | None) -> str:
+    if not attrib:
+        return ''
+    return ''.join(f' {name}="{_escape(value)}"' for name, value in attrib.items())
+
+
+def _escape(data: str) -> str:
+    return data.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;').replace('>', '&gt;')
@@ -0,0 +1,69 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import unittest
+from xml.etree.ElementTree import Element, SubElement
+
+from PIL import Image
+
+from skytemple_dtef.animation_strips import write_animation_strips, read_animation_strips, ANIMATION_STRIPS_FN
+from skytemple_dtef.dungeon_xml import DUNGEON_TILESET, ANIMATION, ANIMATION__PALETTE, ANIMATION__DURATION, FRAME, \
+    COLOR
+from skytemple_dtef.explorers_dtef import TILESHEET_WIDTH, TILESHEET_HEIGHT, TW, FILENAMES
+from skytemple_dtef.package import MappingPackageWriter, MappingPackageReader
+from skytemple_dtef.transform import iter_extended_animation_frames
+
+
+class AnimationStripsTestCase(unittest.TestCase):
+    """
+    Tests writing the animation frames as strips and reading them back.
+    """
+    def test_write_read(self):
+        xml = Element(DUNGEON_TILESET)
+        for palette, duration, colors in ((10, 4, ('ff0000', '00ff00', '0000ff')), (11, 7, ('ffffff', '000000'))):
+            animation = SubElement(xml, ANIMATION, {ANIMATION__PALETTE: str(palette)})
+            for color_hex in colors:
+                frame_node = SubElement(animation, FRAME)
+                for _ in range(16):
+                    SubElement(frame_node, COLOR, {ANIMATION__DURATION: str(duration)}).text = color_hex
+        sheets = []
+        for _ in range(4):
+            img = Image.new('P', (TILESHEET_WIDTH * 3 * TW, TILESHEET_HEIGHT * TW), color=1)
+            img.putpalette(bytes(range(256)) * 3)
+            sheets.append(img)
+        var0, var1, var2, rest = sheets
+        var0.paste(161, (0, 0, TW, TW))
+        var0.paste(177, (TW * 2, TW, TW * 3, TW * 2))
+        rest.paste(170, (TW, TW, TW * 2, TW * 2))
+
+        frames = [
+            frame for frame in iter_extended_animation_frames(xml, var0, var1, var2, rest, crop=True)
+            if frame.group is not None
+        ]
+        writer = MappingPackageWriter()
+        write_animation_strips(writer, iter_extended_animation_frames(xml, var0, var1, var2, rest, crop=True))
+        self.assertEqual(
+            {ANIMATION_STRIPS_FN, 'tileset_0_frame0.png', 'tileset_0_frame1.png', 'tileset_more_frame0.png'}
+            | set(FILENAMES),
+            set(writer.files.keys())
+        )
+        restored = list(read_animation_strips(MappingPackageReader(writer.files)))
+        self.assertEqual([frame.fn for frame in frames], [frame.fn for frame in restored])
+        for frame, restored_frame in zip(frames, restored):
+            self.assertEqual(
+                (frame.x, frame.y, frame.duration), (restored_frame.x, restored_frame.y, restored_frame.duration)
+            )
+            self.assertEqual(frame.image.tobytes(), restored_frame.image.tobytes())
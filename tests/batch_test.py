@@ -0,0 +1,104 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import unittest
+from io import BytesIO
+from typing import cast
+
+from random_models import random_models
+from skytemple_dtef.batch import TilesetSource, export_dungeon_bin, export_tilesets
+from skytemple_dtef.explorers_dtef import ExplorersDtef
+from skytemple_dtef.package import MappingPackageWriter, XML_FN
+from skytemple_dtef.png_encoder import encode_png
+from skytemple_files.container.dungeon_bin.model import DungeonBinPack
+
+
+class FakeDungeonBin:
+    """The parts of DungeonBinPack used to find the tilesets."""
+    def __init__(self, files: dict):
+        self.files = files
+
+    def __len__(self):
+        return len(self.files)
+
+    def get_filename(self, i: int) -> str:
+        return list(self.files.keys())[i]
+
+    def get(self, fn: str):
+        return self.files[fn]
+
+
+class BatchTestCase(unittest.TestCase):
+    """
+    Tests exporting multiple tilesets on a process pool.
+    """
+    def test_export_dungeon_bin(self):
+        files = {}
+        for i in range(3):
+            dma, dpc, dpci, dpl, dpla = random_models(i)
+            files.update({
+                f'tileset{i}.dma': dma, f'tileset{i}.dpc': dpc, f'tileset{i}.dpci': dpci,
+                f'tileset{i}.dpl': dpl, f'tileset{i}.dpla': dpla, f'tileset{i}.bpc': None
+            })
+        results = list(export_dungeon_bin(cast(DungeonBinPack, FakeDungeonBin(files)), max_workers=2))
+
+        self.assertEqual([0, 1, 2], sorted(result.index for result in results))
+        for result in results:
+            self.assertIsNone(result.error)
+            self.assertEqual(f'tileset{result.index}', result.name)
+            writer = MappingPackageWriter()
+            result.write_package(writer)
+            self.assertEqual(self._expected_files(result.index), writer.files)
+
+    def test_export_tilesets_isolates_errors(self):
+        sources = [TilesetSource.from_models(i, f'tileset{i}', *random_models(i)) for i in range(3)]
+        # Not enough chunk mappings.
+        sources[1].dma = bytes(2)
+        results = {result.index: result for result in export_tilesets(sources, max_workers=2)}
+
+        self.assertIsInstance(results[1].error, IndexError)
+        self.assertIsNone(results[1].xml)
+        self.assertEqual({}, results[1].files)
+        with self.assertRaises(IndexError):
+            results[1].write_package(MappingPackageWriter())
+        for i in (0, 2):
+            self.assertIsNone(results[i].error)
+            writer = MappingPackageWriter()
+            results[i].write_package(writer)
+            self.assertEqual(self._expected_files(i), writer.files)
+
+    def test_export_tilesets_consumes_sources_lazily(self):
+        consumed = []
+
+        def sources():
+            for i in range(8):
+                consumed.append(i)
+                yield TilesetSource.from_models(i, f'tileset{i}', *random_models(i % 2))
+
+        results = export_tilesets(sources(), max_workers=1)
+        indices = [next(results).index]
+        # Two tilesets per worker are exported at once, the next one is only taken after a result is ready.
+        self.assertLessEqual(len(consumed), 3)
+        indices.extend(result.index for result in results)
+        self.assertEqual(list(range(8)), sorted(indices))
+
+    def _expected_files(self, seed: int) -> dict[str, bytes]:
+        dtef = ExplorersDtef(*random_models(seed))
+        xml = BytesIO()
+        dtef.write_xml(xml)
+        files = {XML_FN: xml.getvalue()}
+        files.update({fn: encode_png(img) for fn, img in zip(dtef.get_filenames(), dtef.get_tiles())})
+        return files
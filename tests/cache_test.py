@@ -0,0 +1,103 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from skytemple_dtef.batch import TilesetSource, TilesetExportResult
+from skytemple_dtef.cache import ExportCache, _get_code_version
+
+
+class ExportCacheTestCase(unittest.TestCase):
+    """
+    Tests storing, restoring, evicting and invalidating entries of the ExportCache.
+    """
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache = ExportCache(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_get__miss_and_hit(self):
+        source = self._source(0)
+        self.assertIsNone(self.cache.get(source))
+        self.cache.put(source, self._result(source))
+        restored = self.cache.get(source)
+        assert restored is not None
+        self.assertEqual('<xml0/>', restored.xml)
+        self.assertEqual({'tileset_0.png': b'png0'}, restored.files)
+        self.assertIsNone(self.cache.get(self._source(1)))
+
+    def test_key_for__depends_on_all_files(self):
+        source = self._source(0)
+        keys = {self.cache.key_for(source)}
+        for attr in ('dma', 'dpc', 'dpci', 'dpl', 'dpla'):
+            changed = self._source(0)
+            setattr(changed, attr, getattr(changed, attr) + b'!')
+            keys.add(self.cache.key_for(changed))
+        self.assertEqual(6, len(keys))
+
+    def test_key_for__depends_on_code(self):
+        source = self._source(0)
+        with mock.patch('skytemple_dtef.cache._get_code_version', return_value='changed'):
+            changed = ExportCache(self._tmp.name)
+        self.assertNotEqual(self.cache.key_for(source), changed.key_for(source))
+        # A source checkout is identified by the hash of its sources, not by a placeholder version.
+        self.assertEqual(64, len(_get_code_version()))
+
+    def test_put__failed_export_not_cached(self):
+        source = self._source(0)
+        self.cache.put(source, TilesetExportResult(0, 'zero', None, {}, ValueError()))
+        self.assertIsNone(self.cache.get(source))
+
+    def test_evict__least_recently_used(self):
+        sources = [self._source(i) for i in range(3)]
+        for i, source in enumerate(sources):
+            self.cache.put(source, self._result(source))
+            path = os.path.join(self._tmp.name, self.cache.key_for(source) + '.dtefcache')
+            os.utime(path, (i, i))
+        # Using the first entry makes the second one the least recently used.
+        self.cache.get(sources[0])
+        entry_size = os.path.getsize(os.path.join(self._tmp.name, self.cache.key_for(sources[0]) + '.dtefcache'))
+        self.cache.max_size = entry_size * 2
+        self.cache.evict()
+        self.assertIsNotNone(self.cache.get(sources[0]))
+        self.assertIsNone(self.cache.get(sources[1]))
+        self.assertIsNotNone(self.cache.get(sources[2]))
+
+    def test_invalidate(self):
+        sources = [self._source(i) for i in range(3)]
+        for source in sources:
+            self.cache.put(source, self._result(source))
+        self.cache.invalidate(sources[1])
+        self.assertIsNotNone(self.cache.get(sources[0]))
+        self.assertIsNone(self.cache.get(sources[1]))
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get(sources[0]))
+        self.assertIsNone(self.cache.get(sources[2]))
+
+    @staticmethod
+    def _source(i: int) -> TilesetSource:
+        return TilesetSource(i, str(i), bytes([i]), b'dpc', b'dpci', b'dpl', b'dpla')
+
+    @staticmethod
+    def _result(source: TilesetSource) -> TilesetExportResult:
+        return TilesetExportResult(
+            source.index, source.name, f'<xml{source.index}/>', {'tileset_0.png': f'png{source.index}'.encode()}, None
+        )
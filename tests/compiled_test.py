@@ -0,0 +1,103 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import mmap
+import os
+import random
+import tempfile
+import unittest
+from io import BytesIO
+from unittest import mock
+
+from random_models import random_models, read_fixture
+from skytemple_dtef.compiled import CompiledDtef, COMPILED_FN, CHUNK_SIZE
+from skytemple_dtef.dma_view import DmaView
+from skytemple_dtef.explorers_dtef import ExplorersDtef
+from skytemple_dtef.explorers_dtef_importer import ExplorersDtefImporter
+from skytemple_files.common.types.file_types import FileType
+from skytemple_files.graphics.dma.protocol import DmaType
+
+
+class CompiledDtefTestCase(unittest.TestCase):
+    """
+    Tests writing a compiled tileset with the exporter and loading it memory-mapped with the importer.
+    """
+    def setUp(self):
+        self.dma, self.dpc, self.dpci, self.dpl, self.dpla = random_models(1)
+        rand = random.Random(1)
+        self.dpla.colors = [[rand.randrange(256) for _ in range(3 * 4)] for _ in range(16)] + [[] for _ in range(16)]
+        self.dpla.durations_per_frame_for_colors = [rand.randrange(1, 10) for _ in range(16)] + [0] * 16
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            fn = os.path.join(dirname, COMPILED_FN)
+            with open(fn, 'wb') as f:
+                ExplorersDtef(self.dma, self.dpc, self.dpci, self.dpl, self.dpla).write_compiled(f)
+
+            with CompiledDtef.open(fn) as compiled:
+                chunks = self.dpc.chunks_to_pil(self.dpci, self.dpl.palettes, 1)
+                self.assertEqual(chunks.tobytes(), compiled.chunk_pixels)
+                self.assertEqual(bytes(chunks.getpalette() or []), compiled.palette)
+                self.assertEqual(len(self.dpc.chunks), compiled.chunk_count)
+                self.assertEqual(chunks.tobytes()[5 * CHUNK_SIZE:6 * CHUNK_SIZE], compiled.get_chunk(5))
+                view = DmaView.from_dma(self.dma)
+                rule_table = compiled.rule_table
+                self.assertEqual(list(view.get(DmaType.FLOOR, 0x3A)), [rule_table[DmaType.FLOOR, 0x3A, v] for v in range(3)])
+
+                models = (
+                    FileType.DMA.deserialize(read_fixture('dummy.dma')), FileType.DPC.deserialize(b''),
+                    FileType.DPCI.deserialize(b''), FileType.DPL.deserialize(b''),
+                    FileType.DPLA.get_model_cls()(b"", 0)
+                )
+                result = ExplorersDtefImporter(*models).import_compiled(compiled)
+                result.apply(*models)
+                dma, dpc, dpci, dpl, dpla = models
+                self.assertEqual(FileType.DMA.serialize(self.dma), FileType.DMA.serialize(dma))
+                self.assertEqual(FileType.DPC.serialize(self.dpc), FileType.DPC.serialize(dpc))
+                self.assertEqual(FileType.DPCI.serialize(self.dpci), FileType.DPCI.serialize(dpci))
+                self.assertEqual(FileType.DPL.serialize(self.dpl), FileType.DPL.serialize(dpl))
+                self.assertEqual(FileType.DPLA.serialize(self.dpla), FileType.DPLA.serialize(dpla))
+                # The views into the file must be released before it is closed.
+                del rule_table
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            CompiledDtef(b'PNG\0' + bytes(100))
+        with self.assertRaises(ValueError):
+            CompiledDtef(b'DT')
+
+    def test_open_invalid_closes_file(self):
+        mapped = []
+        mmap_cls = mmap.mmap
+
+        def mmap_file(*args, **kwargs):
+            mapped.append(mmap_cls(*args, **kwargs))
+            return mapped[-1]
+
+        with tempfile.TemporaryDirectory() as dirname:
+            fn = os.path.join(dirname, COMPILED_FN)
+            for data in (b'PNG\0' + bytes(100), b'DT', self._compiled()[:-1]):
+                with open(fn, 'wb') as f:
+                    f.write(data)
+                with mock.patch('skytemple_dtef.compiled.mmap.mmap', side_effect=mmap_file):
+                    with self.assertRaises(ValueError):
+                        CompiledDtef.open(fn)
+                self.assertTrue(mapped[-1].closed)
+
+    def _compiled(self) -> bytes:
+        f = BytesIO()
+        ExplorersDtef(self.dma, self.dpc, self.dpci, self.dpl, self.dpla).write_compiled(f)
+        return f.getvalue()
@@ -0,0 +1,75 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import unittest
+
+from skytemple_dtef.dma_view import DmaView, NUMBER_VARIATIONS
+from skytemple_dtef.rules import BASE_RULE_FOR_RULE
+from skytemple_files.common.types.file_types import FileType
+from skytemple_files.graphics.dma.protocol import DmaType, DmaExtraType
+
+TYPES = (DmaType.WALL, DmaType.WATER, DmaType.FLOOR)
+
+
+class DmaViewTestCase(unittest.TestCase):
+    """
+    Tests that the bulk accessors of DmaView address the same entries as the per-entry accessors of the DMA model.
+    """
+    def setUp(self):
+        with open(self.__fixture_path(), 'rb') as f:
+            self.dma = FileType.DMA.deserialize(f.read())
+        self.view = DmaView.from_dma(self.dma)
+
+    def test_get__matches_dma(self):
+        view_3d = self.view.as_3d()
+        for typ in TYPES:
+            for rule in range(0, 256):
+                self.assertEqual(list(self.dma.get(typ, rule)), list(self.view.get(typ, rule)))
+                for variation in range(NUMBER_VARIATIONS):
+                    self.assertEqual(self.dma.get(typ, rule)[variation],
+                                     self.view.get_column(typ, variation)[rule])
+                    self.assertEqual(self.dma.get(typ, rule)[variation], view_3d[typ, rule, variation])
+
+    def test_set__matches_dma(self):
+        for typ in TYPES:
+            for variation in range(NUMBER_VARIATIONS):
+                values = [(typ * 7 + variation * 3 + rule) % 200 for rule in range(0, 256)]
+                self.view.set_column(typ, variation, values)
+                for rule, value in enumerate(values):
+                    self.dma.set(typ, rule, variation, value)
+        self.view.set(DmaType.WATER, 12, 2, 123)
+        self.dma.set(DmaType.WATER, 12, 2, 123)
+        self.view.set_extra(DmaExtraType.FLOOR2, 5, 77)
+        self.dma.set_extra(DmaExtraType.FLOOR2, 5, 77)
+        self.assertEqual(list(self.dma.chunk_mappings), self.view.to_list())
+
+    def test_get_mismatching_rules(self):
+        for typ in TYPES:
+            for variation in range(NUMBER_VARIATIONS):
+                expected = {
+                    rule for rule in range(0, 256)
+                    if self.dma.get(typ, rule)[variation] != self.dma.get(typ, BASE_RULE_FOR_RULE[rule])[variation]
+                }
+                self.assertEqual(expected, self.view.get_mismatching_rules(typ, variation))
+
+    @staticmethod
+    def __fixture_path():
+        return os.path.abspath(
+            os.path.join(os.path.dirname(__file__),
+                         'fixtures',
+                         'dummy.dma')
+        )
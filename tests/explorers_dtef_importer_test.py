@@ -0,0 +1,243 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import pickle
+import random
+import tempfile
+import unittest
+from unittest import mock
+from xml.etree.ElementTree import Element, SubElement, tostring
+
+from PIL import Image
+
+from skytemple_dtef.dungeon_xml import DUNGEON_TILESET, DIMENSIONS, ADDITIONAL_TILES, TILE, TILE__FILE, TILE__X, \
+    TILE__Y, SPECIAL_MAPPING, SPECIAL_MAPPING__IDENTIFIER
+from skytemple_dtef.explorers_dtef import TILESHEET_WIDTH, TILESHEET_HEIGHT, TW, VAR0_FN, VAR1_FN, VAR2_FN, MORE_FN
+from skytemple_dtef.explorers_dtef_importer import ExplorersDtefImporter, EMPTY_CHUNK, _convert_chunk
+from skytemple_dtef.package import MappingPackageWriter, MappingPackageReader, DirectoryPackageWriter, XML_FN
+from skytemple_dtef.parallel import map_ordered
+from skytemple_files.common.types.file_types import FileType
+from skytemple_files.graphics.dma.protocol import DmaProtocol
+from skytemple_files.graphics.dpc.protocol import DpcProtocol
+from skytemple_files.graphics.dpci.protocol import DpciProtocol
+from skytemple_files.graphics.dpl.protocol import DplProtocol
+from skytemple_files.graphics.dpla.protocol import DplaProtocol
+
+
+class ExplorersDtefImporterTestCase(unittest.TestCase):
+    """
+    Tests importing DTEF packages, generated in memory.
+    """
+    def test_incremental(self):
+        files = self._package()
+        importer = ExplorersDtefImporter(*self._models(), incremental=True)
+        importer.do_import_package(MappingPackageReader(files))
+        self.assertEqual(self._full_import(files), self._serialize(importer))
+
+        # Change one tile: Only the new chunk is converted.
+        var1 = Image.open(MappingPackageReader(files).open(VAR1_FN))
+        var1.paste(self._tile(random.Random(99)), (TW * 3, TW * 2))
+        files[VAR1_FN] = self._png(var1)
+        with mock.patch(
+                'skytemple_dtef.explorers_dtef_importer._convert_chunk', side_effect=_convert_chunk
+        ) as convert_chunk:
+            importer.do_import_package(MappingPackageReader(files))
+            self.assertEqual(1, convert_chunk.call_count)
+        self.assertEqual(self._full_import(files), self._serialize(importer))
+
+        # Nothing changed: The chunks don't need to be converted again.
+        with mock.patch('skytemple_dtef.explorers_dtef_importer._convert_chunk', side_effect=AssertionError):
+            importer.do_import_package(MappingPackageReader(files))
+        self.assertEqual(self._full_import(files), self._serialize(importer))
+
+    def test_convert_chunks__like_pil_to_chunks(self):
+        rand = random.Random(3)
+        palette = bytes(rand.randrange(256) & 0xF8 for _ in range(256 * 3))
+        chunks = [EMPTY_CHUNK]
+        for _ in range(20):
+            tile = self._tile(rand)
+            chunks.append(tile.tobytes())
+            # The same tiles flipped and with colors of other palettes.
+            chunks.append(tile.transpose(Image.Transpose.FLIP_LEFT_RIGHT).tobytes())
+            chunks.append(tile.transpose(Image.Transpose.ROTATE_180).tobytes())
+            chunks.append(bytes(c if rand.random() < 0.9 else rand.randrange(192) for c in tile.tobytes()))
+        img = Image.frombytes('P', (TW, TW * len(chunks)), b''.join(chunks))
+        img.putpalette(palette)
+        dpc = FileType.DPC.deserialize(b'')
+        tiles, palettes = dpc.pil_to_chunks(img)
+
+        importer = ExplorersDtefImporter(*self._models())
+        self.assertEqual(
+            ([[tilemap.to_int() for tilemap in chunk] for chunk in dpc.chunks], list(tiles), palettes),
+            importer._convert_chunks(chunks, palette)
+        )
+
+    def test_import_package_does_not_modify_models(self):
+        files = self._package()
+        importer = ExplorersDtefImporter(*self._models())
+        before = self._serialize(importer)
+        result = importer.import_package(MappingPackageReader(files))
+        self.assertEqual(before, self._serialize(importer))
+
+        models = self._models()
+        result.apply(*models)
+        self.assertEqual(self._full_import(files), self._serialize(ExplorersDtefImporter(*models)))
+        # The result is not changed by applying it.
+        self.assertEqual(result.chunk_mappings, importer.import_package(MappingPackageReader(files)).chunk_mappings)
+
+    def test_result_stores_tilemaps_as_ints(self):
+        files = self._package()
+        result = ExplorersDtefImporter(*self._models()).import_package(MappingPackageReader(files))
+        self.assertTrue(all(type(tilemap) is int for chunk in result.chunks for tilemap in chunk))
+        models = self._models()
+        result.apply(*models)
+        dpc = models[1]
+        entry_cls = type(type(dpc)(bytes(18)).chunks[0][0])
+        self.assertTrue(all(type(tilemap) is entry_cls for chunk in dpc.chunks for tilemap in chunk))
+        self.assertEqual([list(chunk) for chunk in result.chunks], [
+            [tilemap.to_int() for tilemap in chunk] for chunk in dpc.chunks
+        ])
+
+    def test_failed_apply_keeps_models(self):
+        files = self._package()
+        result = ExplorersDtefImporter(*self._models()).import_package(MappingPackageReader(files))
+        importer = ExplorersDtefImporter(*self._models())
+        before = self._serialize(importer)
+        with mock.patch(
+                'skytemple_dtef.explorers_dtef_importer._get_tilemap_entry_model',
+                return_value=mock.Mock(from_int=mock.Mock(side_effect=OverflowError))
+        ):
+            with self.assertRaises(OverflowError):
+                result.apply(importer.dma, importer.dpc, importer.dpci, importer.dpl, importer.dpla)
+        self.assertEqual(before, self._serialize(importer))
+
+    def test_failed_import_keeps_models(self):
+        files = self._package()
+        importer = ExplorersDtefImporter(*self._models())
+        importer.do_import_package(MappingPackageReader(files))
+        before = self._serialize(importer)
+        # The variation images are imported completely before the invalid additional tile is read.
+        files[XML_FN] = files[XML_FN].replace(b'x="3"', b'x="999"')
+        with self.assertRaises(ValueError):
+            importer.do_import_package(MappingPackageReader(files))
+        self.assertEqual(before, self._serialize(importer))
+
+    def test_additional_tile_out_of_bounds(self):
+        # The tilesheet for additional tiles is TILESHEET_WIDTH * 3 tiles wide and one tile high.
+        for x, y in ((TILESHEET_WIDTH * 3, 0), (-1, 0), (3, 1), (3, -1)):
+            with self.subTest(x=x, y=y):
+                files = self._package()
+                files[XML_FN] = files[XML_FN].replace(b'x="3" y="0"', f'x="{x}" y="{y}"'.encode())
+                importer = ExplorersDtefImporter(*self._models())
+                with self.assertRaisesRegex(ValueError, f"Invalid tile position {x}, {y}: .* '{MORE_FN}'"):
+                    importer.import_package(MappingPackageReader(files))
+
+    def test_concurrent_imports(self):
+        packages = [self._package(seed) for seed in range(4)]
+        expected = [self._full_import(files) for files in packages]
+        for incremental in (False, True):
+            importer = ExplorersDtefImporter(*self._models(), incremental=incremental)
+            results = list(map_ordered(
+                lambda files: importer.import_package(MappingPackageReader(files)), packages * 2, max_workers=4
+            ))
+            for i, result in enumerate(results):
+                models = self._models()
+                pickle.loads(pickle.dumps(result)).apply(*models)
+                self.assertEqual(expected[i % len(packages)], self._serialize(ExplorersDtefImporter(*models)))
+
+    def test_do_import_relative_directory(self):
+        files = self._package()
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+            try:
+                writer = DirectoryPackageWriter('package')
+                for fn, data in files.items():
+                    writer.write(fn, data)
+                importer = ExplorersDtefImporter(*self._models())
+                importer.do_import(
+                    'package', *(os.path.join('package', fn) for fn in (XML_FN, VAR0_FN, VAR1_FN, VAR2_FN))
+                )
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(self._full_import(files), self._serialize(importer))
+
+    def _full_import(self, files):
+        importer = ExplorersDtefImporter(*self._models())
+        importer.do_import_package(MappingPackageReader(files))
+        return self._serialize(importer)
+
+    def _package(self, seed: int = 1) -> dict[str, bytes]:
+        rand = random.Random(seed)
+        palette = [rand.randrange(256) & 0xF8 for _ in range(256 * 3)]
+        tiles = [self._tile(rand) for _ in range(12)]
+        writer = MappingPackageWriter()
+        for fn in (VAR0_FN, VAR1_FN, VAR2_FN, MORE_FN):
+            height = 1 if fn == MORE_FN else TILESHEET_HEIGHT
+            img = Image.new('P', (TILESHEET_WIDTH * 3 * TW, height * TW))
+            img.putpalette(palette)
+            for y in range(height):
+                for x in range(TILESHEET_WIDTH * 3):
+                    if fn == VAR0_FN or rand.random() < 0.5:
+                        img.paste(rand.choice(tiles), (x * TW, y * TW))
+            writer.write(fn, self._png(img))
+        xml = Element(DUNGEON_TILESET, {DIMENSIONS: str(TW)})
+        additional_tiles = SubElement(xml, ADDITIONAL_TILES)
+        for x in range(4):
+            tile = SubElement(additional_tiles, TILE, {TILE__FILE: MORE_FN, TILE__X: str(x), TILE__Y: '0'})
+            SubElement(tile, SPECIAL_MAPPING, {SPECIAL_MAPPING__IDENTIFIER: f'EOS_EXTRA_FLOOR1_{x}'})
+        writer.write(XML_FN, tostring(xml))
+        return writer.files
+
+    @staticmethod
+    def _tile(rand: random.Random) -> Image.Image:
+        tile = Image.new('P', (TW, TW))
+        pal = rand.randrange(12) * 16
+        tile.putdata([pal + rand.randrange(16) for _ in range(TW * TW)])
+        return tile
+
+    @staticmethod
+    def _png(img: Image.Image) -> bytes:
+        writer = MappingPackageWriter()
+        writer.write_image('img.png', img)
+        return writer.files['img.png']
+
+    @staticmethod
+    def _serialize(importer: ExplorersDtefImporter):
+        return (
+            FileType.DMA.serialize(importer.dma),
+            FileType.DPC.serialize(importer.dpc),
+            FileType.DPCI.serialize(importer.dpci),
+            FileType.DPL.serialize(importer.dpl),
+        )
+
+    @classmethod
+    def _models(cls) -> tuple[DmaProtocol, DpcProtocol, DpciProtocol, DplProtocol, DplaProtocol]:
+        with open(cls.__fixture_path(), 'rb') as f:
+            dma = FileType.DMA.deserialize(f.read())
+        return (
+            dma, FileType.DPC.deserialize(b''), FileType.DPCI.deserialize(b''), FileType.DPL.deserialize(b''),
+            FileType.DPLA.get_model_cls()(b"", 0)
+        )
+
+    @staticmethod
+    def __fixture_path():
+        return os.path.abspath(
+            os.path.join(os.path.dirname(__file__),
+                         'fixtures',
+                         'dummy.dma')
+        )
@@ -0,0 +1,202 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import hashlib
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from random_models import random_models, Models, NUMBER_CHUNKS, USED_CHUNKS
+from skytemple_dtef.dma_view import NORMAL_LEN
+from skytemple_dtef.explorers_dtef import ExplorersDtef, TW, FILENAMES, TILESHEET_WIDTH, MORE_FN
+from skytemple_dtef.explorers_dtef_importer import ExplorersDtefImporter
+from skytemple_dtef.package import MappingPackageWriter, MappingPackageReader
+from skytemple_dtef.rules import REMAP_RULES
+from skytemple_files.graphics.dma.protocol import DmaType
+# SHA-256 of the pixel data of the tilesheets rendered for _models_with_additional_tiles(0).
+RENDER_CHECKSUMS = [
+    ('tileset_0.png', (432, 192), '0c88c683bf43a489be10f86cf4983101b528f09386d417c242aed3169f8826cc'),
+    ('tileset_1.png', (432, 192), '68916ae3647cf98133e1277ffd8e69f563b39ebed7927b1f98b4b4f0958b2ae8'),
+    ('tileset_2.png', (432, 192), '06d2f4fadb278412e64c43bd2ddc17dc4b3561cf4d42d5c9d2f74ac445760762'),
+    ('tileset_more.png', (432, 24), '145740231764568e7f56f9e7f8f3001e29aa3ffb4df7b9af34a63f3c7febf250'),
+]
+
+
+class ExplorersDtefTestCase(unittest.TestCase):
+    """
+    Tests exporting tilesets to DTEF, for models generated from random chunks and mappings.
+    """
+    def test_round_trip(self):
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                models = random_models(seed)
+                writer = MappingPackageWriter()
+                ExplorersDtef(*models).write_package(writer)
+                imported = random_models(seed)
+                ExplorersDtefImporter(*imported).do_import_package(MappingPackageReader(writer.files))
+                # The importer numbers the chunks in the order it reads them, so compare what the mappings show.
+                self.assertEqual(self._mapped_chunks(models), self._mapped_chunks(imported))
+
+    def test_get_chunk_placement(self):
+        models = random_models(0)
+        dtef = ExplorersDtef(*models)
+        tiles = dict(zip(FILENAMES, dtef.get_tiles()))
+        chunks = self._chunks(models)
+        for chunk_idx in set(models[0].chunk_mappings):
+            placement = dtef.get_chunk_placement(chunk_idx)
+            assert placement is not None
+            fn, x, y = placement
+            tile = tiles[fn].crop((x * TW, y * TW, (x + 1) * TW, (y + 1) * TW))
+            self.assertEqual(chunks[chunk_idx], tile.tobytes())
+        self.assertIsNone(dtef.get_chunk_placement(0))
+        self.assertIsNone(dtef.get_chunk_placement(USED_CHUNKS))
+
+    def test_get_chunk_usages(self):
+        dma = random_models(0)[0]
+        dtef = ExplorersDtef(*random_models(0))
+        count = 0
+        for chunk_idx in range(NUMBER_CHUNKS):
+            for the_type, rule, variation in dtef.get_chunk_usages(chunk_idx):
+                self.assertEqual(chunk_idx, dma.get(the_type, rule)[variation])
+                count += 1
+        self.assertEqual(NORMAL_LEN, count)
+        self.assertEqual((), dtef.get_chunk_usages(USED_CHUNKS))
+
+    def test_get_chunk_extra_usages(self):
+        dma = random_models(0)[0]
+        dtef = ExplorersDtef(*random_models(0))
+        count = 0
+        for chunk_idx in range(NUMBER_CHUNKS):
+            for extra_type, index in dtef.get_chunk_extra_usages(chunk_idx):
+                self.assertEqual(chunk_idx, dma.get_extra(extra_type)[index])
+                count += 1
+        self.assertEqual(len(dma.chunk_mappings) - NORMAL_LEN, count)
+        self.assertEqual((), dtef.get_chunk_extra_usages(USED_CHUNKS))
+
+    def test_lazy_tiles(self):
+        dma, dpc, dpci, dpl, dpla = random_models(0)
+        chunks_to_pil = type(dpc).chunks_to_pil
+        render = mock.Mock()
+
+        def counting_chunks_to_pil(self, *args, **kwargs):
+            render(*args, **kwargs)
+            return chunks_to_pil(self, *args, **kwargs)
+
+        with mock.patch.object(type(dpc), 'chunks_to_pil', counting_chunks_to_pil):
+            dtef = ExplorersDtef(dma, dpc, dpci, dpl, dpla, lazy=True)
+            dtef.get_xml()
+            dtef.get_chunk_placement(1)
+            render.assert_not_called()
+
+            tiles = dtef.get_tiles()
+            self.assertIs(tiles[0], dtef.var0)
+            self.assertIs(tiles[3], dtef.rest)
+            self.assertIs(tiles, dtef.get_tiles())
+            self.assertEqual(1, render.call_count)
+
+            dtef.release_tiles()
+            render.assert_called_once()
+            rendered_again = dtef.get_tiles()
+            self.assertEqual(2, render.call_count)
+            self.assertIsNot(tiles[0], rendered_again[0])
+            self.assertEqual(
+                [(img.size, img.tobytes(), img.getpalette()) for img in tiles],
+                [(img.size, img.tobytes(), img.getpalette()) for img in rendered_again]
+            )
+
+            ExplorersDtef(dma, dpc, dpci, dpl, dpla)
+            self.assertEqual(3, render.call_count)
+
+    def test_render_tiles(self):
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                models = self._models_with_additional_tiles(seed)
+                dma = models[0]
+                dtef = ExplorersDtef(*models)
+                tiles = dtef.get_tiles()
+                # Paste the chunks one by one, into the slots of their rules, like the tilesheets were drawn before
+                # they were rendered from the pixel data of the chunks.
+                chunks = models[1].chunks_to_pil(models[2], models[3].palettes, 1)
+                expected = [Image.new('P', img.size) for img in tiles]
+
+                def paste(file_idx, chunk_idx, x, y):
+                    chunk = chunks.crop((0, chunk_idx * TW, TW, (chunk_idx + 1) * TW))
+                    expected[file_idx].paste(chunk, (x * TW, y * TW))
+
+                for ti, the_type in enumerate((DmaType.WALL, DmaType.WATER, DmaType.FLOOR)):
+                    for i, rule in enumerate(REMAP_RULES):
+                        if rule is None:
+                            continue
+                        variations = dma.get(the_type, rule)
+                        for iv, chunk_idx in enumerate(variations):
+                            if iv == 0 or chunk_idx != variations[iv - 1]:
+                                paste(iv, chunk_idx, i % TILESHEET_WIDTH + TILESHEET_WIDTH * ti, i // TILESHEET_WIDTH)
+                for chunk_idx in range(USED_CHUNKS, NUMBER_CHUNKS):
+                    placement = dtef.get_chunk_placement(chunk_idx)
+                    assert placement is not None
+                    fn, x, y = placement
+                    self.assertEqual(MORE_FN, fn)
+                    paste(FILENAMES.index(MORE_FN), chunk_idx, x, y)
+                for img, expected_img in zip(tiles, expected):
+                    self.assertEqual('P', img.mode)
+                    self.assertEqual(chunks.getpalette(), img.getpalette())
+                    self.assertEqual(expected_img.tobytes(), img.tobytes())
+
+    def test_render_tiles__checksums(self):
+        tiles = ExplorersDtef(*self._models_with_additional_tiles(0)).get_tiles()
+        self.assertEqual(RENDER_CHECKSUMS, [
+            (fn, img.size, hashlib.sha256(img.tobytes()).hexdigest()) for fn, img in zip(FILENAMES, tiles)
+        ])
+
+    def test_render_tiles__missing_chunks(self):
+        models = random_models(0)
+        dma, dpc = models[0], models[1]
+        # The DMA maps to chunks that are not in the DPC.
+        dpc.chunks = dpc.chunks[:USED_CHUNKS]
+        missing = USED_CHUNKS + 5
+        mappings = list(dma.chunk_mappings)
+        mappings[0] = missing
+        mappings[-1] = missing + 1
+        dma.chunk_mappings = mappings
+        dtef = ExplorersDtef(*models)
+        tiles = dict(zip(FILENAMES, dtef.get_tiles()))
+        for chunk_idx in (missing, missing + 1):
+            placement = dtef.get_chunk_placement(chunk_idx)
+            assert placement is not None
+            fn, x, y = placement
+            tile = tiles[fn].crop((x * TW, y * TW, (x + 1) * TW, (y + 1) * TW))
+            self.assertEqual(bytes(TW * TW), tile.tobytes())
+
+    @staticmethod
+    def _models_with_additional_tiles(seed: int) -> Models:
+        """Like random_models, but the extra mappings use the chunks that are not on the variation tilesheets."""
+        models = random_models(seed)
+        mappings = list(models[0].chunk_mappings)
+        for i in range(NORMAL_LEN, len(mappings)):
+            mappings[i] = USED_CHUNKS + i % (NUMBER_CHUNKS - USED_CHUNKS)
+        models[0].chunk_mappings = mappings
+        return models
+
+    @staticmethod
+    def _chunks(models) -> list[bytes]:
+        dma, dpc, dpci, dpl, dpla = models
+        data = dpc.chunks_to_pil(dpci, dpl.palettes, 1).tobytes()
+        return [data[i:i + TW * TW] for i in range(0, len(data), TW * TW)]
+
+    def _mapped_chunks(self, models) -> list[bytes]:
+        chunks = self._chunks(models)
+        return [chunks[chunk_idx] for chunk_idx in models[0].chunk_mappings]
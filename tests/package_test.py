@@ -0,0 +1,70 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+from skytemple_dtef.package import ZipPackageReader, ZipPackageWriter, DirectoryPackageReader, \
+    DirectoryPackageWriter, MappingPackageReader, MappingPackageWriter, XML_FN
+
+FILES = {XML_FN: b'<DungeonTileset/>', 'tileset_0.png': b'png data'}
+
+
+class PackageTestCase(unittest.TestCase):
+    """
+    Tests writing packages and reading them back with all package readers and writers.
+    """
+    def test_mapping(self):
+        writer = MappingPackageWriter()
+        self._write(writer)
+        self.assertEqual(FILES, writer.files)
+        self._check(MappingPackageReader(writer.files))
+
+    def test_directory(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            with DirectoryPackageWriter(os.path.join(dirname, 'pkg')) as writer:
+                self._write(writer)
+            with DirectoryPackageReader(os.path.join(dirname, 'pkg')) as reader:
+                self._check(reader)
+
+    def test_zip(self):
+        buffer = io.BytesIO()
+        with ZipPackageWriter(buffer) as writer:
+            self._write(writer)
+        with ZipPackageReader(io.BytesIO(buffer.getvalue())) as reader:
+            self._check(reader)
+
+    def test_zip__subdirectory(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            for fn, data in FILES.items():
+                zf.writestr('tileset/' + fn, data)
+        with ZipPackageReader(io.BytesIO(buffer.getvalue())) as reader:
+            self._check(reader)
+
+    def _write(self, writer):
+        for fn, data in FILES.items():
+            with writer.open(fn) as f:
+                f.write(data)
+
+    def _check(self, reader):
+        for fn, data in FILES.items():
+            self.assertTrue(reader.exists(fn))
+            self.assertEqual(data, reader.read(fn))
+        self.assertFalse(reader.exists('tileset_more.png'))
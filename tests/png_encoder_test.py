@@ -0,0 +1,41 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import io
+import unittest
+
+from PIL import Image
+
+from skytemple_dtef.png_encoder import encode_pngs, PROFILES
+
+
+class PngEncoderTestCase(unittest.TestCase):
+    """
+    Tests that encode_pngs keeps the order of the images and doesn't change them, with all profiles.
+    """
+    def test_encode_pngs(self):
+        images = []
+        for i in range(20):
+            img = Image.new('P', (24, 24), color=i)
+            img.putpalette(bytes(range(256)) * 3)
+            images.append((f'{i}.png', img))
+        for profile in PROFILES.values():
+            encoded = list(encode_pngs(iter(images), profile, max_workers=3))
+            self.assertEqual([fn for fn, _ in images], [fn for fn, _ in encoded])
+            for (_, img), (_, data) in zip(images, encoded):
+                decoded = Image.open(io.BytesIO(data))
+                self.assertEqual('P', decoded.mode)
+                self.assertEqual(img.tobytes(), decoded.tobytes())
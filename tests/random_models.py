@@ -0,0 +1,64 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+"""Tileset models generated from random chunks and mappings, shared by the tests."""
+import os
+import random
+
+from PIL import Image
+
+from skytemple_dtef.explorers_dtef import TW
+from skytemple_files.common.types.file_types import FileType
+from skytemple_files.graphics.dma.protocol import DmaProtocol
+from skytemple_files.graphics.dpc.protocol import DpcProtocol
+from skytemple_files.graphics.dpci.protocol import DpciProtocol
+from skytemple_files.graphics.dpl.protocol import DplProtocol
+from skytemple_files.graphics.dpla.protocol import DplaProtocol
+
+# Chunks of the generated models; the DMA only uses the chunks 1 to USED_CHUNKS - 1.
+NUMBER_CHUNKS = 60
+USED_CHUNKS = 50
+
+Models = tuple[DmaProtocol, DpcProtocol, DpciProtocol, DplProtocol, DplaProtocol]
+
+
+def random_models(seed: int) -> Models:
+    """
+    Returns the models of a tileset with NUMBER_CHUNKS chunks of random pixels, each chunk using one of the first
+    12 palettes. The DMA maps all rules to random chunks between 1 and USED_CHUNKS - 1. Chunk 0 is left out: It is
+    empty, and empty tiles in the variation tilesheets use the previous variation.
+    """
+    rand = random.Random(seed)
+    dma = FileType.DMA.deserialize(read_fixture('dummy.dma'))
+    dma.chunk_mappings = [rand.randrange(1, USED_CHUNKS) for _ in dma.chunk_mappings]
+    chunks = Image.new('P', (TW, TW * NUMBER_CHUNKS))
+    chunks.putpalette([rand.randrange(256) & 0xF8 for _ in range(256 * 3)])
+    chunks.putdata([0] * TW * TW + [
+        i % 12 * 16 + rand.randrange(16) for i in range(1, NUMBER_CHUNKS) for _ in range(TW * TW)
+    ])
+    dpc = FileType.DPC.deserialize(b'')
+    tiles, palettes = dpc.pil_to_chunks(chunks)
+    dpci = FileType.DPCI.deserialize(b'')
+    dpci.tiles = list(tiles)
+    dpl = FileType.DPL.deserialize(b'')
+    dpl.palettes = list(palettes)
+    dpla = FileType.DPLA.get_model_cls()(b"", 0)
+    return dma, dpc, dpci, dpl, dpla
+
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(os.path.dirname(__file__), 'fixtures', name), 'rb') as f:
+        return f.read()
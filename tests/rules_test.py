@@ -39,6 +39,33 @@ class RulesTestCase(unittest.TestCase):
         self.assertEqual(len(combinations), len(set(combinations)),
                          f"There must be no duplicate rules for the 47 base rules.")
 
+    def test_get_rule_variations__returns_copies(self):
+        rule_map = get_rule_variations(REMAP_RULES)
+        self.assertIsInstance(rule_map, dict)
+        rule_map[REMAP_RULES[0]].add(-1)
+        del rule_map[REMAP_RULES[1]]
+        self.assertEqual(get_rule_variations(REMAP_RULES), get_rule_variations(iter(REMAP_RULES)))
+        self.assertNotIn(-1, get_rule_variations(REMAP_RULES)[REMAP_RULES[0]])
+        self.assertIn(REMAP_RULES[1], get_rule_variations(REMAP_RULES))
+
+    def test_rule_variations__is_read_only(self):
+        self.assertEqual(get_rule_variations(REMAP_RULES), RULE_VARIATIONS)
+        with self.assertRaises(TypeError):
+            RULE_VARIATIONS[REMAP_RULES[0]] = frozenset()  # type: ignore
+        self.assertFalse(hasattr(RULE_VARIATIONS[REMAP_RULES[0]], 'add'))
+
+    def test_lookup_tables__match_rule_variations(self):
+        self.assertEqual(NUMBER_COMBINATIONS, len(BASE_RULE_FOR_RULE))
+        self.assertEqual(NUMBER_COMBINATIONS, len(SLOT_FOR_RULE))
+        for slot, (base_rule, rule_vars) in enumerate(get_rule_variations(REMAP_RULES).items()):
+            if base_rule is None:
+                self.assertEqual(0, len(rule_vars))
+                continue
+            self.assertEqual(slot, SLOT_FOR_BASE_RULE[base_rule])
+            for rule in rule_vars:
+                self.assertEqual(base_rule, BASE_RULE_FOR_RULE[rule])
+                self.assertEqual(slot, SLOT_FOR_RULE[rule])
+
     def test_get_rule_variations__dma_fixture_matches(self):
         with open(self.__fixture_path(), 'rb') as f:
             dma = FileType.DMA.deserialize(f.read())
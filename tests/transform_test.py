@@ -0,0 +1,193 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import unittest
+from io import BytesIO
+from xml.etree.ElementTree import Element, SubElement
+
+from PIL import Image
+
+from random_models import random_models
+from skytemple_dtef.dungeon_xml import DUNGEON_TILESET, ANIMATION, ANIMATION__PALETTE, ANIMATION__DURATION, FRAME, \
+    COLOR
+from skytemple_dtef.explorers_dtef import TILESHEET_WIDTH, TILESHEET_HEIGHT, TW, ExplorersDtef
+from skytemple_dtef.package import MappingPackageWriter
+from skytemple_dtef.transform import iter_extended_animation_frames, apply_extended_animations, \
+    build_palette_lut, PALETTE_LUT_LAYER, PALETTE_LUT_LAYER__ROW, PALETTE_LUT_LAYER__FRAMES, \
+    PALETTE_LUT_LAYER__DURATION, PALETTE_LUT_COLOR__INDEX, PALETTE_LUT_FN, _get_pixels_with_indices, apply_alpha_transparency, \
+    write_palette_lut
+
+
+class TransformTestCase(unittest.TestCase):
+    """
+    Tests the generation of the animation frames.
+    """
+    def test_iter_extended_animation_frames__crop(self):
+        xml = self._xml([('ff0000', '00ff00', '0000ff')], 4)
+        var0, var1, var2, rest = self._sheets()
+        # Animated pixels in two tiles of the first sheet only.
+        var0.paste(161, (TW + 3, TW * 2 + 5, TW + 4, TW * 2 + 6))
+        var0.paste(162, (TW * 3, TW * 4, TW * 3 + 1, TW * 4 + 1))
+
+        full = list(iter_extended_animation_frames(xml, var0, var1, var2, rest))
+        cropped = list(iter_extended_animation_frames(xml, var0, var1, var2, rest, crop=True))
+        self.assertEqual([f.fn for f in full], [f.fn for f in cropped])
+        self.assertEqual(4 + 3, len(cropped))
+        for full_frame, cropped_frame in zip(full, cropped):
+            if cropped_frame.group is None:
+                self.assertEqual(full_frame.image.tobytes(), cropped_frame.image.tobytes())
+                continue
+            self.assertEqual((TW, TW * 2), (cropped_frame.x, cropped_frame.y))
+            self.assertEqual((TW * 3, TW * 3), cropped_frame.image.size)
+            # Only compare the visible pixels.
+            background = Image.new('RGBA', full_frame.image.size, (0, 0, 0, 255))
+            restored = background.copy()
+            restored.alpha_composite(cropped_frame.image, (cropped_frame.x, cropped_frame.y))
+            expected = Image.alpha_composite(background, full_frame.image)
+            self.assertEqual(expected.tobytes(), restored.tobytes())
+
+    def test_iter_extended_animation_frames__parallel(self):
+        xml = self._xml([('ff0000', '00ff00', '0000ff', '00ffff'), ('102030', '405060', '708090', 'ffffff')], 2)
+        var0, var1, var2, rest = self._sheets()
+        for i, img in enumerate((var0, var1, var2, rest)):
+            img.paste(160 + i, (TW * i, 0, TW * (i + 1), TW))
+
+        sequential = list(iter_extended_animation_frames(xml, var0, var1, var2, rest))
+        parallel = list(iter_extended_animation_frames(xml, var0, var1, var2, rest, max_workers=3))
+        self.assertEqual([f.fn for f in sequential], [f.fn for f in parallel])
+        for frame, parallel_frame in zip(sequential, parallel):
+            self.assertEqual(frame.image.tobytes(), parallel_frame.image.tobytes())
+
+    def test_apply_extended_animations__frame_budget(self):
+        frames = ('ff0000', 'ff0000', '0000ff', 'ff0000', 'ff0000', '0000ff')
+        xml = self._xml([frames], 5)
+        var0, var1, var2, rest = self._sheets()
+        var0.paste(160, (0, 0, TW, TW))
+
+        def frame_names(**kwargs):
+            frames = apply_extended_animations(xml, var0, var1, var2, rest, **kwargs)
+            return [fn for fn, _ in frames if '_frame' in fn]
+
+        self.assertEqual([f'tileset_0_frame0_{i}.5.png' for i in range(6)], frame_names())
+        # The sequence repeats after the third frame and the first two frames are equal.
+        self.assertEqual(['tileset_0_frame0_0.10.png', 'tileset_0_frame0_1.5.png'], frame_names(tolerance=0))
+        self.assertEqual(
+            ['tileset_0_frame0_0.8.png', 'tileset_0_frame0_1.4.png'], frame_names(tolerance=0, reduce_durations=True)
+        )
+        self.assertEqual(['tileset_0_frame0_0.15.png'], frame_names(max_frames=1))
+
+    def test_build_palette_lut(self):
+        xml = self._xml([('ff0000', '00ff00', '0000ff'), ('102030', '405060', '708090')], 4)
+        var0, var1, var2, rest = self._sheets()
+        var0.paste(161, (0, 0, TW, TW))
+        palette = var0.getpalette()
+        assert palette is not None
+
+        lut, table = build_palette_lut(xml, palette)
+        self.assertEqual((256, 4), lut.size)
+        layers = list(table.iter(PALETTE_LUT_LAYER))
+        self.assertEqual(1, len(layers))
+        self.assertEqual(('1', '3', '4'), (
+            layers[0].attrib[PALETTE_LUT_LAYER__ROW], layers[0].attrib[PALETTE_LUT_LAYER__FRAMES],
+            layers[0].attrib[PALETTE_LUT_LAYER__DURATION]
+        ))
+        self.assertEqual([str(i) for i in range(160, 176)], [c.attrib[PALETTE_LUT_COLOR__INDEX] for c in layers[0]])
+        # Row 0: First frame and transparency, otherwise the palette.
+        self.assertEqual((0xff, 0, 0, 0), lut.getpixel((160, 0)))
+        self.assertEqual((0x10, 0x20, 0x30, 255), lut.getpixel((161, 0)))
+        self.assertEqual((15, 16, 17, 255), lut.getpixel((5, 0)))
+        # The frames have the same colors as the ones generated by apply_extended_animations.
+        frames = [img for fn, img in apply_extended_animations(xml, var0, var1, var2, rest) if '_frame' in fn]
+        self.assertEqual(3, len(frames))
+        for fi, frame in enumerate(frames):
+            self.assertEqual(frame.getpixel((0, 0)), lut.getpixel((161, 1 + fi)))
+
+    def test_write_palette_lut__exported_tilesheets(self):
+        dma, dpc, dpci, dpl, dpla = random_models(0)
+        # Palette 10 is animated with 4 frames.
+        dpla.colors = [
+            [c for fi in range(4) for c in (16 * ci, 32 * fi, 255 - ci)] for ci in range(16)
+        ] + [[] for _ in range(16)]
+        dpla.durations_per_frame_for_colors = [3] * 16 + [0] * 16
+        dtef = ExplorersDtef(dma, dpc, dpci, dpl, dpla)
+        palette = dtef.var0.getpalette()
+        assert palette is not None
+        # The tilesheets only contain the colors of the 12 palettes of the DPL.
+        self.assertEqual(12 * 16 * 3, len(palette))
+
+        writer = MappingPackageWriter()
+        write_palette_lut(writer, dtef.get_xml(), dtef.var0, dtef.var1, dtef.var2, dtef.rest)
+        lut = Image.open(BytesIO(writer.files[PALETTE_LUT_FN]))
+        self.assertEqual((256, 5), lut.size)
+        self.assertEqual((*palette[5 * 3:6 * 3], 255), lut.getpixel((5, 0)))
+        self.assertEqual((0, 0, 0, 255), lut.getpixel((200, 0)))
+        for fi in range(4):
+            self.assertEqual((16, 32 * fi, 254, 255), lut.getpixel((161, 1 + fi)))
+
+    def test_get_pixels_with_indices(self):
+        img = self._all_indices()
+        for indices in ([0], [255], [15, 16], [0, 15, 16, 31, 240, 255], [], list(range(256))):
+            with self.subTest(indices=indices):
+                # The pixel loop this replaced.
+                pixels = img.load()
+                expected = [
+                    255 if pixels[i, j] in indices else 0 for j in range(img.size[1]) for i in range(img.size[0])
+                ]
+                mask = _get_pixels_with_indices(img, indices)
+                self.assertEqual('L', mask.mode)
+                self.assertEqual(bytes(expected), mask.tobytes())
+
+    def test_apply_alpha_transparency(self):
+        img = self._all_indices()
+        # The pixel loop this replaced.
+        mask = Image.new('L', img.size, color=255)
+        mask.putdata([0 if x % 16 == 0 else 255 for x in img.tobytes()])
+        expected = img.convert('RGBA')
+        expected.putalpha(mask)
+
+        result = apply_alpha_transparency(img)
+        self.assertEqual('RGBA', result.mode)
+        self.assertEqual(expected.tobytes(), result.tobytes())
+        self.assertEqual([0, 255, 255, 0, 255], [
+            result.getpixel((x, y))[3] for x, y in ((0, 0), (15, 0), (1, 1), (0, 15), (15, 15))
+        ])
+
+    def _all_indices(self) -> Image.Image:
+        """A 'P' image with every palette index, followed by a row of the indices at the palette borders."""
+        edges = [0, 1, 15, 16, 17, 31, 32, 127, 128, 239, 240, 241, 254, 255, 0, 255]
+        img = Image.new('P', (16, 17))
+        img.putpalette(bytes(range(256)) * 3)
+        img.putdata(list(range(256)) + edges)
+        return img
+
+    def _xml(self, color_frames, duration):
+        """Creates an XML with an animation of palette 10, one color for each entry of color_frames."""
+        xml = Element(DUNGEON_TILESET)
+        animation = SubElement(xml, ANIMATION, {ANIMATION__PALETTE: '10'})
+        for fi in range(len(color_frames[0])):
+            frame = SubElement(animation, FRAME)
+            for ci in range(16):
+                color_hex = color_frames[ci][fi] if ci < len(color_frames) else '000000'
+                SubElement(frame, COLOR, {ANIMATION__DURATION: str(duration)}).text = color_hex
+        return xml
+
+    def _sheets(self):
+        sheets = []
+        for _ in range(4):
+            img = Image.new('P', (TILESHEET_WIDTH * 3 * TW, TILESHEET_HEIGHT * TW), color=1)
+            img.putpalette(bytes(range(256)) * 3)
+            sheets.append(img)
+        return sheets
@@ -0,0 +1,91 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import unittest
+from unittest import mock
+from xml.etree.ElementTree import Element, SubElement, tostring
+
+from PIL import Image, ImageFile
+
+from skytemple_dtef.dungeon_xml import DUNGEON_TILESET, DIMENSIONS, ANIMATION, ANIMATION__PALETTE, \
+    ANIMATION__DURATION, FRAME, COLOR, ADDITIONAL_TILES, TILE, TILE__FILE, TILE__X, TILE__Y, MAPPING, MAPPING__TYPE, \
+    MAPPING__nw, MAPPING__n, MAPPING__ne, MAPPING__e, MAPPING__se, MAPPING__s, MAPPING__sw, MAPPING__w, \
+    MAPPING__VARIATION, SPECIAL_MAPPING, SPECIAL_MAPPING__IDENTIFIER
+from skytemple_dtef.explorers_dtef import TILESHEET_WIDTH, TILESHEET_HEIGHT, TW, VAR0_FN, VAR1_FN, VAR2_FN, MORE_FN
+from skytemple_dtef.package import MappingPackageWriter, MappingPackageReader, XML_FN
+from skytemple_dtef.validate import validate_package
+
+
+class ValidatePackageTestCase(unittest.TestCase):
+    """
+    Tests that validate_package finds all problems of a package, without decoding the images.
+    """
+    def test_valid(self):
+        with mock.patch.object(ImageFile.ImageFile, 'load', side_effect=AssertionError):
+            self.assertEqual([], validate_package(MappingPackageReader(self._package())))
+
+    def test_all_problems_reported(self):
+        files = self._package(
+            var1_palette=[1] * 768, var2_size=(TW * 10, TW * 8), tile_x='99', mapping_type='lava', variation='3',
+            special_index='16', color='12345z'
+        )
+        del files[MORE_FN]
+        problems = validate_package(MappingPackageReader(files))
+        self.assertEqual(7, len(problems), problems)
+        self.assertTrue(any(VAR1_FN in problem for problem in problems))
+        self.assertTrue(any(VAR2_FN in problem for problem in problems))
+        self.assertTrue(any(MORE_FN in problem for problem in problems))
+        self.assertTrue(any('lava' in problem for problem in problems))
+        self.assertTrue(any('12345z' in problem for problem in problems))
+
+    def test_invalid_files(self):
+        files = self._package()
+        files[VAR0_FN] = b'not a png'
+        files[XML_FN] = files[XML_FN][:-20]
+        problems = validate_package(MappingPackageReader(files))
+        self.assertEqual(2, len(problems), problems)
+
+    @staticmethod
+    def _package(
+            var1_palette: list[int] | None = None, var2_size: tuple[int, int] | None = None,
+            tile_x: str = '1', mapping_type: str = 'wall', variation: str = '2', special_index: str = '15',
+            color: str = '12345a'
+    ) -> dict[str, bytes]:
+        palette = list(range(256)) * 3
+        writer = MappingPackageWriter()
+        for fn, size in (
+                (VAR0_FN, None), (VAR1_FN, None), (VAR2_FN, var2_size), (MORE_FN, (TW * 2, TW))
+        ):
+            img = Image.new('P', size or (TILESHEET_WIDTH * 3 * TW, TILESHEET_HEIGHT * TW))
+            img.putpalette(var1_palette if fn == VAR1_FN and var1_palette is not None else palette)
+            writer.write_image(fn, img)
+        xml = Element(DUNGEON_TILESET, {DIMENSIONS: str(TW)})
+        animation = SubElement(xml, ANIMATION, {ANIMATION__PALETTE: '10', ANIMATION__DURATION: '6'})
+        for _ in range(2):
+            frame = SubElement(animation, FRAME)
+            for _ in range(16):
+                SubElement(frame, COLOR).text = color
+        SubElement(xml, ANIMATION, {ANIMATION__PALETTE: '11'})
+        additional_tiles = SubElement(xml, ADDITIONAL_TILES)
+        tile = SubElement(additional_tiles, TILE, {TILE__FILE: MORE_FN, TILE__X: tile_x, TILE__Y: '0'})
+        SubElement(tile, MAPPING, {
+            MAPPING__TYPE: mapping_type, MAPPING__VARIATION: variation,
+            MAPPING__nw: '0', MAPPING__n: '1', MAPPING__ne: '0', MAPPING__e: '1',
+            MAPPING__se: '0', MAPPING__s: '1', MAPPING__sw: '0', MAPPING__w: '1'
+        })
+        SubElement(tile, SPECIAL_MAPPING, {SPECIAL_MAPPING__IDENTIFIER: f'EOS_EXTRA_FLOOR1_{special_index}'})
+        writer.write(XML_FN, tostring(xml))
+        return writer.files
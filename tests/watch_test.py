@@ -0,0 +1,64 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from skytemple_dtef.explorers_dtef_importer import ExplorersDtefImporter
+from skytemple_dtef.watch import PackageWatcher, WatchEvent
+
+
+class PackageWatcherTestCase(unittest.TestCase):
+    """
+    Tests that the PackageWatcher imports once after a burst of changes, with inotify (if available) and polling.
+    """
+    def test_watch__inotify(self):
+        self._test_watch(True)
+
+    def test_watch__polling(self):
+        self._test_watch(False)
+
+    def _test_watch(self, use_inotify: bool):
+        with tempfile.TemporaryDirectory() as dirname:
+            importer = mock.Mock(spec=ExplorersDtefImporter)
+            events: list[WatchEvent] = []
+            imported = threading.Event()
+
+            def callback(event: WatchEvent):
+                events.append(event)
+                imported.set()
+
+            watcher = PackageWatcher(dirname, importer, callback, debounce=0.3, poll_interval=0.05,
+                                     use_inotify=use_inotify)
+            if use_inotify and watcher.backend_name != 'inotify':
+                self.skipTest("inotify is not available.")
+            watcher.start(initial_import=False)
+            try:
+                for i in range(3):
+                    with open(os.path.join(dirname, 'tileset_0.png'), 'wb') as f:
+                        f.write(bytes(i + 1))
+                with open(os.path.join(dirname, 'ignored.tmp'), 'wb') as f:
+                    f.write(b'x')
+                self.assertTrue(imported.wait(5))
+            finally:
+                watcher.stop()
+            self.assertEqual(1, len(events))
+            self.assertEqual({'tileset_0.png'}, events[0].changed)
+            self.assertIsNone(events[0].error)
+            importer.do_import_package.assert_called_once()
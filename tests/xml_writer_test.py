@@ -0,0 +1,152 @@
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import random
+import unittest
+from unittest import mock
+from io import BytesIO
+from xml.etree.ElementTree import Element, SubElement, Comment
+
+from skytemple_dtef.dungeon_xml import DungeonXml, RestTileMapping, RestTileMappingEntry, RestTileMappingTable, \
+    iterparse_dungeon_xml, ADDITIONAL_TILES, ANIMATION, TILE
+from skytemple_dtef.xml_writer import PrettyXmlWriter, write_pretty_xml
+from skytemple_files.common.types.file_types import FileType
+from skytemple_files.common.xml_util import prettify
+
+
+class XmlWriterTestCase(unittest.TestCase):
+    """
+    Tests that the streamed XML is the same as the output of prettify, and reading it incrementally.
+    """
+    def test_write_pretty_xml(self):
+        xml = Element('Root', {'a': '1 & "2" <3>', 'b': 'x'})
+        xml.append(Comment(' A comment\n   over two lines '))
+        SubElement(xml, 'Text').text = 'a < b'
+        mixed = SubElement(xml, 'Mixed')
+        mixed.text = 'before'
+        SubElement(mixed, 'Child', {'c': '2'}).tail = 'after'
+        SubElement(xml, 'EmptyText').text = ''
+        SubElement(SubElement(xml, 'Outer'), 'Inner')
+        self.assertEqual(prettify(xml), self._write(lambda f: write_pretty_xml(f, xml)))
+
+    def test_streamed_elements(self):
+        def write(f):
+            with PrettyXmlWriter(f) as writer:
+                writer.start('Root')
+                writer.start('Empty', {'a': '1'})
+                writer.end()
+                writer.start('List')
+                writer.element(Element('Item'))
+        self.assertEqual(prettify(self._xml_with_empty_list()), self._write(write))
+
+    def test_dungeon_xml(self):
+        dpla = self._dpla()
+        rest = self._rest_mappings(200)
+        streamed = self._write(lambda f: DungeonXml.write(f, dpla, 24, rest))
+        self.assertEqual(prettify(DungeonXml.generate(dpla, 24, rest)), streamed)
+        empty = self._write(lambda f: DungeonXml.write(f, dpla, 24, []))
+        self.assertEqual(prettify(DungeonXml.generate(dpla, 24, [])), empty)
+
+        tiles = []
+        for parent_tag, elem in iterparse_dungeon_xml(BytesIO(streamed.encode('utf-8'))):
+            if parent_tag == ADDITIONAL_TILES:
+                self.assertEqual(TILE, elem.tag)
+                tiles.append((elem.attrib['x'], len(elem)))
+            elif elem.tag == ANIMATION:
+                # Only palette 10 is animated.
+                self.assertEqual(2 if elem.attrib['palette'] == '10' else 0, len(elem))
+            elif parent_tag is not None:
+                # The tiles were freed after they were processed.
+                self.assertEqual(0, len(elem))
+        self.assertEqual([(str(r.x), len(r.mappings)) for r in rest], tiles)
+
+    def test_rest_tile_mapping_table(self):
+        rest = self._rest_mappings(50)
+        table = RestTileMappingTable()
+        for r in rest:
+            table.add_tile(r.file_name, r.x, r.y)
+        # The mappings are added to the tiles in any order, but each tile keeps the order of its mappings.
+        rand = random.Random(3)
+        pending = [list(r.mappings) for r in rest]
+        while any(pending):
+            tile = rand.choice([i for i, mappings in enumerate(pending) if mappings])
+            entry = pending[tile].pop(0)
+            table.add_mapping(tile, entry.dmatype_name, entry.dmatype_idx, entry.neighbors, entry.variation_or_index)
+        self.assertEqual(len(rest), len(table))
+        dpla = self._dpla()
+        self.assertEqual(
+            self._write(lambda f: DungeonXml.write(f, dpla, 24, rest)),
+            self._write(lambda f: DungeonXml.write(f, dpla, 24, table))
+        )
+        # The entries are only created for the tiles that were iterated over.
+        with mock.patch('skytemple_dtef.dungeon_xml.RestTileMappingEntry', wraps=RestTileMappingEntry) as entry_cls:
+            first = next(iter(table))
+        self.assertEqual(len(rest[0].mappings), entry_cls.call_count)
+        self.assertEqual(len(rest[0].mappings), len(first.mappings))
+
+    def test_rest_tile_mapping_table__list_compatible(self):
+        rest = self._rest_mappings(20)
+        table = RestTileMappingTable()
+        table.append(rest[0])
+        table.extend(rest[1:])
+
+        def as_tuple(r: RestTileMapping):
+            return r.x, r.y, r.file_name, [
+                (m.dmatype_name, m.dmatype_idx, m.neighbors, m.variation_or_index) for m in r.mappings
+            ]
+
+        self.assertEqual(len(rest), len(table))
+        self.assertEqual([as_tuple(r) for r in rest], [as_tuple(table[i]) for i in range(len(table))])
+        self.assertEqual(as_tuple(rest[-1]), as_tuple(table[-1]))
+        for index in (slice(2, 5), slice(None, None, -3), slice(15, 50), slice(5, 2)):
+            with self.subTest(index=index):
+                self.assertEqual([as_tuple(r) for r in rest[index]], [as_tuple(r) for r in table[index]])
+        for position in (len(rest), -len(rest) - 1):
+            with self.assertRaises(IndexError):
+                table[position]
+        self.assertEqual([as_tuple(r) for r in rest], [as_tuple(r) for r in table])
+
+    @staticmethod
+    def _xml_with_empty_list():
+        xml = Element('Root')
+        SubElement(xml, 'Empty', {'a': '1'})
+        SubElement(SubElement(xml, 'List'), 'Item')
+        return xml
+
+    @staticmethod
+    def _write(func) -> str:
+        f = BytesIO()
+        func(f)
+        return f.getvalue().decode('utf-8')
+
+    @staticmethod
+    def _dpla():
+        dpla = FileType.DPLA.get_model_cls()(b"", 0)
+        rand = random.Random(1)
+        dpla.colors = [[rand.randrange(256) for _ in range(2 * 3)] for _ in range(16)] + [[] for _ in range(16)]
+        dpla.durations_per_frame_for_colors = [rand.randrange(1, 10) for _ in range(16)] + [0] * 16
+        return dpla
+
+    @staticmethod
+    def _rest_mappings(count: int) -> list[RestTileMapping]:
+        rand = random.Random(2)
+        return [
+            RestTileMapping(i % 18, i // 18, [
+                RestTileMappingEntry('normal', rand.randrange(3), rand.randrange(256), rand.randrange(3))
+                for _ in range(rand.randrange(1, 4))
+            ] + [RestTileMappingEntry('extra', rand.randrange(3), 0, rand.randrange(16))], 'tileset_more.png')
+            for i in range(count)
+        ]
@@ -0,0 +1,59 @@
+"""
+Compares transform.apply_alpha_transparency to the previous implementation, which built the alpha mask
+in Python, on a full tilesheet (18x8 tiles).
+"""
+#  Copyright 2020-2023 Capypara and the SkyTemple Contributors
+#
+#  This file is part of SkyTemple.
+#
+#  SkyTemple is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  SkyTemple is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with SkyTemple.  If not, see <https://www.gnu.org/licenses/>.
+import random
+import timeit
+
+from PIL import Image
+
+from skytemple_dtef.explorers_dtef import TILESHEET_WIDTH, TILESHEET_HEIGHT, TW
+from skytemple_dtef.transform import apply_alpha_transparency
+
+NUMBER = 20
+
+
+def apply_alpha_transparency_python(img: Image.Image) -> Image.Image:
+    mask = Image.new('L', img.size, color=255)
+    mask.putdata([0 if x % 16 == 0 else 255 for x in img.getdata()])
+    img = img.convert('RGBA')
+    img.putalpha(mask)
+    return img
+
+
+def main():
+    width = TILESHEET_WIDTH * 3 * TW
+    height = TILESHEET_HEIGHT * TW
+    rand = random.Random(0)
+    img = Image.new('P', (width, height))
+    img.putdata([rand.randrange(256) for _ in range(width * height)])
+    img.putpalette(rand.randbytes(768))
+
+    assert apply_alpha_transparency(img).tobytes() == apply_alpha_transparency_python(img).tobytes()
+
+    print(f"Tilesheet: {width}x{height}, {NUMBER} runs")
+    t_python = timeit.timeit(lambda: apply_alpha_transparency_python(img), number=NUMBER) / NUMBER
+    t_lut = timeit.timeit(lambda: apply_alpha_transparency(img), number=NUMBER) / NUMBER
+    print(f"Python mask: {t_python * 1000:.2f} ms")
+    print(f"LUT mask:    {t_lut * 1000:.2f} ms")
+    print(f"Speedup:     {t_python / t_lut:.1f}x")
+
+
+if __name__ == '__main__':
+    main()